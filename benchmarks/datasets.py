@@ -0,0 +1,73 @@
+"""Synthetic datasets for the benchmarks, generated deterministically from a seed."""
+import os
+import numpy as np
+import pandas as pd
+
+# Directory generated CSV files are cached in
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".data")
+
+SIZES = {"1k": 1_000, "10k": 10_000, "100k": 100_000, "1m": 1_000_000, "10m": 10_000_000}
+
+REGIONS = np.array(["North", "South", "East", "West", "Central", "Coastal", "Mountain", "Islands"])
+
+
+def make_dataset(rows, shape="narrow", seed=0):
+    """
+    Generates a synthetic dataset.
+
+    Args:
+        rows (int): Number of rows
+        shape (str): "narrow" for a 10-column sales table with dates, categories,
+            measures, missing values and coordinates, or "wide" for a country-by-year
+            indicator table with one column per year (1960-2023)
+        seed (int): Random seed
+
+    Returns:
+        pandas.DataFrame: The dataset
+    """
+    rng = np.random.default_rng(seed)
+    if shape == "narrow":
+        units = rng.poisson(12, rows)
+        price = rng.lognormal(3, 0.5, rows).round(2)
+        discount = rng.uniform(0, 0.3, rows).round(3)
+        discount[rng.random(rows) < 0.05] = np.nan
+        return pd.DataFrame({
+            "order_id": np.arange(rows),
+            "order_date": pd.Timestamp("2020-01-01") + pd.to_timedelta(np.sort(rng.integers(0, 4 * 365, rows)), unit="D"),
+            "region": REGIONS[rng.integers(0, len(REGIONS), rows)],
+            "product": np.char.add("P-", rng.integers(0, 50, rows).astype(str)),
+            "units": units,
+            "price": price,
+            "discount": discount,
+            "revenue": (units * price * (1 - np.nan_to_num(discount))).round(2),
+            "latitude": rng.uniform(-60, 70, rows).round(5),
+            "longitude": rng.uniform(-170, 170, rows).round(5),
+        })
+    if shape == "wide":
+        years = {str(year): rng.normal(100, 15, rows).round(2) for year in range(1960, 2024)}
+        return pd.DataFrame({
+            "country": np.char.add("Country ", (np.arange(rows) % 250).astype(str)),
+            "indicator": np.char.add("Indicator ", (np.arange(rows) // 250 % 40).astype(str)),
+            **years,
+        })
+    raise ValueError(f"Unknown dataset shape: {shape}")
+
+
+def dataset_csv(rows, shape="narrow", seed=0):
+    """
+    Returns the path of a cached CSV file of a synthetic dataset, generating it if needed.
+
+    Args:
+        rows (int): Number of rows
+        shape (str): "narrow" or "wide"
+        seed (int): Random seed
+
+    Returns:
+        str: Path of the CSV file
+    """
+    os.makedirs(DATA_DIR, exist_ok=True)
+    path = os.path.join(DATA_DIR, f"{shape}-{rows}-{seed}.csv")
+    if not os.path.exists(path):
+        make_dataset(rows, shape, seed).to_csv(path + ".tmp", index=False)
+        os.replace(path + ".tmp", path)
+    return path
@@ -0,0 +1,128 @@
+"""
+Measures cold-start import time and first-render latency of every page.
+
+Each measurement runs in a fresh interpreter so module caches do not hide import
+costs. Pass --compare to measure another git revision the same way and print the
+before/after table, for example:
+
+    python benchmarks/import_time.py --compare HEAD~1 --output import_time.json
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+PAGES = ["main.py", "pages/upload_data.py", "pages/report.py", "pages/Q&A.py"]
+
+# Heavy third-party modules whose presence after a page render shows eager imports
+HEAVY_MODULES = ["matplotlib.pyplot", "seaborn", "reportlab.platypus", "markdown", "google.generativeai"]
+
+PROBE = r"""
+import json, sys, time
+start = time.perf_counter()
+import streamlit
+from streamlit.testing.v1 import AppTest
+streamlit_import = time.perf_counter() - start
+page = sys.argv[1]
+at = AppTest.from_file("main.py", default_timeout=120)
+t = time.perf_counter()
+at.run()
+main_render = time.perf_counter() - t
+page_render = 0.0
+if page != "main.py":
+    t = time.perf_counter()
+    at.switch_page(page).run()
+    page_render = time.perf_counter() - t
+print(json.dumps({
+    "streamlit_import": streamlit_import,
+    "main_render": main_render,
+    "page_render": page_render,
+    "total": time.perf_counter() - start,
+    "errors": [str(e.message) for e in at.exception],
+    "heavy_modules": [m for m in json.loads(sys.argv[2]) if m in sys.modules],
+}))
+"""
+
+
+def measure(root, repeat):
+    """
+    Renders every page in fresh interpreters under root.
+
+    Args:
+        root (str): Directory of the app checkout to measure
+        repeat (int): Number of cold runs per page; the median is reported
+
+    Returns:
+        dict: Per-page timings in seconds and the heavy modules each page imported
+    """
+    results = {}
+    for page in PAGES:
+        runs = []
+        for _ in range(repeat):
+            output = subprocess.run(
+                [sys.executable, "-c", PROBE, page, json.dumps(HEAVY_MODULES)],
+                cwd=root, capture_output=True, text=True, check=True,
+            )
+            runs.append(json.loads(output.stdout.strip().splitlines()[-1]))
+        results[page] = {
+            key: statistics.median(run[key] for run in runs)
+            for key in ("streamlit_import", "main_render", "page_render", "total")
+        }
+        results[page]["errors"] = runs[-1]["errors"]
+        results[page]["heavy_modules"] = runs[-1]["heavy_modules"]
+    return results
+
+
+def measure_revision(revision, repeat):
+    """
+    Measures a git revision in a temporary worktree.
+
+    Args:
+        revision (str): Any git revision, such as HEAD~1 or a commit hash
+        repeat (int): Number of cold runs per page
+
+    Returns:
+        dict: Same structure as measure
+    """
+    worktree = tempfile.mkdtemp(prefix="dattavism-bench-")
+    subprocess.run(["git", "worktree", "add", "--detach", worktree, revision], check=True, capture_output=True)
+    try:
+        if os.path.isdir(".streamlit"):
+            shutil.copytree(".streamlit", os.path.join(worktree, ".streamlit"), dirs_exist_ok=True)
+        return measure(worktree, repeat)
+    finally:
+        subprocess.run(["git", "worktree", "remove", "--force", worktree], check=False, capture_output=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3, help="cold runs per page (median is reported)")
+    parser.add_argument("--compare", metavar="REV", help="git revision to compare the working tree against")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(root)
+    results = {"current": measure(root, args.repeat)}
+    if args.compare:
+        results[args.compare] = measure_revision(args.compare, args.repeat)
+
+    print(f"{'page':<22}{'status':>8}{'first render (s)':>18}{'cold total (s)':>16}  heavy modules loaded")
+    for label, pages in results.items():
+        print(f"--- {label}")
+        for page, timing in pages.items():
+            render = timing["page_render"] or timing["main_render"]
+            status = "error" if timing["errors"] else "ok"
+            print(f"{page:<22}{status:>8}{render:>18.3f}{timing['total']:>16.3f}  {', '.join(timing['heavy_modules']) or '-'}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+Multi-session load test for the Streamlit app.
+
+Simulates users who open the home page, upload a dataset, view the report, create a
+custom chart, export the PDF and ask questions, with every model call going to the
+fake backend. Each worker process plays one server: its sessions share the
+process-wide caches and take turns rerunning, one action at a time, the way a single
+Streamlit server interleaves reruns of concurrent sessions. Run from the repository root:
+
+    python -m benchmarks.load_test --users 20 --workers 2 --rows 10000
+
+AppTest swaps a process-global runtime on every run, so sessions inside a worker are
+interleaved rather than run on parallel threads. Use --workers to load several cores.
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+QUESTIONS = [
+    "Which region has the highest revenue?",
+    "Are there any outliers I should look at?",
+    "Which region has the highest revenue?",
+]
+
+
+def _button(at, label):
+    return next(b for b in at.button if b.label == label)
+
+
+def _upload(at, user, args):
+    # AppTest cannot drive st.file_uploader, so the upload is simulated by setting the
+    # session state the upload page writes after reading the file
+    import pandas as pd
+    from benchmarks.datasets import dataset_csv
+    from utils.fingerprint import dataset_hash
+    seed = user if args.distinct_datasets else 0
+    df = pd.read_csv(dataset_csv(args.rows, args.shape, seed))
+    at.session_state["df"] = df
+    at.session_state["dataset_hash"] = dataset_hash(df)
+    at.session_state["filename"] = f"{args.shape}-{args.rows}-{seed}"
+    at.switch_page("pages/upload_data.py").run()
+
+
+def _scenario(args):
+    steps = [
+        ("home", lambda at, user: at.run()),
+        ("upload", lambda at, user: _upload(at, user, args)),
+        ("report", lambda at, user: at.switch_page("pages/report.py").run()),
+        ("custom_chart", lambda at, user: _button(at, "Generate Custom Chart").click().run()),
+    ]
+    if args.export:
+        steps.append(("export", lambda at, user: _button(at, "Generate Complete Report").click().run()))
+    steps.append(("qa", lambda at, user: at.switch_page("pages/Q&A.py").run()))
+    for question in QUESTIONS[:args.questions]:
+        steps.append(("chat", lambda at, user, q=question: at.chat_input[0].set_value(q).run()))
+    return steps
+
+
+def run_worker(users, args):
+    """
+    Plays a group of sessions against one in-process app instance.
+
+    Args:
+        users (list): User numbers simulated by this worker
+        args (argparse.Namespace): Load test options
+
+    Returns:
+        dict: Per-action records, the memory baseline and peak, and the worker's wall time
+    """
+    from streamlit.testing.v1 import AppTest
+    from utils import llm, metering
+    from utils.tracing import current_rss
+
+    # Exported PDFs and usage go to a scratch directory instead of the tracked report/ and data/ folders
+    scratch_dir = os.environ["DATTAVISM_REPORT_DIR"] = tempfile.mkdtemp(prefix="dattavism_load_test_")
+    llm.set_backend("fake", latency=args.llm_latency)
+    # Fake calls are metered like real ones, but no budget or quota limits them
+    unlimited = float("inf")
+    metering.set_meter(metering.UsageMeter(
+        os.path.join(scratch_dir, "metering", "usage.sqlite"),
+        user_budget=unlimited,
+        global_budget=unlimited,
+        tokens_per_minute=unlimited,
+    ))
+    # Import what the pages load before taking the baseline, so library code is not
+    # counted as session memory
+    import matplotlib.pyplot  # noqa: F401
+    import utils.gemini_ai, utils.charts, utils.pdf_generator  # noqa: E401,F401
+    baseline_rss = current_rss()
+    peak_rss = baseline_rss
+    sessions = {user: AppTest.from_file("main.py", default_timeout=args.timeout) for user in users}
+    records = []
+    start = time.perf_counter()
+    for step, action in _scenario(args):
+        for user, at in sessions.items():
+            action_start = time.perf_counter()
+            error = None
+            try:
+                action(at, user)
+                if at.exception:
+                    error = str(at.exception[0].message)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            records.append({
+                "user": user,
+                "step": step,
+                "seconds": time.perf_counter() - action_start,
+                "error": error,
+            })
+            peak_rss = max(peak_rss, current_rss() or 0)
+    shutil.rmtree(scratch_dir, ignore_errors=True)
+    return {
+        "records": records,
+        "sessions": len(sessions),
+        "baseline_rss": baseline_rss,
+        "peak_rss": peak_rss,
+        "wall_seconds": time.perf_counter() - start,
+    }
+
+
+def summarize(results, wall_seconds):
+    """
+    Aggregates worker results into latency percentiles, memory and throughput.
+
+    Args:
+        results (list): Return values of run_worker
+        wall_seconds (float): Wall time of the whole test
+
+    Returns:
+        dict: Overall and per-step latency percentiles, memory per session, throughput and errors
+    """
+    records = [r for result in results for r in result["records"]]
+    sessions = sum(result["sessions"] for result in results)
+
+    def percentiles(values):
+        values = np.asarray(values)
+        return {
+            "count": int(values.size),
+            "p50_s": float(np.percentile(values, 50)),
+            "p99_s": float(np.percentile(values, 99)),
+            "max_s": float(values.max()),
+        }
+
+    steps = {}
+    for record in records:
+        steps.setdefault(record["step"], []).append(record["seconds"])
+    memory = [
+        (result["peak_rss"] - result["baseline_rss"]) / result["sessions"]
+        for result in results if result["baseline_rss"] is not None and result["sessions"]
+    ]
+    return {
+        "sessions": sessions,
+        "reruns": len(records),
+        "wall_seconds": wall_seconds,
+        "throughput_reruns_per_s": len(records) / wall_seconds if wall_seconds else 0.0,
+        "latency": percentiles([r["seconds"] for r in records]),
+        "steps": {step: percentiles(values) for step, values in steps.items()},
+        "peak_rss_bytes": max(result["peak_rss"] or 0 for result in results),
+        "memory_per_session_bytes": max(memory) if memory else None,
+        "errors": [r for r in records if r["error"]][:20],
+        "error_count": sum(1 for r in records if r["error"]),
+    }
+
+
+def print_summary(summary):
+    mb = 1024 * 1024
+    print(f"\n{'step':<14}{'count':>7}{'p50':>10}{'p99':>10}{'max':>10}")
+    for step, stats in list(summary["steps"].items()) + [("all", summary["latency"])]:
+        print(f"{step:<14}{stats['count']:>7}{stats['p50_s']:>9.3f}s{stats['p99_s']:>9.3f}s{stats['max_s']:>9.3f}s")
+    print(f"\nSessions:            {summary['sessions']}")
+    print(f"Throughput:          {summary['throughput_reruns_per_s']:.2f} reruns/s")
+    print(f"Peak RSS:            {summary['peak_rss_bytes'] / mb:.1f} MB")
+    if summary["memory_per_session_bytes"] is not None:
+        print(f"Memory per session:  {summary['memory_per_session_bytes'] / mb:.1f} MB")
+    print(f"Errors:              {summary['error_count']}")
+    for error in summary["errors"][:5]:
+        print(f"  user {error['user']} {error['step']}: {error['error']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-session load test with a fake Gemini backend")
+    parser.add_argument("--users", type=int, default=10, help="number of simulated sessions")
+    parser.add_argument("--workers", type=int, default=1, help="server processes the sessions are spread over")
+    parser.add_argument("--rows", type=int, default=1_000, help="rows in each uploaded dataset")
+    parser.add_argument("--shape", default="narrow", help="dataset shape: narrow or wide")
+    parser.add_argument("--distinct-datasets", action=argparse.BooleanOptionalAction, default=True,
+                        help="give every user a different dataset, so cached results are not shared")
+    parser.add_argument("--questions", type=int, default=len(QUESTIONS), help="chat questions per user")
+    parser.add_argument("--export", action=argparse.BooleanOptionalAction, default=True, help="export the PDF report")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="seconds the fake model waits per call")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds allowed for one rerun")
+    parser.add_argument("--output", help="write the summary as JSON to this file")
+    args = parser.parse_args()
+
+    groups = [list(range(args.users))[i::args.workers] for i in range(args.workers)]
+    groups = [group for group in groups if group]
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=len(groups)) as pool:
+        results = list(pool.map(run_worker, groups, [args] * len(groups)))
+    summary = summarize(results, time.perf_counter() - start)
+    summary["options"] = vars(args)
+    print_summary(summary)
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=2, default=str)
+        print(f"\nSummary written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
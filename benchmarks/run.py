@@ -0,0 +1,211 @@
+"""
+Offline benchmark suite for the analysis pipeline.
+
+Every model call goes to the deterministic fake backend, so results only measure
+local work plus the configured fake latency. Run from the repository root:
+
+    python -m benchmarks.run --sizes 1k,100k --shapes narrow,wide
+    python -m benchmarks.run --baseline benchmarks/results/<earlier run>.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmarks.datasets import SIZES, dataset_csv
+from utils import llm, metering
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def _ingestion(ctx):
+    pd.read_csv(ctx["csv"])
+
+
+def _profiling(ctx):
+    from utils.analytics import compute_statistics
+    from utils.chart_recommender import profile_dataset
+    ctx["df"].describe()
+    compute_statistics(ctx["df"])
+    profile_dataset(ctx["df"])
+
+
+def _prompt_context(ctx):
+    from utils.gemini_ai import context_detection
+    ctx["context"] = context_detection(ctx["df"])
+
+
+def _prompt_report(ctx):
+    from utils.gemini_ai import generate_report
+    ctx["report"] = generate_report(ctx["df"])
+
+
+def _chart_recommendation(ctx):
+    from utils.visualizer import generate_visualizations
+    ctx["charts"] = generate_visualizations(ctx["df"])
+
+
+def _chart_rendering(ctx):
+    from utils.pdf_generator import EnhancedReportGenerator
+    generator = EnhancedReportGenerator()
+    for chart in ctx["charts"]:
+        generator.generate_chart(chart, ctx["df"])
+
+
+def _complete_report(ctx):
+    from utils.pdf_generator import EnhancedReportGenerator
+    with tempfile.TemporaryDirectory() as directory:
+        # Without the PDF cache, so every repetition measures a full build
+        EnhancedReportGenerator(cache_dir=None).create_complete_report(
+            context_response=ctx["context"],
+            report_response=ctx["report"],
+            df=ctx["df"],
+            figures=ctx["charts"],
+            output_path=os.path.join(directory, "report.pdf"),
+            report_title="Benchmark report",
+        )
+
+
+def _qa_turn(ctx):
+    from utils.gemini_ai import answer_user_query
+    from utils.retrieval import build_qa_index
+    index = build_qa_index(ctx["report"], ctx["context"], ctx["charts"])
+    answer_user_query(ctx["report"], "Which region has the highest revenue?", "", ctx["df"], ctx["charts"], index=index)
+
+
+# Run in this order; later benchmarks reuse the outputs stored in the context by earlier ones
+BENCHMARKS = [
+    ("ingestion.read_csv", _ingestion),
+    ("profiling", _profiling),
+    ("prompt.context", _prompt_context),
+    ("prompt.report", _prompt_report),
+    ("charts.recommend", _chart_recommendation),
+    ("charts.render", _chart_rendering),
+    ("pdf.create_complete_report", _complete_report),
+    ("qa.turn", _qa_turn),
+]
+
+
+def git_revision():
+    """Returns the current commit hash, or 'unknown' outside a git checkout."""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run(sizes, shapes, repeat, only=None):
+    """
+    Runs the benchmarks for every dataset size and shape.
+
+    Args:
+        sizes (list): Size labels from datasets.SIZES, e.g. ["1k", "100k"]
+        shapes (list): Dataset shapes, "narrow" and/or "wide"
+        repeat (int): Runs per benchmark; the median and minimum are reported
+        only (list, optional): Names of the benchmarks to run
+
+    Returns:
+        list: One result dictionary per benchmark, size and shape
+    """
+    results = []
+    for shape in shapes:
+        for size in sizes:
+            rows = SIZES[size]
+            ctx = {"csv": dataset_csv(rows, shape)}
+            ctx["df"] = pd.read_csv(ctx["csv"])
+            for name, func in BENCHMARKS:
+                if only and name not in only:
+                    # Still run it once when a later benchmark needs its output
+                    if name.startswith(("prompt.", "charts.recommend")):
+                        func(ctx)
+                    continue
+                timings = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    func(ctx)
+                    timings.append(time.perf_counter() - start)
+                result = {
+                    "benchmark": name,
+                    "shape": shape,
+                    "size": size,
+                    "rows": rows,
+                    "columns": ctx["df"].shape[1],
+                    "median_s": statistics.median(timings),
+                    "min_s": min(timings),
+                    "repeat": repeat,
+                }
+                results.append(result)
+                print(f"{name:<30}{shape:<8}{size:>6}{result['median_s']:>12.4f}s")
+    return results
+
+
+def compare(results, baseline_path):
+    """
+    Prints each benchmark's median time relative to an earlier results file.
+
+    Args:
+        results (list): Results of the current run
+        baseline_path (str): Path of an earlier results JSON file
+    """
+    with open(baseline_path) as f:
+        baseline = {(r["benchmark"], r["shape"], r["size"]): r for r in json.load(f)["results"]}
+    print(f"\n{'benchmark':<30}{'shape':<8}{'size':>6}{'baseline':>12}{'current':>12}{'change':>10}")
+    for result in results:
+        before = baseline.get((result["benchmark"], result["shape"], result["size"]))
+        if not before:
+            continue
+        change = (result["median_s"] / before["median_s"] - 1) * 100 if before["median_s"] else 0.0
+        print(f"{result['benchmark']:<30}{result['shape']:<8}{result['size']:>6}"
+              f"{before['median_s']:>12.4f}{result['median_s']:>12.4f}{change:>+9.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark suite with a fake Gemini backend")
+    parser.add_argument("--sizes", default="1k,100k", help=f"comma-separated sizes from {', '.join(SIZES)}")
+    parser.add_argument("--shapes", default="narrow,wide", help="comma-separated dataset shapes: narrow, wide")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per benchmark")
+    parser.add_argument("--only", help="comma-separated benchmark names to run")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="seconds the fake model waits per call")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/<timestamp>-<commit>.json)")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    llm.set_backend("fake", latency=args.llm_latency)
+    # Fake calls are neither billed nor limited
+    metering.set_meter(None)
+    results = run(
+        args.sizes.split(","),
+        args.shapes.split(","),
+        args.repeat,
+        only=args.only.split(",") if args.only else None,
+    )
+
+    revision = git_revision()
+    timestamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    output = args.output or os.path.join(RESULTS_DIR, f"{timestamp}-{revision}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({
+            "revision": revision,
+            "timestamp": timestamp,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "llm_latency_s": args.llm_latency,
+            "results": results,
+        }, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,8 @@
 import streamlit as st
 import streamlit.components.v1 as components
 from streamlit_lottie import st_lottie
-import requests
+import json
+import os
 from datetime import datetime
 
 # ---------- PAGE CONFIG ----------
@@ -15,19 +16,26 @@ st.set_page_config(
 
     # st.sidebar.page_link("pages/Live_track.py", label="Live Track 📈")
 # ---------- LOAD LOTTIE ANIMATION ----------
-def load_lottieurl(url: str):
-    r = requests.get(url)
-    if r.status_code != 200:
+# Bundled with the app so the home page renders without a network round-trip
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets")
+
+@st.cache_data
+def load_lottie_file(path: str):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
         return None
-    return r.json()
 
-lottie_ai = load_lottieurl("https://assets9.lottiefiles.com/packages/lf20_qp1q7mct.json")  # AI animation
+lottie_ai = load_lottie_file(os.path.join(ASSETS_DIR, "lottie_ai.json"))  # AI animation
 
 class Pages_switch():
     st.sidebar.page_link("main.py", label="Home 🏠")
     st.sidebar.page_link("pages/upload_data.py", label="Upload Data-Sets 📂")
+    st.sidebar.page_link("pages/compare.py", label="Compare Data-Sets ⚖️")
     st.sidebar.page_link("pages/report.py", label="Data-Set report 📄")
     st.sidebar.page_link("pages/Q&A.py", label="Q&A with Dattavism ❓")
+    st.sidebar.page_link("pages/history.py", label="Analysis History 🕘")
 
 
 # ---------- TITLE & HEADER ----------
@@ -58,7 +66,8 @@ with col1:
     st.success("➡️ Use the **sidebar** to begin by uploading your data.")
 
 with col2:
-    st_lottie(lottie_ai, height=280, key="ai")
+    if lottie_ai:
+        st_lottie(lottie_ai, height=280, key="ai")
 
 # ---------- FEATURE CARDS ----------
 # ---------- FEATURE SECTION (REPLACE THIS BLOCK) ----------
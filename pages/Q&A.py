@@ -1,9 +1,14 @@
 import time
 import streamlit as st
 from utils.gemini_ai import answer_user_query
-from utils.visualizer import generate_visualizations
-import pandas as pd
-import matplotlib.pyplot as plt
+from utils.retrieval import build_qa_index
+from utils.answer_cache import AnswerCache
+from utils.fingerprint import dataset_hash, text_hash
+from utils.charts import render_suggested_chart
+from utils.frontend_data import paged_preview
+from utils import artifacts, metering, sessions
+from utils.tracing import span, start_trace, end_trace
+from utils.perf_panel import render_perf_panel
 
 st.set_page_config(
     page_title="Q&A with AI",
@@ -11,12 +16,21 @@ st.set_page_config(
     layout="wide",
     initial_sidebar_state="expanded",
 )
+page_trace = start_trace("page.qa")
+sessions.touch()
 
 class Pages_switch():
     st.sidebar.page_link("main.py", label="Home 🏠")
     st.sidebar.page_link("pages/upload_data.py", label="Upload Data-Sets 📂")
+    st.sidebar.page_link("pages/compare.py", label="Compare Data-Sets ⚖️")
     st.sidebar.page_link("pages/report.py", label="Data-Set report 📄")
     st.sidebar.page_link("pages/Q&A.py", label="Q&A with Dattavism ❓")
+    st.sidebar.page_link("pages/history.py", label="Analysis History 🕘")
+
+@st.cache_resource
+def get_answer_cache():
+    # Shared by every session so teams asking the same question about the same dataset get instant answers
+    return AnswerCache()
 
 st.title("Ask Dattavism Questions About Your Dataset and report ❓")
 st.markdown(
@@ -29,63 +43,27 @@ else:
     df = st.session_state["df"]
     report = st.session_state["report"]
     plot = st.session_state["plot"]
+    context = st.session_state.get("context")
+    # Index the report once and reuse it for every question until the report changes
+    index_source = text_hash(report, context, str(plot))
+    if st.session_state.get("qa_index_source") != index_source:
+        with span("qa.build_index"):
+            st.session_state["qa_index"] = build_qa_index(report, context, plot)
+        st.session_state["qa_index_source"] = index_source
+        st.session_state["qa_report_hash"] = text_hash(report, context)
+    if "dataset_hash" not in st.session_state:
+        st.session_state["dataset_hash"] = dataset_hash(df)
     Col1, Col2 = st.columns(2,border=False)
     with Col1:
         with st.expander("## Dataset Preview 🔍"):
-            st.write(df.head(10))
+            paged_preview(df, key="qa_preview")
         with st.expander("## Report Preview 📄"):
             with st.container(height=500):
                 st.write(report)
         with st.expander("## Visualizations 📊"):
             with st.container(height=500):
                 for i, chart in enumerate(plot):
-                    chart_type = chart.get("chart_type")
-                    x_column = chart.get("x_column")
-                    y_column = chart.get("y_column")
-                    reason = chart.get("reason")
-
-                    st.subheader(f"{i+1}. {chart_type.capitalize()} Chart")
-                    st.text(f"🧠 {reason}")
-
-                    try: 
-                        with st.container(border=True):
-                            chart_df = pd.DataFrame(df)
-                            if chart_type == "scatter":
-                                fig, ax = plt.subplots(figsize=(3, 3))
-                                ax.scatter(chart_df[y_column], chart_df[x_column])
-                                ax.set_xlabel(x_column)
-                                ax.set_ylabel(y_column)
-                                st.pyplot(fig,use_container_width=True)
-                            elif chart_type == "bar":
-                                        fig, ax = plt.subplots(figsize=(9, 9))
-                                        ax.bar(chart_df[x_column], chart_df[y_column])
-                                        ax.set_xlabel(x_column)
-                                        ax.set_ylabel(y_column)
-                                        st.pyplot(fig,use_container_width=True)
-                            elif chart_type == "line":
-                                        st.line_chart(chart_df, x=x_column, y=y_column)
-                            elif chart_type == "area":
-                                        st.area_chart(chart_df, x=x_column, y=y_column)
-                            elif chart_type == "pie":
-                                        fig, ax = plt.subplots(figsize=(3, 3))
-                                        ax.pie(chart_df[y_column], labels=chart_df[x_column], autopct='%1.1f%%', startangle=90)
-                                        ax.axis('equal') # Equal aspect ratio ensures the pie chart is circular.
-                                        st.pyplot(fig)
-                            elif chart_type == "histogram":
-                                        if y_column in chart_df.columns:
-
-                                            st.pyplot(chart_df[y_column].plot.hist(bins=30, edgecolor='black'))
-                                        else:
-                                            st.error("Histogram requires a numerical column.")
-                            elif chart_type == "map":
-                                            if "latitude" in chart_df.columns and "longitude" in chart_df.columns:
-                                                st.map(chart_df)
-                                            else:
-                                                st.error("Map visualization requires 'latitude' and 'longitude' columns.")
-                            else:
-                                        st.error(f"Unsupported chart type: {chart_type}")
-                    except Exception as e:
-                                    st.error(f"Could not render chart due to: {e}")
+                    render_suggested_chart(chart, df, i + 1)
 
     with Col2:
         st.write("### Ask your question about the dataset or report:")
@@ -108,18 +86,43 @@ else:
                 # Generate chat history after adding user input
                 chat_history = "\n".join([f"{msg['role']}: {msg['content']}" for msg in st.session_state["messages"]])
 
+                answer_cache = get_answer_cache()
+                cache_scope = (st.session_state["dataset_hash"], st.session_state["qa_report_hash"])
+                # Answers are only reused within the same conversation, the question is the last message
+                earlier_turns = st.session_state["messages"][:-1]
+                with span("qa.cache_lookup") as lookup_span:
+                    cached_answer = answer_cache.get(*cache_scope, user_input, history=earlier_turns)
+                    lookup_span.set("cache.hit", cached_answer is not None)
                 with st.spinner("Dattavism is typing..."):
-                    response = answer_user_query(data=report,query=user_input,history=chat_history,data_set=df,plots=plot)
-                    with st.chat_message('Dattavism',avatar="ai"):
-                        response_container = st.empty()
-                        streamed_response = ""
-
-                        for chunk in response:
-                            streamed_response += chunk
-                            response_container.markdown(streamed_response)
-                            time.sleep(0.01)
-
-                    st.session_state["messages"].append({"role": "ai", "content": streamed_response})
-
-
-        
+                    if cached_answer is not None:
+                        response = AnswerCache.stream(cached_answer)
+                        delay = 0
+                    else:
+                        try:
+                            response = answer_user_query(data=report,query=user_input,history=chat_history,data_set=df,plots=plot,index=st.session_state["qa_index"])
+                            answer_cache.put(*cache_scope, user_input, response, history=earlier_turns)
+                        except metering.BudgetExceeded as e:
+                            # The question stays unanswered, so it is not part of the history either
+                            st.warning(str(e))
+                            st.session_state["messages"].pop()
+                            response = None
+                        delay = 0.01
+                    if response is not None:
+                        with st.chat_message('Dattavism',avatar="ai"):
+                            response_container = st.empty()
+                            streamed_response = ""
+
+                            for chunk in response:
+                                streamed_response += chunk
+                                response_container.markdown(streamed_response)
+                                time.sleep(delay)
+
+                        st.session_state["messages"].append({"role": "ai", "content": streamed_response})
+                        artifacts.get_store().save(
+                            st.session_state["dataset_hash"],
+                            st.session_state.get("filename"),
+                            metering.current_scope()["user"],
+                            messages=st.session_state["messages"],
+                        )
+
+render_perf_panel(end_trace(page_trace))
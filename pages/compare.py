@@ -0,0 +1,139 @@
+import streamlit as st
+import pandas as pd
+from utils.fingerprint import dataset_hash
+from utils.frontend_data import paged_preview
+from utils.gemini_ai import compare_datasets
+from utils import comparison, sessions
+from utils.tracing import span, start_trace, end_trace
+from utils.perf_panel import render_perf_panel
+
+st.set_page_config(
+    page_title="Compare Data-Sets",
+    page_icon="⚖️",
+    layout="wide",
+    initial_sidebar_state="expanded",
+)
+page_trace = start_trace("page.compare")
+sessions.touch()
+
+class Pages_switch():
+    st.sidebar.page_link("main.py", label="Home 🏠")
+    st.sidebar.page_link("pages/upload_data.py", label="Upload Data-Sets 📂")
+    st.sidebar.page_link("pages/compare.py", label="Compare Data-Sets ⚖️")
+    st.sidebar.page_link("pages/report.py", label="Data-Set report 📄")
+    st.sidebar.page_link("pages/Q&A.py", label="Q&A with Dattavism ❓")
+    st.sidebar.page_link("pages/history.py", label="Analysis History 🕘")
+
+
+st.title("⚖️ Compare Data-Sets")
+st.markdown("Upload two or more CSV files, e.g. two quarters of the same extract or a table and its lookup table, to see what differs and join them on a shared key.")
+
+uploaded_files = st.file_uploader(
+    "Upload CSV files",
+    type=["csv"],
+    accept_multiple_files=True,
+    help="Upload at least two CSV files with headers.",
+)
+
+# Each file is read once; files removed from the uploader are dropped from the session
+frames = st.session_state.get("comparison_frames", {})
+frames = {f.file_id: frames[f.file_id] for f in uploaded_files if f.file_id in frames}
+try:
+    for uploaded in uploaded_files:
+        if uploaded.file_id not in frames:
+            with span("compare.read_csv", **{"file.bytes": uploaded.size}) as read_span:
+                df = pd.read_csv(uploaded)
+                read_span.set("rows", len(df))
+            sessions.check_fits(df, what=uploaded.name)
+            frames[uploaded.file_id] = (uploaded.name.removesuffix(".csv"), df)
+except Exception as e:
+    st.error(f"Error reading the file: {e}")
+st.session_state["comparison_frames"] = frames
+
+if len(frames) < 2:
+    st.info("Upload at least two files to compare them.")
+else:
+    ids = list(frames)
+    label = lambda file_id: frames[file_id][0]
+    col1, col2 = st.columns(2)
+    left_id = col1.selectbox("Baseline", ids, index=0, format_func=label)
+    right_id = col2.selectbox("Compared with", [i for i in ids if i != left_id], index=0, format_func=label)
+    (left_name, left), (right_name, right) = frames[left_id], frames[right_id]
+
+    keys = st.session_state.get("comparison_keys")
+    if keys is None or keys["inputs"] != (left_id, right_id):
+        keys = st.session_state["comparison_keys"] = {"inputs": (left_id, right_id), "candidates": comparison.detect_keys(left, right)}
+    candidates = keys["candidates"]
+    key = st.selectbox(
+        "Key",
+        [None, *candidates],
+        index=1 if candidates else 0,
+        format_func=lambda c: "No key: compare column statistics only" if c is None else repr(c),
+        help="Columns both files share. A key unique in one file joins the files; other keys align them by group.",
+    )
+
+    key_id = None if key is None else (key.left, key.right)
+    cached = st.session_state.get("comparison")
+    if cached is None or cached["inputs"] != (left_id, right_id, key_id):
+        try:
+            with st.spinner("Comparing the datasets..."):
+                result = comparison.compare(left, right, key, names=(left_name, right_name))
+            cached = st.session_state["comparison"] = {"inputs": (left_id, right_id, key_id), "result": result}
+        except Exception as e:
+            st.error(f"Error comparing the datasets: {e}")
+            cached = None
+
+    if cached is not None:
+        result = cached["result"]
+        tab1, tab2, tab3 = st.tabs(["📊 Comparison", "🔗 Join", "🤖 Differences & Drivers"])
+        with tab1:
+            st.markdown(result.summary())
+            for title, table, _ in result.sections():
+                st.subheader(title)
+                st.dataframe(table)
+
+        with tab2:
+            if key is None:
+                st.info("Select a key to join the datasets.")
+            else:
+                how = st.radio(
+                    "Rows without a match",
+                    ["left", "inner"],
+                    format_func=lambda h: f"Keep all rows of {left_name}" if h == "left" else "Drop them",
+                    horizontal=True,
+                )
+                if st.button("Join", help=f"Adds the columns of {right_name} to the rows of {left_name} with the same {key.left}."):
+                    try:
+                        with st.spinner("Joining the datasets..."):
+                            joined = comparison.join(left, right, key.left, key.right, how=how, suffix=f"_{right_name}")
+                        sessions.check_fits(joined, what="The joined dataset")
+                        st.session_state["comparison_join"] = {"name": f"{left_name}_{right_name}", "df": joined}
+                    except (ValueError, MemoryError) as e:
+                        st.error(str(e))
+                joined = st.session_state.get("comparison_join")
+                if joined is not None:
+                    st.caption(f"{joined['name']}: {len(joined['df']):,} rows, {joined['df'].shape[1]} columns")
+                    paged_preview(joined["df"], key="comparison_preview")
+                    if st.button("Analyse the joined dataset", help="Uses the joined dataset on the report and Q&A pages."):
+                        st.session_state["df"] = joined["df"]
+                        st.session_state["dataset_hash"] = dataset_hash(joined["df"])
+                        st.session_state["filename"] = joined["name"]
+                        large = st.session_state.pop("dataset", None)
+                        if large is not None:
+                            large.delete()
+                        for stale in ("dataset_source", "dataset_version"):
+                            st.session_state.pop(stale, None)
+                        st.switch_page("pages/report.py")
+
+        with tab3:
+            explanation = cached.get("explanation")
+            if st.button("Explain the differences", help="Sends only the comparison tables to the model, not the rows."):
+                try:
+                    with st.spinner("Dattavism is comparing the datasets..."):
+                        explanation = cached["explanation"] = compare_datasets(result)
+                except Exception as e:
+                    st.error(f"Error generating the comparison: {e}")
+            if explanation:
+                st.markdown(explanation)
+
+render_perf_panel(end_trace(page_trace))
@@ -0,0 +1,87 @@
+import streamlit as st
+from utils import artifacts, metering, sessions
+from utils.tracing import span, start_trace, end_trace
+from utils.perf_panel import render_perf_panel
+
+st.set_page_config(
+    page_title="Analysis History",
+    page_icon="🕘",
+    layout="wide",
+    initial_sidebar_state="expanded",
+)
+page_trace = start_trace("page.history")
+sessions.touch()
+
+class Pages_switch():
+    st.sidebar.page_link("main.py", label="Home 🏠")
+    st.sidebar.page_link("pages/upload_data.py", label="Upload Data-Sets 📂")
+    st.sidebar.page_link("pages/compare.py", label="Compare Data-Sets ⚖️")
+    st.sidebar.page_link("pages/report.py", label="Data-Set report 📄")
+    st.sidebar.page_link("pages/Q&A.py", label="Q&A with Dattavism ❓")
+    st.sidebar.page_link("pages/history.py", label="Analysis History 🕘")
+
+
+st.title("🕘 Analysis History")
+st.markdown("Your analyses are kept on this server. Reopen one to see its report, charts and chat again without waiting for Dattavism.")
+
+store = artifacts.get_store()
+# Only the visitor's own analyses are listed, opened, pinned or deleted
+user = metering.current_scope()["user"]
+st.caption(f"Analyses saved as {user}.")
+with span("history.list"):
+    history = store.history(user=user)
+
+if history.empty:
+    st.info("No analyses have been saved yet. Upload a dataset and open its report to start.")
+else:
+    st.dataframe(
+        history.drop(columns=["dataset_hash", "user"]).assign(size_mb=history["bytes"] / 2**20).drop(columns=["bytes"]),
+        hide_index=True,
+    )
+    labels = {row.id: f"{row.dataset_name} · {row.updated}" for row in history.itertuples()}
+    analysis_id = st.selectbox("Analysis", list(labels), format_func=labels.get)
+    selected = history.set_index("id").loc[analysis_id]
+
+    col1, col2, col3, col4 = st.columns(4)
+    if col1.button("Open", type="primary", help="Opens the stored report; nothing is sent to the model."):
+        with st.spinner("Loading the analysis..."), span("history.open"):
+            stored = store.load(analysis_id, kinds=("dataset", "messages"), user=user)
+        if "dataset" not in stored:
+            st.error("The dataset of this analysis is no longer stored.")
+        else:
+            st.session_state["df"] = stored["dataset"]
+            st.session_state["dataset_hash"] = selected["dataset_hash"]
+            st.session_state["filename"] = selected["dataset_name"]
+            st.session_state["messages"] = stored.get("messages", [])
+            # The dataset is already stored, only the report page's text artifacts may be saved again
+            st.session_state["artifacts_saved"] = {"data_hash": selected["dataset_hash"]}
+            large = st.session_state.pop("dataset", None)
+            if large is not None:
+                large.delete()
+            for stale in ("dataset_source", "dataset_version"):
+                st.session_state.pop(stale, None)
+            st.switch_page("pages/report.py")
+    pinned = bool(selected["pinned"])
+    if col2.button("Unpin" if pinned else "Pin", help="Pinned analyses are never removed by the retention policy."):
+        store.pin(analysis_id, not pinned, user=user)
+        st.rerun()
+    if col3.button("Delete"):
+        store.delete([analysis_id], user=user)
+        st.rerun()
+    if "pdf" in (selected["artifacts"] or ""):
+        pdf = store.load(analysis_id, kinds=("pdf",), user=user).get("pdf")
+        if pdf:
+            col4.download_button("Download PDF", data=pdf, file_name=f"{selected['dataset_name']}_report.pdf", mime="application/pdf")
+
+st.markdown("---")
+st.caption(
+    f"Stored: {store.size_bytes() / 2**20:,.1f} MB of {artifacts.MAX_STORE_BYTES / 2**20:,.0f} MB. "
+    f"Unpinned analyses are removed after {artifacts.MAX_AGE_DAYS:g} days without updates, "
+    f"beyond {artifacts.MAX_ANALYSES_PER_USER} per user, and oldest first when the store is full."
+)
+if st.button("Apply retention policy now"):
+    with st.spinner("Removing expired analyses and compacting the store..."):
+        result = store.apply_retention()
+    st.success(f"Removed {result['deleted']} analyses and freed {result['freed_bytes'] / 2**20:,.1f} MB.")
+
+render_perf_panel(end_trace(page_trace))
@@ -1,12 +1,17 @@
 import streamlit as st 
-from utils.gemini_ai import generate_report, answer_user_query, context_detection 
+from utils.gemini_ai import generate_report, context_detection, update_report
+from utils import artifacts, metering, profiling, segmentation, sessions, versioning
 from utils.visualizer import generate_visualizations
-from utils.pdf_generator import EnhancedReportGenerator
-# ...existing code...
+from utils.charts import render_suggested_chart, custom_chart_png
+from utils.frontend_data import paged_preview
+from utils.fingerprint import dataset_hash, text_hash
+from utils.tracing import span, start_trace, end_trace
+from utils.perf_panel import render_perf_panel
 import pandas as pd
 import os
-import matplotlib.pyplot as plt
 
+# Where exported PDFs are written; the load test points this at a temporary directory
+REPORT_DIR = os.getenv("DATTAVISM_REPORT_DIR", "report")
 
 st.set_page_config(
     page_title="Dattavism Insight Report",
@@ -14,219 +19,274 @@ st.set_page_config(
     layout="centered",
     initial_sidebar_state="expanded"
 )
+page_trace = start_trace("page.report")
+sessions.touch()
 
 class Pages_switch():
     st.sidebar.page_link("main.py", label="Home 🏠")
     st.sidebar.page_link("pages/upload_data.py", label="Upload Data-Sets 📂")
+    st.sidebar.page_link("pages/compare.py", label="Compare Data-Sets ⚖️")
     st.sidebar.page_link("pages/report.py", label="Data-Set report 📄")
     st.sidebar.page_link("pages/Q&A.py", label="Q&A with Dattavism ❓")
+    st.sidebar.page_link("pages/history.py", label="Analysis History 🕘")
+
+# The model calls and profiling are memoized per dataset hash, so widget interactions
+# never repeat them. The DataFrame arguments are excluded from hashing by their underscore.
+def stored_analysis(version):
+    # The analysis of this exact dataset, or of the version it was appended to, from an earlier upload
+    if not version or version["kind"] == "new":
+        return None
+    source = version["data_hash"] if version["kind"] == "same" else version["previous_hash"]
+    return versioning.get_store().load_analysis(version["name"], source)
+
+def stored_artifact(data_hash, kind):
+    # The artifact of an earlier analysis of this exact dataset, kept across restarts
+    stored = artifacts.get_store().find(data_hash, (kind,))
+    return stored[kind] if stored else None
+
+@st.cache_data(show_spinner="Detecting the dataset context...", max_entries=16)
+def cached_context(data_hash, _df, _version=None):
+    saved = stored_artifact(data_hash, "context")
+    if saved:
+        return saved
+    stored = stored_analysis(_version)
+    # Appended rows keep the schema, so the context of the previous version still applies
+    if stored and stored.get("context"):
+        return stored["context"]
+    return context_detection(_df)
+
+@st.cache_data(show_spinner="Generating the report...", max_entries=16)
+def cached_report(data_hash, _df, _version=None):
+    saved = stored_artifact(data_hash, "report")
+    if saved:
+        return saved
+    stored = stored_analysis(_version)
+    if stored and stored.get("report"):
+        if _version["kind"] == "same":
+            return stored["report"]
+        appended = _df.iloc[len(_df) - _version["delta_rows"]:]
+        return update_report(stored["report"], _version["previous_profile"], _version["profile"], appended)
+    return generate_report(_df, segments=cached_segmentation(data_hash, _df))
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def cached_visualizations(data_hash, refine, _df):
+    # Only re-ranked suggestions come from the model; local ones are cheaper to recompute than to load
+    saved = stored_artifact(data_hash, "charts_refined") if refine else None
+    return saved if saved is not None else generate_visualizations(_df, refine=refine)
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def cached_describe(data_hash, _dataset):
+    return profiling.describe(_dataset)
+
+@st.cache_resource(show_spinner="Finding segments and anomalies...", max_entries=16)
+def cached_segmentation(data_hash, _df):
+    # Shared by the report's statistics and the charts tab, so the dataset is segmented once
+    return segmentation.analyze(_df)
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def cached_segments(data_hash, _df):
+    result = cached_segmentation(data_hash, _df)
+    if result is None:
+        return None
+    return result.clusters(), result.anomalies(), segmentation.segment_chart_png(result)
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def cached_custom_chart(data_hash, chart_type, x_columns, y_columns, _df):
+    return custom_chart_png(chart_type, _df, x_columns, y_columns)
+
+
+def fragment_dataset(data_hash):
+    # Fragment reruns skip the page's sessions.touch(), so activity is recorded here. The
+    # dataset is read from session state rather than passed in, so a session moved to disk
+    # is not kept in memory by its fragments; if it is gone, the whole page reruns
+    sessions.keep_alive()
+    df = st.session_state.get("df")
+    if df is None or st.session_state.get("dataset_hash") != data_hash:
+        st.rerun()
+    return df
+
+
+@st.fragment
+def overview_tab(data_hash):
+    df = fragment_dataset(data_hash)
+    st.header("Data-set Overview 🔍")
+    st.write("### Data Summary:")
+    # In large file mode the summary is computed out-of-core over the full dataset
+    with span("report.describe"):
+        summary = cached_describe(data_hash, st.session_state.get("dataset", df))
+    st.write(summary)
+    if summary.attrs.get("approximate"):
+        st.caption(summary.attrs["error_note"])
+    st.write("### Sample Data:")
+    paged_preview(st.session_state.get("dataset", df), key="overview_preview")
+
+
+@st.fragment
+def suggested_charts_tab(data_hash):
+    df = fragment_dataset(data_hash)
+    st.header("Dattavism Generated Visualizations 📊")
+    refine_charts = st.toggle(
+        "Let Dattavism re-rank chart suggestions",
+        key="refine_charts",
+        help="Chart suggestions are computed locally and appear instantly. Turn this on to have Dattavism re-rank and explain them.",
+    )
+    st.session_state["plot"] = cached_visualizations(data_hash, refine_charts, df)
+    for i,chart in enumerate(st.session_state["plot"]):
+        render_suggested_chart(chart, df, i + 1)
+    segments = cached_segments(data_hash, df)
+    if segments is not None:
+        clusters, anomalies, png = segments
+        st.subheader("Segments & Anomalies")
+        st.image(png, use_container_width=True)
+        st.write("Segments:")
+        st.dataframe(clusters)
+        st.write("Most anomalous rows:")
+        st.dataframe(anomalies, hide_index=True)
+
+
+@st.fragment
+def custom_charts_tab(data_hash):
+    df = fragment_dataset(data_hash)
+    st.header("Custom Charts 📈")
+    st.write("You can create custom charts based on the dataset.")
+    Column_data = pd.DataFrame(df)
+    
+    # Show sample of the data
+    st.write("Sample of your data:")
+    st.write(Column_data.head())
+    
+    # Chart selection and configuration
+    chart_type = st.selectbox("Select Chart Type", ["Bar", "Line", "Scatter", "Pie", "Histogram", "Heatmap"])
+    y_columns = st.selectbox("Select Y Column", Column_data.columns) if chart_type != "Heatmap" else None
+    x_columns = st.selectbox("Select X Column", Column_data.columns) if chart_type not in ["Pie", "Histogram", "Heatmap"]else None
+    
+    if st.button("Generate Custom Chart"):
+        try:
+            with span("report.custom_chart", chart_type=chart_type):
+                png = cached_custom_chart(data_hash, chart_type, x_columns, y_columns, Column_data)
+            st.image(png, use_container_width=True)
+        except Exception as e:
+            st.error(f"Could not render custom chart due to: {e}")
+            st.write("Please make sure you've selected appropriate columns for the chart type.")
+
+
+@st.fragment
+def download_tab(data_hash):
+    df = fragment_dataset(data_hash)
+    st.header("Download Report 📩")
+    context, report, plot = (st.session_state.get(key) for key in ("context", "report", "plot"))
+    if not (context and report and plot is not None):
+        st.rerun()
+    filename = st.session_state.get("filename", "dataset")
+    if st.button("Generate Complete Report"):
+        with st.spinner("Creating PDF report..."):
+            os.makedirs(REPORT_DIR, exist_ok=True)
+            report_path = os.path.join(REPORT_DIR, "analysis_report.pdf")
+            # reportlab and markdown are only loaded when a report is exported
+            from utils.pdf_generator import EnhancedReportGenerator
+            report_generator = EnhancedReportGenerator()
+            success = report_generator.create_complete_report(
+                    context_response=context,
+                    report_response=report,
+                    df=st.session_state.get("dataset", df),
+                    figures=plot,
+                    output_path=report_path,
+                    report_title=f"Analysis report on {filename}",
+                    # In large file mode the PDF covers the full dataset, not the hashed sample
+                    data_hash=None if "dataset" in st.session_state else data_hash,
+                )
+            if success:
+                # Read the generated PDF file from the reports folder
+                with open(report_path, "rb") as pdf_file:
+                    pdf_bytes = pdf_file.read()
+                artifacts.get_store().save(
+                    data_hash,
+                    filename,
+                    metering.current_scope()["user"],
+                    pdf=pdf_bytes,
+                )
+
+                # Create download button for the file in the reports folder
+                st.download_button(
+                    label="Download PDF Report",
+                    data=pdf_bytes,
+                    file_name="analysis_report.pdf",
+                    mime="application/pdf"
+                )
+                st.success("Report generated successfully! Click the download button above to get your PDF.")
+            else:
+                st.error("Failed to generate the report. Please try again.")
+
 
 st.title("📊 AI-Powered Data Insight Report")
 st.markdown("---")
 
 if "df" in st.session_state:
     df = st.session_state["df"]
-    context = context_detection(df)
-    report = generate_report(df)
-    plot = generate_visualizations(df)
-    st.session_state["plot"] = plot
+    if "dataset_hash" not in st.session_state:
+        st.session_state["dataset_hash"] = dataset_hash(df)
+    data_hash = st.session_state["dataset_hash"]
+    version = st.session_state.get("dataset_version")
+    if version and version["data_hash"] != data_hash:
+        version = None
+    try:
+        with span("report.context"):
+            context = cached_context(data_hash, df, version)
+        with span("report.report"):
+            report = cached_report(data_hash, df, version)
+    except metering.BudgetExceeded as e:
+        # Nothing is cached for a call that was not made, so the next rerun tries again
+        st.warning(str(e))
+        context = report = None
+    if version and context and report and st.session_state.get("version_saved") != data_hash:
+        # Kept so the next upload that appends to this dataset only analyses what changed
+        versioning.get_store().save_analysis(version["name"], data_hash, report=report, context=context)
+        st.session_state["version_saved"] = data_hash
+    with span("report.visualizations"):
+        st.session_state["plot"] = cached_visualizations(data_hash, st.session_state.get("refine_charts", False), df)
     st.session_state["report"] = report
     st.session_state["context"] = context
+    if context and report:
+        # Kept so the analysis can be reopened from the history page without model calls
+        refine = st.session_state.get("refine_charts", False)
+        saved = st.session_state.get("artifacts_saved", {})
+        content = text_hash(report, context, str(st.session_state["plot"]))
+        if saved.get("content") != content:
+            with span("report.save_artifacts"):
+                artifacts.get_store().save(
+                    data_hash,
+                    st.session_state.get("filename"),
+                    metering.current_scope()["user"],
+                    # The dataset is only written once per upload, the text artifacts whenever they change
+                    dataset=df if saved.get("data_hash") != data_hash else None,
+                    context=context,
+                    report=report,
+                    **{"charts_refined" if refine else "charts": st.session_state["plot"]},
+                )
+            st.session_state["artifacts_saved"] = {"data_hash": data_hash, "content": content}
     if context and report: 
         st.subheader("Context Detection")
         st.write(context)
         tab1, tab2, tab3, tab4, tab5 = st.tabs(["🔍 Data-set overview","📄 Dattavism Generated Report ","🤖 Dattavism Suggested Charts","Custom Charts 📈","Download Report 📩"])
 
         with tab1:
-            st.header("Data-set Overview 🔍")
-            st.write("### Data Summary:")
-            st.write(df.describe())
-            st.write("### Sample Data:")
-            st.dataframe(df.head(10))
-
+            overview_tab(data_hash)
 
         with tab2:
             st.write(report)
-            
-        
+
         with tab3:
-           st.header("Dattavism Generated Visualizations 📊")
-           if "plot" in st.session_state:
-                for i,chart in enumerate(st.session_state["plot"]):
-                    chart_type = chart.get("chart_type")
-                    x_column = chart.get("x_column")
-                    y_column = chart.get("y_column")
-                    reason = chart.get("reason")
-
-                    st.subheader(f"{i+1}. {chart_type.capitalize()} Chart")
-                    st.text(f"🧠 {reason}")
-
-                    try: 
-                        with st.container(border=True):
-                            chart_df = pd.DataFrame(df)
-                            if chart_type == "scatter":
-                                fig, ax = plt.subplots(figsize=(3, 3))
-                                ax.scatter(chart_df[y_column], chart_df[x_column])
-                                ax.set_xlabel(x_column)
-                                ax.set_ylabel(y_column)
-                                st.pyplot(fig,use_container_width=True)
-                            elif chart_type == "bar":
-                                fig, ax = plt.subplots(figsize=(9, 9))
-                                ax.bar(chart_df[x_column], chart_df[y_column])
-                                ax.set_xlabel(x_column)
-                                ax.set_ylabel(y_column)
-                                st.pyplot(fig,use_container_width=True)
-                            elif chart_type == "line":
-                                st.line_chart(chart_df, x=x_column, y=y_column)
-                            elif chart_type == "area":
-                                st.area_chart(chart_df, x=x_column, y=y_column)
-                            elif chart_type == "pie":
-                                fig, ax = plt.subplots(figsize=(3, 3))
-                                ax.pie(chart_df[y_column], labels=chart_df[x_column], autopct='%1.1f%%', startangle=90)
-                                ax.axis('equal') # Equal aspect ratio ensures the pie chart is circular.
-                                st.pyplot(fig)
-                            elif chart_type == "histogram":
-                                if y_column in chart_df.columns:
-
-                                    st.pyplot(chart_df[y_column].plot.hist(bins=30, edgecolor='black'))
-                                else:
-                                    st.error("Histogram requires a numerical column.")
-                            elif chart_type == "map":
-                                    if "latitude" in chart_df.columns and "longitude" in chart_df.columns:
-                                        st.map(chart_df)
-                                    else:
-                                        st.error("Map visualization requires 'latitude' and 'longitude' columns.")
-                            else:
-                                st.error(f"Unsupported chart type: {chart_type}")
-                    except Exception as e:
-                            st.error(f"Could not render chart due to: {e}")
-        with tab5:
-            st.header("Download Report 📩")
-            if st.button("Generate Complete Report"):
-                with st.spinner("Creating PDF report..."):
-                    report_generator = EnhancedReportGenerator()
-                    success = report_generator.create_complete_report(
-                            context_response=st.session_state["context"],
-                            report_response=st.session_state["report"],
-                            df=df,   
-                            figures=st.session_state["plot"],
-                            output_path="analysis_report.pdf",
-                            report_title=f"Analysis report on {st.session_state["filename"]}"
-                        )
-                    if success:
-                        # Read the generated PDF file
-                        with open("analysis_report.pdf", "rb") as pdf_file:
-                            pdf_bytes = pdf_file.read()
-                        
-                        # Create download button
-                        # Ensure the reports directory exists
-                        reports_dir = "report"
-                        os.makedirs(reports_dir, exist_ok=True)
-                        report_path = os.path.join(reports_dir, "analysis_report.pdf")
-
-                        # Save the PDF file to the reports folder
-                        with open(report_path, "wb") as f:
-                            f.write(pdf_bytes)
-
-                        # Create download button for the file in the reports folder
-                        st.download_button(
-                            label="Download PDF Report",
-                            data=pdf_bytes,
-                            file_name="analysis_report.pdf",
-                            mime="application/pdf"
-                        )
-                        st.success("Report generated successfully! Click the download button above to get your PDF.")
-                    else:
-                        st.error("Failed to generate the report. Please try again.")
+            suggested_charts_tab(data_hash)
+
         with tab4:
-            st.header("Custom Charts 📈")
-            st.write("You can create custom charts based on the dataset.")
-            Column_data = pd.DataFrame(df)
-            
-            # Show sample of the data
-            st.write("Sample of your data:")
-            st.write(Column_data.head())
-            
-            # Chart selection and configuration
-            chart_type = st.selectbox("Select Chart Type", ["Bar", "Line", "Scatter", "Pie", "Histogram", "Heatmap"])
-            y_columns = st.selectbox("Select Y Column", Column_data.columns) if chart_type != "Heatmap" else None
-            x_columns = st.selectbox("Select X Column", Column_data.columns) if chart_type not in ["Pie", "Histogram", "Heatmap"]else None
-            
-            if st.button("Generate Custom Chart"):
-                try:
-                    if chart_type == "Scatter":
-                        fig, ax = plt.subplots(figsize=(10, 6))
-                        ax.scatter(Column_data[x_columns], Column_data[y_columns])
-                        ax.set_xlabel(x_columns)
-                        ax.set_ylabel(y_columns)
-                        st.pyplot(fig, use_container_width=True)
-                    
-                    elif chart_type == "Bar":
-                        fig, ax = plt.subplots(figsize=(10, 6))
-                        ax.bar(Column_data[x_columns], Column_data[y_columns])
-                        ax.set_xlabel(x_columns)
-                        ax.set_ylabel(y_columns)
-                        plt.xticks(rotation=45)
-                        plt.tight_layout()
-                        st.pyplot(fig, use_container_width=True)
-                    
-                    elif chart_type == "Line":
-                        fig, ax = plt.subplots(figsize=(10, 6))
-                        ax.plot(Column_data[x_columns], Column_data[y_columns])
-                        ax.set_xlabel(x_columns)
-                        ax.set_ylabel(y_columns)
-                        plt.tight_layout()
-                        st.pyplot(fig, use_container_width=True)
-                    
-                    elif chart_type == "Pie":
-                        fig, ax = plt.subplots(figsize=(10, 6))
-                        # Group data for pie chart
-                        pie_data = Column_data[y_columns].value_counts()
-                        ax.pie(pie_data.values, labels=pie_data.index, autopct='%1.1f%%')
-                        ax.axis('equal')
-                        plt.title(f"Distribution of {y_columns}")
-                        st.pyplot(fig, use_container_width=True)
-                    
-                    elif chart_type == "Histogram":
-                        fig, ax = plt.subplots(figsize=(10, 6))
-                        ax.hist(Column_data[y_columns], bins=30, edgecolor='black')
-                        ax.set_xlabel(y_columns)
-                        ax.set_ylabel('Frequency')
-                        plt.tight_layout()
-                        st.pyplot(fig, use_container_width=True)
-                    
-                    elif chart_type == "Heatmap":
-                        fig, ax = plt.subplots(figsize=(12, 8))
-                        correlation_matrix = Column_data.corr()
-                        im = ax.imshow(correlation_matrix, cmap='coolwarm')
-                        
-                        # Add colorbar
-                        plt.colorbar(im, label='Correlation Coefficient')
-                        
-                        # Add labels
-                        ax.set_xticks(range(len(correlation_matrix.columns)))
-                        ax.set_yticks(range(len(correlation_matrix.columns)))
-                        ax.set_xticklabels(correlation_matrix.columns, rotation=45, ha='right')
-                        ax.set_yticklabels(correlation_matrix.columns)
-                        
-                        # Add correlation values
-                        for i in range(len(correlation_matrix.columns)):
-                            for j in range(len(correlation_matrix.columns)):
-                                text = ax.text(j, i, f'{correlation_matrix.iloc[i, j]:.2f}',
-                                             ha='center', va='center', 
-                                             color='white' if abs(correlation_matrix.iloc[i, j]) > 0.5 else 'black')
-                        
-                        plt.title("Correlation Heatmap")
-                        plt.tight_layout()
-                        st.pyplot(fig, use_container_width=True)
-
-                        
-                except Exception as e:
-                    st.error(f"Could not render custom chart due to: {e}")
-                    st.write("Please make sure you've selected appropriate columns for the chart type.")
-
-                     
+            custom_charts_tab(data_hash)
+
+        with tab5:
+            download_tab(data_hash)
+
 else:
     st.warning("Please upload a CSV file to generate insights and visualizations.")
     st.markdown("Upload a CSV file from the **Upload Data-Sets** page to get started.")
-st.markdown("---")    
\ No newline at end of file
+st.markdown("---")
+
+render_perf_panel(end_trace(page_trace))
@@ -1,6 +1,10 @@
 import streamlit as st 
 import pandas as pd
-from utils.gemini_ai import context_detection, generate_report
+from utils.fingerprint import dataset_hash
+from utils.frontend_data import paged_preview
+from utils import columnar, profiling, sessions, versioning
+from utils.tracing import span, start_trace, end_trace
+from utils.perf_panel import render_perf_panel
 
 st.set_page_config(
     page_title="Upload Data-Sets",
@@ -8,12 +12,16 @@ st.set_page_config(
     layout="wide",
     initial_sidebar_state="expanded",
 )
+page_trace = start_trace("page.upload_data")
+sessions.touch()
 
 class Pages_switch():
     st.sidebar.page_link("main.py", label="Home 🏠")
     st.sidebar.page_link("pages/upload_data.py", label="Upload Data-Sets 📂")
+    st.sidebar.page_link("pages/compare.py", label="Compare Data-Sets ⚖️")
     st.sidebar.page_link("pages/report.py", label="Data-Set report 📄")
     st.sidebar.page_link("pages/Q&A.py", label="Q&A with Dattavism ❓")
+    st.sidebar.page_link("pages/history.py", label="Analysis History 🕘")
 
 
 st.title("📂 Upload Your Dataset")
@@ -25,16 +33,84 @@ uploaded_file = st.file_uploader(
     help="Upload a CSV file to analyze. The file should contain structured data with headers.",
 )
 
-if uploaded_file is not None:
+large_file_mode = st.toggle(
+    "Large file mode",
+    value=False,
+    disabled=not columnar.is_available(),
+    help="Stores the dataset as Parquet on disk and profiles it out-of-core, so files larger than memory can be analysed. Requires duckdb.",
+)
+if large_file_mode:
+    server_path = None
+    # Only offered when the operator allows a directory, see columnar.SERVER_DATA_DIR
+    if columnar.SERVER_DATA_DIR:
+        server_path = st.text_input(
+            "Or analyse a CSV file already on the server",
+            placeholder="extracts/sales_2024.csv",
+            help=f"Files in {columnar.SERVER_DATA_DIR} on the server are read in place, without the upload size limit.",
+        )
+    source = uploaded_file if uploaded_file is not None else (server_path or None)
+else:
+    # The Parquet copy of a large upload is not needed any more
+    previous = st.session_state.pop("dataset", None)
+    if previous is not None:
+        previous.delete()
+    source = uploaded_file
+
+if source is not None:
     try : 
-        df = pd.read_csv(uploaded_file)
+        if large_file_mode:
+            if isinstance(source, str):
+                source = columnar.resolve_server_path(source)
+            source_id = getattr(source, "file_id", source)
+            if st.session_state.get("dataset_source") != source_id:
+                with st.spinner("Converting the dataset to Parquet..."), span("upload.to_parquet"):
+                    dataset = columnar.ColumnarDataset.from_csv(source)
+                # The Parquet file lives as long as the upload: until it is replaced or the session ends
+                previous = st.session_state.get("dataset")
+                if previous is not None:
+                    previous.delete()
+                sessions.own_file(dataset.path)
+                st.session_state["dataset"] = dataset
+                st.session_state["dataset_source"] = source_id
+            dataset = st.session_state["dataset"]
+            # The model prompts and row-level charts work on a sample, profiling runs on the full data
+            df = dataset.sample()
+            filename = dataset.name
+        else:
+            with span("upload.read_csv", **{"file.bytes": getattr(source, "size", None)}) as read_span:
+                df = pd.read_csv(source)
+                read_span.set("rows", len(df))
+                read_span.set("memory.dataframe_bytes", int(df.memory_usage(deep=True).sum()))
+            sessions.check_fits(df)
+            dataset = df
+            filename = source.name.strip(".csv")
         st.session_state["df"] = df
-        st.session_state["filename"] = uploaded_file.name.strip(".csv")
+        with span("upload.dataset_hash"):
+            st.session_state["dataset_hash"] = dataset_hash(df)
+        st.session_state["filename"] = filename
+        if not large_file_mode:
+            # Compare with the previous upload of the same file name, once per dataset
+            version = st.session_state.get("dataset_version")
+            if version is None or version["data_hash"] != st.session_state["dataset_hash"] or version["name"] != filename:
+                with span("upload.register_version"):
+                    version = versioning.get_store().register(filename, df)
+                st.session_state["dataset_version"] = version
+        else:
+            st.session_state.pop("dataset_version", None)
         st.success("File uploaded successfully!") 
+        version = st.session_state.get("dataset_version")
+        if version and version["kind"] == "append":
+            st.info(f"{version['delta_rows']:,} rows were appended since the last upload of {filename}. The report will be updated with what changed instead of being generated again.")
+        if large_file_mode:
+            st.caption(f"{len(dataset):,} rows stored as Parquet; previews and AI analysis use a {len(df):,}-row sample.")
         st.write("### Preview of Dataset:")
-        st.write(df.head())
+        paged_preview(dataset, key="upload_preview")
         st.write("### Dataset Summary:")
-        st.write(df.describe())
+        with span("upload.describe"):
+            summary = profiling.describe(dataset)
+        st.write(summary)
+        if summary.attrs.get("approximate"):
+            st.caption(summary.attrs["error_note"])
     except Exception as e:
         st.error(f"Error reading the file: {e}")
 
@@ -43,5 +119,5 @@ if uploaded_file is not None:
         on_click=lambda: st.toast("Dataset sent for analysis! Please wait for the report.",icon="📄")
     )
     st.markdown("---")
-    
 
+render_perf_panel(end_trace(page_trace))
@@ -0,0 +1,261 @@
+import numpy as np
+import pandas as pd
+from utils.profiling import nunique
+from utils import segmentation, timeseries
+from utils.tracing import traced
+
+# Distinct values per non-missing row above which a text column is left out of the top values,
+# as identifiers, dates stored as text and free text have no frequent values to report
+MAX_CATEGORY_SHARE = 0.5
+
+
+def markdown_table(df, index_label=None, float_format="{:,.2f}"):
+    """
+    Renders a DataFrame as a markdown table.
+
+    Args:
+        df (pandas.DataFrame): Table to render
+        index_label (str, optional): Header of the index column. The index is dropped if None.
+        float_format (str): Format applied to floating point values
+
+    Returns:
+        str: Markdown table ending with a newline, in the layout expected by
+            EnhancedReportGenerator.parse_markdown_table
+    """
+    def cell(value):
+        if value is None or value is pd.NA or value is pd.NaT:
+            return ""
+        if isinstance(value, (float, np.floating)):
+            return "" if np.isnan(value) else float_format.format(value)
+        return str(value).replace("|", "/").replace("\n", " ")
+
+    header = ([index_label] if index_label is not None else []) + [str(c) for c in df.columns]
+    lines = ["| " + " | ".join(header) + " |", "|" + "|".join(["---"] * len(header)) + "|"]
+    for idx, row in zip(df.index, df.itertuples(index=False)):
+        values = ([cell(idx)] if index_label is not None else []) + [cell(v) for v in row]
+        lines.append("| " + " | ".join(values) + " |")
+    return "\n".join(lines) + "\n"
+
+
+def numeric_summary(df):
+    """
+    Computes mean, median, mode, min, max and standard deviation of every numeric column.
+
+    Args:
+        df (pandas.DataFrame): Dataset to summarize
+
+    Returns:
+        pandas.DataFrame: One row per numeric column
+    """
+    numeric = df.select_dtypes(include="number")
+    if numeric.empty:
+        return pd.DataFrame()
+    summary = numeric.agg(["mean", "median", "min", "max", "std"]).T
+    modes = numeric.apply(lambda column: column.value_counts().idxmax() if column.notna().any() else np.nan)
+    summary.insert(2, "mode", modes)
+    return summary
+
+
+def categorical_top_values(df, k=5, max_columns=5):
+    """
+    Finds the most frequent values of the categorical columns.
+
+    Args:
+        df (pandas.DataFrame): Dataset to analyze
+        k (int): Number of values reported per column
+        max_columns (int): Number of categorical columns reported, fewest distinct values first
+
+    Returns:
+        pandas.DataFrame: Rows of column, value, count and percentage of non-null rows; columns
+            with more than MAX_CATEGORY_SHARE distinct values per row are left out
+    """
+    categorical = df.select_dtypes(exclude=["number", "datetime"])
+    distinct = nunique(categorical) if not categorical.empty else pd.Series(dtype="int64")
+    present = categorical.notna().sum()
+    distinct = distinct[distinct <= MAX_CATEGORY_SHARE * present.reindex(distinct.index)]
+    columns = distinct.sort_values().index[:max_columns]
+    rows = []
+    for column in columns:
+        counts = categorical[column].value_counts()
+        total = counts.sum()
+        for value, count in counts.head(k).items():
+            rows.append({"column": column, "value": value, "count": int(count), "percent": 100 * count / total})
+    return pd.DataFrame(rows)
+
+
+def correlation_pairs(df, k=5):
+    """
+    Extracts the strongest correlations between numeric columns.
+
+    Args:
+        df (pandas.DataFrame): Dataset to analyze
+        k (int): Number of column pairs returned
+
+    Returns:
+        pandas.DataFrame: Rows of column pair and Pearson correlation, strongest (by absolute value) first
+    """
+    numeric = df.select_dtypes(include="number")
+    if numeric.shape[1] < 2:
+        return pd.DataFrame(columns=["column_a", "column_b", "correlation"])
+    matrix = numeric.corr().to_numpy()
+    rows, cols = np.triu_indices_from(matrix, k=1)
+    values = matrix[rows, cols]
+    valid = ~np.isnan(values)
+    rows, cols, values = rows[valid], cols[valid], values[valid]
+    order = np.argsort(-np.abs(values))[:k]
+    return pd.DataFrame({
+        "column_a": numeric.columns[rows[order]],
+        "column_b": numeric.columns[cols[order]],
+        "correlation": values[order],
+    })
+
+
+def missing_values(df, k=5):
+    """
+    Ranks columns by their share of missing values.
+
+    Args:
+        df (pandas.DataFrame): Dataset to analyze
+        k (int): Number of columns returned
+
+    Returns:
+        pandas.DataFrame: Missing count and percentage for the k columns with the most missing
+            values; columns without missing values are left out
+    """
+    counts = df.isna().sum()
+    counts = counts[counts > 0]
+    table = pd.DataFrame({"missing": counts, "percent": 100 * counts / max(len(df), 1)})
+    return table.sort_values("missing", ascending=False).head(k)
+
+
+def unique_counts(df, k=None):
+    """
+    Counts distinct values per column.
+
+    Args:
+        df (pandas.DataFrame): Dataset to analyze
+        k (int, optional): If given, only the k columns with the most distinct values are returned
+
+    Returns:
+        pandas.DataFrame: Distinct count and distinct ratio per column, most distinct first.
+            Estimated with sketches for datasets above profiling.APPROXIMATE_MIN_ROWS rows.
+    """
+    counts = nunique(df)
+    table = pd.DataFrame({"unique": counts, "unique_ratio": counts / max(len(df), 1)})
+    table = table.sort_values("unique", ascending=False)
+    return table.head(k) if k else table
+
+
+def outlier_counts(df, z_threshold=3.0, iqr_factor=1.5):
+    """
+    Counts outliers in every numeric column using the IQR rule and z-scores.
+
+    Args:
+        df (pandas.DataFrame): Dataset to analyze
+        z_threshold (float): Absolute z-score above which a value is an outlier
+        iqr_factor (float): Multiple of the interquartile range beyond the quartiles
+
+    Returns:
+        pandas.DataFrame: IQR bounds, IQR outlier count and z-score outlier count per numeric column
+    """
+    numeric = df.select_dtypes(include="number")
+    if numeric.empty:
+        return pd.DataFrame()
+    quartiles = numeric.quantile([0.25, 0.75])
+    q1, q3 = quartiles.loc[0.25], quartiles.loc[0.75]
+    spread = q3 - q1
+    lower, upper = q1 - iqr_factor * spread, q3 + iqr_factor * spread
+    std = numeric.std().replace(0, np.nan)
+    z_scores = (numeric - numeric.mean()).abs() / std
+    return pd.DataFrame({
+        "lower_bound": lower,
+        "upper_bound": upper,
+        "iqr_outliers": (numeric.lt(lower) | numeric.gt(upper)).sum(),
+        "z_outliers": z_scores.gt(z_threshold).sum(),
+    })
+
+
+@traced("analytics.compute_statistics")
+def compute_statistics(df, k=5, segments=None):
+    """
+    Computes every statistic used by the analysis report.
+
+    Args:
+        df (pandas.DataFrame): Dataset to analyze
+        k (int): Number of entries in each top-k ranking
+        segments (segmentation.Segmentation, optional): Result of segmentation.analyze for df,
+            e.g. one the report page already cached; computed here if not given
+
+    Returns:
+        dict: Mapping of table name to pandas.DataFrame:
+            - numeric_summary: mean, median, mode, min, max, std per numeric column
+            - top_categories: most frequent values of the categorical columns
+            - top_correlations: strongest correlations between numeric columns
+            - missing_values: columns with the highest share of missing values
+            - unique_counts: columns with the most distinct values
+            - outliers: IQR, z-score and robust (MAD) z-score outlier counts per numeric column
+            - top_averages: numeric columns with the highest mean
+            - trends: trend and seasonality over time, if the dataset has a datetime column
+            - change_points: level shifts over time, if the dataset has a datetime column
+            - segments: size, share and feature means of each segment found by k-means
+            - anomalies: rows with the highest anomaly scores and their most extreme feature
+
+    Example:
+        >>> stats = compute_statistics(pd.read_csv("sales_data.csv"))
+        >>> stats["top_correlations"]
+    """
+    summary = numeric_summary(df)
+    series = timeseries.analyze(df)
+    segments = segments if segments is not None else segmentation.analyze(df)
+    outliers = outlier_counts(df)
+    if segments and not outliers.empty:
+        outliers["mad_outliers"] = segments.extreme_counts().reindex(outliers.index)
+    return {
+        "numeric_summary": summary,
+        "top_categories": categorical_top_values(df, k=k),
+        "top_correlations": correlation_pairs(df, k=k),
+        "missing_values": missing_values(df, k=k),
+        "unique_counts": unique_counts(df, k=k),
+        "outliers": outliers,
+        "top_averages": summary[["mean"]].sort_values("mean", ascending=False).head(k) if not summary.empty else summary,
+        "trends": series.trends() if series else pd.DataFrame(),
+        "change_points": series.change_point_table() if series else pd.DataFrame(),
+        "segments": segments.clusters() if segments else pd.DataFrame(),
+        "anomalies": segments.anomalies(k=2 * k) if segments else pd.DataFrame(),
+    }
+
+
+def statistics_to_markdown(stats, max_rows=None):
+    """
+    Renders the output of compute_statistics as markdown report sections.
+
+    Args:
+        stats (dict): Output of compute_statistics
+        max_rows (int, optional): Rows kept of each table, for prompts with a token budget
+
+    Returns:
+        str: Markdown with one subsection and table per statistic, suitable for PDF conversion
+    """
+    sections = [
+        ("Numerical Columns", "numeric_summary", "Column"),
+        ("Most Frequent Categories", "top_categories", None),
+        ("Strongest Correlations", "top_correlations", None),
+        ("Missing Values", "missing_values", "Column"),
+        ("Columns With The Most Unique Values", "unique_counts", "Column"),
+        ("Outliers", "outliers", "Column"),
+        ("Highest Average Values", "top_averages", "Column"),
+        ("Trends And Seasonality", "trends", "Column"),
+        ("Change Points", "change_points", None),
+        ("Segments", "segments", "Segment"),
+        ("Top Anomalies", "anomalies", None),
+    ]
+    parts = []
+    for title, key, index_label in sections:
+        table = stats.get(key)
+        if table is None or table.empty:
+            continue
+        if max_rows and len(table) > max_rows:
+            table = table.head(max_rows)
+            title = f"{title} (first {max_rows} rows)"
+        parts.append(f"### {title}\n\n{markdown_table(table, index_label=index_label)}")
+    return "\n".join(parts)
@@ -0,0 +1,173 @@
+import math
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from utils.fingerprint import text_hash
+from utils.retrieval import tokenize
+
+
+def normalize_question(question):
+    """
+    Normalizes a question so trivially different phrasings share a cache entry.
+
+    Args:
+        question (str): Question as typed by the user
+
+    Returns:
+        str: Lowercase question with punctuation removed and whitespace collapsed
+
+    Example:
+        >>> normalize_question("  Which region grew FASTEST?? ")
+        'which region grew fastest'
+    """
+    return " ".join(re.sub(r"[^\w\s]", " ", str(question).lower()).split())
+
+
+def history_digest(history):
+    """
+    Identifies the conversation a question was asked in.
+
+    Args:
+        history (str or list): Earlier turns as "role: content" lines or {"role", "content"}
+            messages, without the question itself
+
+    Returns:
+        str: Empty for a conversation's first question, otherwise a hash of the earlier turns
+    """
+    if isinstance(history, list):
+        history = "\n".join(f"{m['role']}: {m['content']}" for m in history)
+    history = str(history or "").strip()
+    return text_hash(history) if history else ""
+
+
+def _cosine(a, b):
+    dot = sum(count * b.get(term, 0) for term, count in a.items())
+    norm = math.sqrt(sum(v * v for v in a.values())) * math.sqrt(sum(v * v for v in b.values()))
+    return dot / norm if norm else 0.0
+
+
+class AnswerCache:
+    """
+    Thread-safe LRU cache of Q&A answers shared by every session.
+
+    Entries are scoped to a dataset hash, a report hash and the conversation before the
+    question, so answers are never reused once the dataset or its report changes, and a
+    follow-up such as "and the second one?" only reuses answers given after the same turns.
+    Answers for an earlier report are not dropped when a new one arrives: sessions may still
+    be on either report, and unused entries age out of the LRU order.
+
+    Args:
+        max_entries (int): Number of answers kept before the least recently used is evicted
+        ttl_seconds (float): Age after which an answer expires
+        similarity (float or None): Minimum cosine similarity for a near-duplicate question
+            to reuse an answer. None, the default, only reuses answers to the same normalized
+            question; questions differing by one word can need different answers.
+
+    Example:
+        >>> cache = AnswerCache()
+        >>> cache.put(data_hash, report_hash, "Which region grew fastest?", answer)
+        >>> cache.get(data_hash, report_hash, "which region grew fastest")
+    """
+
+    def __init__(self, max_entries=512, ttl_seconds=24 * 3600, similarity=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity = similarity
+        self.entries = OrderedDict()
+        self.lock = threading.RLock()
+
+    def _evict(self, key):
+        self.entries.pop(key, None)
+
+    def _expired(self, entry, now):
+        return now - entry["created"] > self.ttl_seconds
+
+    def get(self, data_hash, report_hash, question, history=""):
+        """
+        Looks up a cached answer.
+
+        Args:
+            data_hash (str): Hash of the dataset, see fingerprint.dataset_hash
+            report_hash (str): Hash of the report the answer was based on
+            question (str): Question as typed by the user
+            history (str or list): Earlier turns of the conversation, see history_digest
+
+        Returns:
+            str or None: The cached answer, or None on a miss
+        """
+        normalized = normalize_question(question)
+        now = time.time()
+        with self.lock:
+            key = (data_hash, report_hash, history_digest(history), normalized)
+            entry = self.entries.get(key)
+            if entry is None and self.similarity is not None:
+                terms = Counter(tokenize(normalized))
+                best = 0.0
+                for candidate_key, candidate in self.entries.items():
+                    if candidate_key[:3] != key[:3]:
+                        continue
+                    score = _cosine(terms, candidate["terms"])
+                    if score >= self.similarity and score > best:
+                        best, key, entry = score, candidate_key, candidate
+            if entry is None:
+                return None
+            if self._expired(entry, now):
+                self._evict(key)
+                return None
+            self.entries.move_to_end(key)
+            return entry["answer"]
+
+    def put(self, data_hash, report_hash, question, answer, history=""):
+        """
+        Stores an answer, evicting expired and least recently used entries as needed.
+
+        Args:
+            data_hash (str): Hash of the dataset
+            report_hash (str): Hash of the report the answer was based on
+            question (str): Question as typed by the user
+            answer (str): Complete answer text
+            history (str or list): Earlier turns of the conversation, see history_digest
+        """
+        normalized = normalize_question(question)
+        now = time.time()
+        with self.lock:
+            key = (data_hash, report_hash, history_digest(history), normalized)
+            self.entries[key] = {
+                "answer": answer,
+                "terms": Counter(tokenize(normalized)),
+                "created": now,
+            }
+            self.entries.move_to_end(key)
+            for stale in [k for k, entry in self.entries.items() if self._expired(entry, now)]:
+                self._evict(stale)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, data_hash):
+        """
+        Drops every cached answer for a dataset.
+
+        Args:
+            data_hash (str): Hash of the dataset whose answers are removed
+        """
+        with self.lock:
+            for key in [k for k in self.entries if k[0] == data_hash]:
+                self._evict(key)
+
+    @staticmethod
+    def stream(answer, words_per_chunk=8):
+        """
+        Yields a stored answer in small pieces so it renders like a streamed response.
+
+        Args:
+            answer (str): Cached answer text
+            words_per_chunk (int): Number of words per yielded piece
+
+        Yields:
+            str: Consecutive pieces of the answer, including their whitespace
+        """
+        pieces = re.findall(r"\S+\s*|\s+", answer)
+        for i in range(0, len(pieces), words_per_chunk):
+            yield "".join(pieces[i:i + words_per_chunk])
+
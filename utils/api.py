@@ -0,0 +1,542 @@
+"""
+HTTP API for analysis jobs, for tools that cannot use the browser UI.
+
+    python -m utils.api --port 8600 --workers 2
+    python -m utils.api --llm-backend fake        # local testing without Gemini
+
+Endpoints:
+    POST /jobs                          Submit a CSV (raw body or multipart field "file") -> 202 with the job
+    GET  /jobs/<id>                     Job status and artifact URLs
+    GET  /jobs/<id>/artifacts/<name>    Download an artifact (pdf, report, context, statistics, charts, chart_<n>)
+    GET  /jobs/<id>/answer?q=<question> Answer a question as server-sent events
+    GET  /health                        Queue sizes
+
+Analyses run in a bounded process pool and questions in a bounded thread pool. When
+more work is waiting than the configured limits allow, requests get 429 with a
+Retry-After header instead of queueing without bound.
+
+Answers are generated in full before the first event is sent; the events then carry the
+finished answer a few words at a time, so clients can use the same code for cached and new
+answers. They are not streamed while the model writes.
+"""
+import argparse
+import asyncio
+import email.message
+import json
+import mmap
+import mimetypes
+import os
+import secrets
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import tornado.httputil
+import tornado.web
+
+from utils.answer_cache import AnswerCache
+from utils.batch import analyze_dataset
+from utils.fingerprint import text_hash
+from utils.tracing import span
+
+# Directory job inputs and artifacts are written to
+JOBS_DIR = os.getenv("DATTAVISM_API_JOBS_DIR", "api_jobs")
+
+# Largest accepted upload
+MAX_UPLOAD_BYTES = 512 * 1024 * 1024
+
+# Largest body of any other request; only POST /jobs carries data
+MAX_REQUEST_BYTES = 64 * 1024
+
+# Bytes copied at a time when a multipart upload is unpacked from disk
+COPY_CHUNK_BYTES = 1024 * 1024
+
+# Seconds a finished job and its files are kept before they are removed
+JOB_TTL_SECONDS = 24 * 3600
+
+# Finished jobs kept at most; the oldest are removed first
+MAX_FINISHED_JOBS = 200
+
+# Seconds clients are asked to wait after a 429
+RETRY_AFTER_SECONDS = 5
+
+
+class QueueFull(Exception):
+    """Raised when a job or question is rejected because the service is at capacity."""
+
+
+class Job:
+    """
+    One submitted dataset and the state of its analysis.
+
+    Args:
+        job_id (str): Identifier used in the URLs
+        name (str): Display name of the dataset
+        directory (str): Directory holding the input file and the artifacts
+        refine (bool): Let the model re-rank the chart suggestions
+    """
+
+    def __init__(self, job_id, name, directory, refine=False):
+        self.id = job_id
+        self.name = name
+        self.directory = directory
+        self.input_path = os.path.join(directory, "input.csv")
+        self.refine = refine
+        self.status = "queued"
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.error = None
+        self.artifacts = {}
+        self.qa_state = None
+        self.qa_lock = threading.Lock()
+
+    def to_dict(self, base_url=""):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "status": self.status,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "seconds": self.finished - self.started if self.finished and self.started else None,
+            "error": self.error,
+            "artifacts": {name: f"{base_url}/jobs/{self.id}/artifacts/{name}" for name in self.artifacts},
+        }
+
+
+def _run_analysis(input_path, output_dir, name, refine):
+    # Runs in a worker process; the dataset name replaces "input" in the PDF title
+    return analyze_dataset(input_path, output_dir, refine=refine, name=name)
+
+
+def _init_worker(llm_backend):
+    if llm_backend:
+        from utils import llm
+        llm.set_backend(llm_backend)
+
+
+class AnalysisService:
+    """
+    Runs analysis jobs and answers questions about finished jobs with bounded concurrency.
+
+    Args:
+        jobs_dir (str): Directory for job inputs and artifacts
+        workers (int): Analyses running at the same time, each in its own process
+        max_pending_jobs (int): Jobs queued or running before new submissions get 429
+        qa_workers (int): Questions answered at the same time
+        max_pending_questions (int): Questions waiting or running before new ones get 429
+        llm_backend (str, optional): Model backend, e.g. "fake" for local testing
+        job_ttl_seconds (float): Seconds a finished job is kept
+        max_finished_jobs (int): Finished jobs kept at most
+
+    Notes:
+        Finished jobs expire after job_ttl_seconds, and beyond max_finished_jobs the
+        oldest go first. Their directories are removed with them, as are directories
+        in jobs_dir left by an earlier run once they are older than job_ttl_seconds.
+
+    Example:
+        >>> service = AnalysisService("api_jobs", workers=2)
+        >>> job = service.submit(csv_bytes, "sales")
+    """
+
+    def __init__(self, jobs_dir=JOBS_DIR, workers=2, max_pending_jobs=16, qa_workers=4,
+                 max_pending_questions=32, llm_backend=None, job_ttl_seconds=JOB_TTL_SECONDS,
+                 max_finished_jobs=MAX_FINISHED_JOBS):
+        self.jobs_dir = jobs_dir
+        self.jobs = {}
+        self.job_ttl_seconds = job_ttl_seconds
+        self.max_finished_jobs = max_finished_jobs
+        self.max_pending_jobs = max_pending_jobs
+        self.max_pending_questions = max_pending_questions
+        self.pending_questions = 0
+        self._job_slots = asyncio.Semaphore(workers)
+        self._pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(llm_backend,))
+        self._qa_pool = ThreadPoolExecutor(max_workers=qa_workers, thread_name_prefix="dattavism-qa")
+        self._answer_cache = AnswerCache()
+        _init_worker(llm_backend)
+
+    @property
+    def pending_jobs(self):
+        return sum(1 for job in self.jobs.values() if job.status in ("queued", "running"))
+
+    def evict(self):
+        """
+        Removes expired finished jobs and their files.
+
+        Returns:
+            int: Number of jobs removed
+        """
+        cutoff = time.time() - self.job_ttl_seconds
+        finished = sorted((job for job in self.jobs.values() if job.finished), key=lambda job: job.finished)
+        excess = max(0, len(finished) - self.max_finished_jobs)
+        expired = [job for i, job in enumerate(finished) if i < excess or job.finished < cutoff]
+        for job in expired:
+            del self.jobs[job.id]
+            shutil.rmtree(job.directory, ignore_errors=True)
+        # Directories of jobs from an earlier run, and uploads cut off by a crash, are no longer reachable
+        if os.path.isdir(self.jobs_dir):
+            for entry in os.scandir(self.jobs_dir):
+                if entry.name in self.jobs or entry.stat().st_mtime >= cutoff:
+                    continue
+                if entry.is_dir():
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                elif entry.name.endswith(".part"):
+                    os.remove(entry.path)
+        return len(expired)
+
+    def submit(self, data, name, refine=False):
+        """
+        Stores an uploaded CSV file and schedules its analysis.
+
+        Args:
+            data (bytes or str): Content of the CSV file, or the path of a file on disk that
+                is moved into the job directory
+            name (str): Display name of the dataset
+            refine (bool): Let the model re-rank the chart suggestions
+
+        Returns:
+            Job: The queued job
+
+        Raises:
+            QueueFull: If max_pending_jobs jobs are already queued or running
+        """
+        if self.pending_jobs >= self.max_pending_jobs:
+            raise QueueFull(f"{self.pending_jobs} analysis jobs are already waiting")
+        self.evict()
+        job_id = secrets.token_hex(8)
+        job = Job(job_id, name, os.path.join(self.jobs_dir, job_id), refine=refine)
+        os.makedirs(job.directory, exist_ok=True)
+        if isinstance(data, str):
+            os.replace(data, job.input_path)
+        else:
+            with open(job.input_path, "wb") as f:
+                f.write(data)
+        self.jobs[job_id] = job
+        asyncio.ensure_future(self._run(job))
+        return job
+
+    async def _run(self, job):
+        async with self._job_slots:
+            job.status = "running"
+            job.started = time.time()
+            try:
+                future = self._pool.submit(_run_analysis, job.input_path, job.directory, job.name, job.refine)
+                job.artifacts = await asyncio.wrap_future(future)
+                job.status = "done"
+            except Exception as e:
+                job.status = "failed"
+                job.error = f"{type(e).__name__}: {e}"
+            finally:
+                job.finished = time.time()
+
+    def _qa_state(self, job):
+        # Loaded once per job in a Q&A thread: the dataset, the texts and the retrieval index
+        with job.qa_lock:
+            if job.qa_state is None:
+                import pandas as pd
+                from utils.retrieval import build_qa_index
+                from utils.fingerprint import dataset_hash
+
+                def read(name):
+                    with open(job.artifacts[name], encoding="utf-8") as f:
+                        return f.read()
+
+                df = pd.read_csv(job.input_path)
+                report, context = read("report"), read("context")
+                plots = json.loads(read("charts"))
+                job.qa_state = {
+                    "df": df,
+                    "report": report,
+                    "plots": plots,
+                    "index": build_qa_index(report, context, plots),
+                    "scope": (dataset_hash(df), text_hash(report, context)),
+                }
+            return job.qa_state
+
+    def _answer(self, job, question, history):
+        from utils.gemini_ai import answer_user_query
+        state = self._qa_state(job)
+        with span("api.answer", **{"job.id": job.id}) as answer_span:
+            cached = self._answer_cache.get(*state["scope"], question, history=history)
+            answer_span.set("cache.hit", cached is not None)
+            if cached is not None:
+                return cached
+            answer = answer_user_query(state["report"], question, history, state["df"], state["plots"], index=state["index"])
+            self._answer_cache.put(*state["scope"], question, answer, history=history)
+            return answer
+
+    async def answer(self, job, question, history=""):
+        """
+        Answers a question about a finished job in the Q&A thread pool.
+
+        Args:
+            job (Job): Finished job
+            question (str): The user's question
+            history (str): Earlier conversation, if any
+
+        Returns:
+            str: The answer
+
+        Raises:
+            QueueFull: If max_pending_questions questions are already waiting or running
+        """
+        if self.pending_questions >= self.max_pending_questions:
+            raise QueueFull(f"{self.pending_questions} questions are already waiting")
+        self.pending_questions += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._qa_pool, self._answer, job, question, history)
+        finally:
+            self.pending_questions -= 1
+
+    def shutdown(self):
+        self._pool.shutdown(cancel_futures=True)
+        self._qa_pool.shutdown(cancel_futures=True)
+
+
+class BaseHandler(tornado.web.RequestHandler):
+    @property
+    def service(self):
+        return self.settings["service"]
+
+    def write_error(self, status_code, **kwargs):
+        # send_error clears the headers, so Retry-After is set here rather than in reject
+        if status_code == 429:
+            self.set_header("Retry-After", str(RETRY_AFTER_SECONDS))
+        self.finish({"error": self._reason})
+
+    def reject(self, error):
+        raise tornado.web.HTTPError(429, reason=str(error))
+
+    def get_job(self, job_id):
+        job = self.service.jobs.get(job_id)
+        if job is None:
+            raise tornado.web.HTTPError(404, reason=f"Unknown job: {job_id}")
+        return job
+
+    @property
+    def base_url(self):
+        return f"{self.request.protocol}://{self.request.host}"
+
+
+def _header_params(name, value):
+    # Parameters of a header such as Content-Type or Content-Disposition, e.g. boundary or filename
+    message = email.message.Message()
+    message[name] = value
+    return dict(message.get_params(header=name, failobj=[])[1:])
+
+
+def _unpack_multipart(path, boundary, target):
+    """
+    Copies the part named "file" of a multipart body stored on disk to its own file.
+
+    Args:
+        path (str): File holding the request body
+        boundary (str): Multipart boundary from the Content-Type header
+        target (str): File the uploaded file is written to
+
+    Returns:
+        tuple: (file name sent by the client or None, dict of the other form fields as
+            lists of bytes), or (None, fields) without a "file" part
+
+    Notes:
+        The body is memory-mapped, so the upload is copied in COPY_CHUNK_BYTES slices and
+        never held in memory as a whole.
+    """
+    delimiter = b"\r\n--" + boundary.encode()
+    filename, fields = None, {}
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return filename, fields
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as body:
+            # The first delimiter has no line break before it
+            position = body.find(delimiter[2:])
+            while position >= 0:
+                start = body.find(b"\r\n", position) + 2
+                header_end = body.find(b"\r\n\r\n", start)
+                end = body.find(delimiter, header_end)
+                if start < 2 or header_end < 0 or end < 0:
+                    break
+                headers = tornado.httputil.HTTPHeaders.parse(body[start:header_end].decode("utf-8", "replace"))
+                disposition = _header_params("Content-Disposition", headers.get("Content-Disposition", ""))
+                content_start = header_end + 4
+                if disposition.get("name") == "file" and filename is None:
+                    filename = disposition.get("filename") or "dataset.csv"
+                    with open(target, "wb") as out:
+                        for offset in range(content_start, end, COPY_CHUNK_BYTES):
+                            out.write(body[offset:min(end, offset + COPY_CHUNK_BYTES)])
+                elif "name" in disposition:
+                    fields.setdefault(disposition["name"], []).append(body[content_start:end])
+                position = end + 2
+    return filename, fields
+
+
+@tornado.web.stream_request_body
+class JobsHandler(BaseHandler):
+    def prepare(self):
+        # Runs before the body is read, so uploads beyond capacity are rejected unread
+        if self.service.pending_jobs >= self.service.max_pending_jobs:
+            self.reject(QueueFull(f"{self.service.pending_jobs} analysis jobs are already waiting"))
+        self.request.connection.set_max_body_size(MAX_UPLOAD_BYTES)
+        # The body is streamed to disk as it arrives, never collected in memory
+        os.makedirs(self.service.jobs_dir, exist_ok=True)
+        self._body = tempfile.NamedTemporaryFile(dir=self.service.jobs_dir, suffix=".part", delete=False)
+
+    def data_received(self, chunk):
+        self._body.write(chunk)
+
+    def _discard(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def on_finish(self):
+        # Removes the body, and the unpacked upload, unless submit moved them into a job
+        body = getattr(self, "_body", None)
+        if body is not None:
+            body.close()
+            self._discard(body.name)
+            self._discard(body.name + ".csv")
+
+    def on_connection_close(self):
+        self.on_finish()
+
+    def post(self):
+        self._body.close()
+        path, filename = self._body.name, None
+        content_type = self.request.headers.get("Content-Type", "")
+        if content_type.startswith("multipart/form-data"):
+            boundary = _header_params("Content-Type", content_type).get("boundary")
+            if not boundary:
+                raise tornado.web.HTTPError(400, reason="Multipart upload without a boundary")
+            filename, fields = _unpack_multipart(path, boundary, path + ".csv")
+            # Streamed bodies are not parsed by tornado, so form fields are added to the arguments here
+            for key, values in fields.items():
+                self.request.body_arguments.setdefault(key, []).extend(values)
+                self.request.arguments.setdefault(key, []).extend(values)
+            path = path + ".csv" if filename is not None else None
+        if path is None or os.path.getsize(path) == 0:
+            raise tornado.web.HTTPError(400, reason="Send a CSV file as the request body or as the multipart field 'file'")
+        name = self.get_argument("name", None) or os.path.splitext(filename or "dataset")[0]
+        refine = self.get_argument("refine", "false").lower() in ("1", "true", "yes")
+        try:
+            job = self.service.submit(path, name, refine=refine)
+        except QueueFull as e:
+            self.reject(e)
+        self.set_status(202)
+        self.set_header("Location", f"/jobs/{job.id}")
+        self.write(job.to_dict(self.base_url))
+
+
+class JobHandler(BaseHandler):
+    def get(self, job_id):
+        self.write(self.get_job(job_id).to_dict(self.base_url))
+
+
+class ArtifactHandler(BaseHandler):
+    async def get(self, job_id, name):
+        job = self.get_job(job_id)
+        path = job.artifacts.get(name)
+        if path is None:
+            raise tornado.web.HTTPError(404, reason=f"Job {job_id} has no artifact {name} (status: {job.status})")
+        self.set_header("Content-Type", mimetypes.guess_type(path)[0] or "application/octet-stream")
+        self.set_header("Content-Disposition", f'attachment; filename="{job.name}-{os.path.basename(path)}"')
+        with open(path, "rb") as f:
+            while chunk := f.read(64 * 1024):
+                self.write(chunk)
+                await self.flush()
+
+
+class AnswerHandler(BaseHandler):
+    # The answer is complete before the first event; the events only split it into pieces
+    async def get(self, job_id):
+        job = self.get_job(job_id)
+        if job.status != "done":
+            raise tornado.web.HTTPError(409, reason=f"Job {job_id} is {job.status}, questions need a finished analysis")
+        question = self.get_argument("q")
+        try:
+            answer = await self.service.answer(job, question, self.get_argument("history", ""))
+        except QueueFull as e:
+            self.reject(e)
+        self.set_header("Content-Type", "text/event-stream")
+        self.set_header("Cache-Control", "no-cache")
+        for chunk in AnswerCache.stream(answer):
+            self.write(f"data: {json.dumps(chunk)}\n\n")
+            await self.flush()
+        self.write("event: done\ndata: {}\n\n")
+
+
+class HealthHandler(BaseHandler):
+    def get(self):
+        self.write({
+            "status": "ok",
+            "pending_jobs": self.service.pending_jobs,
+            "max_pending_jobs": self.service.max_pending_jobs,
+            "pending_questions": self.service.pending_questions,
+            "max_pending_questions": self.service.max_pending_questions,
+        })
+
+
+def make_app(service):
+    """
+    Creates the tornado application.
+
+    Args:
+        service (AnalysisService): Service the handlers delegate to
+
+    Returns:
+        tornado.web.Application: Application with the job, artifact, answer and health routes
+    """
+    job_id = r"([0-9a-f]+)"
+    return tornado.web.Application([
+        (r"/jobs", JobsHandler),
+        (rf"/jobs/{job_id}", JobHandler),
+        (rf"/jobs/{job_id}/artifacts/([\w.-]+)", ArtifactHandler),
+        (rf"/jobs/{job_id}/answer", AnswerHandler),
+        (r"/health", HealthHandler),
+    ], service=service)
+
+
+async def serve(port, **service_options):
+    service = AnalysisService(**service_options)
+    app = make_app(service)
+    # POST /jobs raises the limit to MAX_UPLOAD_BYTES for itself
+    app.listen(port, max_body_size=MAX_REQUEST_BYTES)
+    print(f"Dattavism API listening on http://localhost:{port}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        service.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP API for Dattavism analysis jobs")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--jobs-dir", default=JOBS_DIR, help="directory for job inputs and artifacts")
+    parser.add_argument("--workers", type=int, default=2, help="analyses running at the same time")
+    parser.add_argument("--max-pending-jobs", type=int, default=16, help="queued or running jobs before 429")
+    parser.add_argument("--qa-workers", type=int, default=4, help="questions answered at the same time")
+    parser.add_argument("--max-pending-questions", type=int, default=32, help="waiting or running questions before 429")
+    parser.add_argument("--job-ttl", type=float, default=JOB_TTL_SECONDS, help="seconds finished jobs are kept")
+    parser.add_argument("--max-finished-jobs", type=int, default=MAX_FINISHED_JOBS, help="finished jobs kept at most")
+    parser.add_argument("--llm-backend", choices=["gemini", "fake"], help="model backend, 'fake' for local testing")
+    args = parser.parse_args()
+    asyncio.run(serve(
+        args.port,
+        jobs_dir=args.jobs_dir,
+        workers=args.workers,
+        max_pending_jobs=args.max_pending_jobs,
+        qa_workers=args.qa_workers,
+        max_pending_questions=args.max_pending_questions,
+        llm_backend=args.llm_backend,
+        job_ttl_seconds=args.job_ttl,
+        max_finished_jobs=args.max_finished_jobs,
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,427 @@
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+import pandas as pd
+from utils.tracing import span, traced
+
+try:
+    import pyarrow  # noqa: F401
+except ImportError:
+    pyarrow = None
+
+# Directory of the artifact index and its content-addressed blobs
+ARTIFACTS_DIR = os.getenv("DATTAVISM_ARTIFACTS_DIR", os.path.join("data", "artifacts"))
+
+# Days an analysis is kept after it was last updated, unless it is pinned
+MAX_AGE_DAYS = float(os.getenv("DATTAVISM_ARTIFACT_MAX_AGE_DAYS", 90))
+
+# Analyses kept per user; the least recently updated unpinned ones are deleted first
+MAX_ANALYSES_PER_USER = int(os.getenv("DATTAVISM_ARTIFACT_MAX_PER_USER", 50))
+
+# Size of all blobs above which the least recently updated unpinned analyses are deleted
+MAX_STORE_BYTES = int(os.getenv("DATTAVISM_ARTIFACT_MAX_BYTES", 5 * 1024 ** 3))
+
+# Seconds between automatic retention runs, which happen when an analysis is saved
+RETENTION_INTERVAL_SECONDS = 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS analyses (
+    id INTEGER PRIMARY KEY,
+    dataset_hash TEXT NOT NULL,
+    dataset_name TEXT,
+    user TEXT NOT NULL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    rows INTEGER,
+    columns INTEGER,
+    pinned INTEGER NOT NULL DEFAULT 0,
+    UNIQUE (dataset_hash, user)
+);
+CREATE INDEX IF NOT EXISTS analyses_user_updated ON analyses (user, updated);
+CREATE INDEX IF NOT EXISTS analyses_updated ON analyses (updated);
+CREATE TABLE IF NOT EXISTS artifacts (
+    analysis_id INTEGER NOT NULL REFERENCES analyses (id) ON DELETE CASCADE,
+    kind TEXT NOT NULL,
+    encoding TEXT NOT NULL,
+    blob TEXT NOT NULL,
+    bytes INTEGER NOT NULL,
+    created REAL NOT NULL,
+    PRIMARY KEY (analysis_id, kind)
+);
+CREATE INDEX IF NOT EXISTS artifacts_blob ON artifacts (blob);
+"""
+
+_default_store = None
+
+
+def encode(value):
+    """
+    Serializes an artifact for storage.
+
+    Args:
+        value (object): Text, bytes, DataFrame, or a list or dict of JSON values
+
+    Returns:
+        tuple: (encoding, bytes) where encoding is 'text', 'bytes', 'json', 'parquet' or
+            'pickle'; DataFrames are stored as Parquet when pyarrow is installed
+    """
+    if isinstance(value, str):
+        return "text", value.encode("utf-8")
+    if isinstance(value, (bytes, bytearray)):
+        return "bytes", bytes(value)
+    if isinstance(value, pd.DataFrame):
+        buffer = io.BytesIO()
+        if pyarrow is not None:
+            try:
+                value.to_parquet(buffer, index=False)
+                return "parquet", buffer.getvalue()
+            except Exception:
+                # Mixed-type object columns are not representable in Parquet
+                buffer = io.BytesIO()
+        value.to_pickle(buffer, compression="gzip")
+        return "pickle", buffer.getvalue()
+    return "json", json.dumps(value, default=str).encode("utf-8")
+
+
+def decode(encoding, data):
+    """Restores an artifact serialized by encode."""
+    if encoding == "text":
+        return data.decode("utf-8")
+    if encoding == "bytes":
+        return data
+    if encoding == "parquet":
+        return pd.read_parquet(io.BytesIO(data))
+    if encoding == "pickle":
+        return pd.read_pickle(io.BytesIO(data), compression="gzip")
+    return json.loads(data)
+
+
+class ArtifactStore:
+    """
+    Keeps every generated analysis on disk so it can be reopened without calling the model.
+
+    An analysis is identified by a dataset hash and a user and holds artifacts by kind, e.g.
+    'dataset', 'context', 'report', 'charts', 'messages' or 'pdf'. Artifact contents are stored
+    once per content hash in blobs/<first two hex digits>/<hash>, so the same report or dataset
+    saved by several users takes the space of one; the index lives in index.sqlite.
+
+    Args:
+        root (str): Directory of the index and the blobs
+
+    Example:
+        >>> store = get_store()
+        >>> store.save(data_hash, "sales", user, dataset=df, context=context, report=report)
+        >>> store.find(data_hash, kinds=("context", "report"))
+        {'context': '...', 'report': '...'}
+    """
+
+    def __init__(self, root=ARTIFACTS_DIR):
+        self.root = root
+        self.lock = threading.Lock()
+        self.ready = False
+        self.last_retention = 0.0
+
+    @property
+    def index_path(self):
+        return os.path.join(self.root, "index.sqlite")
+
+    @contextmanager
+    def _connect(self):
+        # One connection per operation, committed and closed when the block ends
+        if not self.ready:
+            os.makedirs(os.path.join(self.root, "blobs"), exist_ok=True)
+        connection = sqlite3.connect(self.index_path, timeout=30)
+        try:
+            connection.execute("PRAGMA foreign_keys=ON")
+            if not self.ready:
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.executescript(SCHEMA)
+                self.ready = True
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def _blob_path(self, digest):
+        return os.path.join(self.root, "blobs", digest[:2], digest)
+
+    def put_blob(self, data):
+        """
+        Stores bytes under their content hash.
+
+        Args:
+            data (bytes): Content
+
+        Returns:
+            str: SHA-256 hex digest; content already stored is not written again
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(digest)
+        if os.path.exists(path):
+            # A fresh modification time keeps compact from removing it before the index refers to it
+            os.utime(path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Written under a temporary name first, so readers never see a partial blob
+            fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(temporary, path)
+        return digest
+
+    def get_blob(self, digest):
+        """Returns the bytes stored under a content hash."""
+        with open(self._blob_path(digest), "rb") as f:
+            return f.read()
+
+    @traced("artifacts.save")
+    def save(self, dataset_hash, dataset_name, user, **artifacts):
+        """
+        Stores artifacts of an analysis, replacing earlier artifacts of the same kinds.
+
+        Args:
+            dataset_hash (str): Hash of the analysed dataset
+            dataset_name (str): Name shown in the history
+            user (str): Owner of the analysis
+            **artifacts: Artifacts by kind; None values are skipped. A 'dataset' DataFrame also
+                records the dataset's shape
+
+        Returns:
+            int: Id of the analysis
+        """
+        artifacts = {kind: value for kind, value in artifacts.items() if value is not None}
+        encoded = {kind: encode(value) for kind, value in artifacts.items()}
+        blobs = {kind: (encoding, self.put_blob(data), len(data)) for kind, (encoding, data) in encoded.items()}
+        now = time.time()
+        dataset = artifacts.get("dataset")
+        shape = dataset.shape if isinstance(dataset, pd.DataFrame) else (None, None)
+        with self.lock, self._connect() as connection:
+            connection.execute(
+                "INSERT INTO analyses (dataset_hash, dataset_name, user, created, updated, rows, columns) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (dataset_hash, user) DO UPDATE SET "
+                "updated = excluded.updated, dataset_name = excluded.dataset_name, "
+                "rows = COALESCE(excluded.rows, rows), columns = COALESCE(excluded.columns, columns)",
+                (dataset_hash, dataset_name, user, now, now, *shape),
+            )
+            analysis_id = connection.execute(
+                "SELECT id FROM analyses WHERE dataset_hash = ? AND user = ?", (dataset_hash, user)
+            ).fetchone()[0]
+            connection.executemany(
+                "INSERT OR REPLACE INTO artifacts (analysis_id, kind, encoding, blob, bytes, created) VALUES (?, ?, ?, ?, ?, ?)",
+                [(analysis_id, kind, encoding, digest, size, now) for kind, (encoding, digest, size) in blobs.items()],
+            )
+        if now - self.last_retention > RETENTION_INTERVAL_SECONDS:
+            self.last_retention = now
+            self.apply_retention()
+        return analysis_id
+
+    def load(self, analysis_id, kinds=None, user=None):
+        """
+        Reads the artifacts of an analysis.
+
+        Args:
+            analysis_id (int): Id returned by save or listed by history
+            kinds (tuple, optional): Kinds to read, by default all
+            user (str, optional): Only read the analysis if this user owns it
+
+        Returns:
+            dict: Artifacts by kind; kinds that were not stored, or whose blob is missing, are absent,
+                and the dict is empty if the analysis belongs to another user
+        """
+        query = (
+            "SELECT f.kind, f.encoding, f.blob FROM artifacts f JOIN analyses a ON a.id = f.analysis_id "
+            "WHERE f.analysis_id = ?"
+        )
+        params = [analysis_id]
+        if user is not None:
+            query += " AND a.user = ?"
+            params.append(user)
+        with self._connect() as connection:
+            rows = connection.execute(query, params).fetchall()
+        loaded = {}
+        for kind, encoding, digest in rows:
+            if kinds is not None and kind not in kinds:
+                continue
+            try:
+                loaded[kind] = decode(encoding, self.get_blob(digest))
+            except OSError:
+                continue
+        return loaded
+
+    def find(self, dataset_hash, kinds, user=None):
+        """
+        Reads artifacts of the most recent analysis of a dataset that has all the given kinds.
+
+        Analyses of the same dataset by other users are used too unless user is given, as
+        artifacts generated from the same data are the same for everyone.
+
+        Args:
+            dataset_hash (str): Hash of the dataset
+            kinds (tuple): Kinds that must all be stored
+            user (str, optional): Only consider this user's analyses
+
+        Returns:
+            dict or None: Artifacts by kind, or None if no analysis has them all
+        """
+        query = (
+            "SELECT a.id FROM analyses a JOIN artifacts f ON f.analysis_id = a.id "
+            f"WHERE a.dataset_hash = ? AND f.kind IN ({', '.join('?' * len(kinds))})"
+        )
+        params = [dataset_hash, *kinds]
+        if user is not None:
+            query += " AND a.user = ?"
+            params.append(user)
+        query += " GROUP BY a.id HAVING COUNT(DISTINCT f.kind) = ? ORDER BY a.updated DESC"
+        with self._connect() as connection:
+            ids = [row[0] for row in connection.execute(query, [*params, len(kinds)])]
+        for analysis_id in ids:
+            loaded = self.load(analysis_id, kinds)
+            if len(loaded) == len(kinds):
+                return loaded
+        return None
+
+    def history(self, user=None, limit=200):
+        """
+        Lists stored analyses, most recently updated first.
+
+        Args:
+            user (str, optional): Only list this user's analyses
+            limit (int): Maximum number of analyses
+
+        Returns:
+            pandas.DataFrame: Per analysis its id, dataset name and hash, user, shape, creation
+                and update time, pinned flag, artifact kinds and size in bytes
+        """
+        query = """
+            SELECT a.id, a.dataset_name, a.dataset_hash, a.user, a.rows, a.columns,
+                   datetime(a.created, 'unixepoch', 'localtime') AS created,
+                   datetime(a.updated, 'unixepoch', 'localtime') AS updated,
+                   a.pinned, GROUP_CONCAT(f.kind, ', ') AS artifacts, SUM(f.bytes) AS bytes
+            FROM analyses a LEFT JOIN artifacts f ON f.analysis_id = a.id
+        """
+        params = []
+        if user is not None:
+            query += " WHERE a.user = ?"
+            params.append(user)
+        query += " GROUP BY a.id ORDER BY a.updated DESC LIMIT ?"
+        with self._connect() as connection:
+            return pd.read_sql_query(query, connection, params=[*params, limit])
+
+    def pin(self, analysis_id, pinned=True, user=None):
+        """Excludes an analysis from retention, or includes it again with pinned=False; with user, only if they own it."""
+        query, params = "UPDATE analyses SET pinned = ? WHERE id = ?", [int(pinned), analysis_id]
+        if user is not None:
+            query += " AND user = ?"
+            params.append(user)
+        with self.lock, self._connect() as connection:
+            connection.execute(query, params)
+
+    def delete(self, analysis_ids, user=None):
+        """
+        Deletes analyses and their artifacts from the index.
+
+        Blobs are removed by the next compact, as other analyses may share them.
+
+        Args:
+            analysis_ids (list): Ids of the analyses
+            user (str, optional): Only delete the analyses this user owns
+        """
+        query = "DELETE FROM analyses WHERE id = ?" + (" AND user = ?" if user is not None else "")
+        rows = [(i,) if user is None else (i, user) for i in analysis_ids]
+        with self.lock, self._connect() as connection:
+            connection.executemany(query, rows)
+
+    def size_bytes(self):
+        """Returns the size of the distinct blobs referenced by the index."""
+        with self._connect() as connection:
+            total = connection.execute("SELECT SUM(bytes) FROM (SELECT blob, MAX(bytes) AS bytes FROM artifacts GROUP BY blob)").fetchone()[0]
+        return int(total or 0)
+
+    @traced("artifacts.retention")
+    def apply_retention(self, now=None):
+        """
+        Deletes analyses according to the retention policy, then compacts the store.
+
+        Unpinned analyses are deleted when they were last updated more than MAX_AGE_DAYS ago,
+        when their user has more than MAX_ANALYSES_PER_USER newer unpinned ones, and, least recently
+        updated first, while the store is larger than MAX_STORE_BYTES.
+
+        Args:
+            now (float, optional): Current Unix time, for tests
+
+        Returns:
+            dict: Number of analyses deleted and bytes freed
+        """
+        now = time.time() if now is None else now
+        with self._connect() as connection:
+            expired = [row[0] for row in connection.execute(
+                "SELECT id FROM analyses WHERE pinned = 0 AND updated < ?", (now - MAX_AGE_DAYS * 86400,)
+            )]
+            surplus = [row[0] for row in connection.execute(
+                "SELECT id FROM (SELECT id, ROW_NUMBER() OVER (PARTITION BY user ORDER BY updated DESC) AS rank "
+                "FROM analyses WHERE pinned = 0) WHERE rank > ?", (MAX_ANALYSES_PER_USER,)
+            )]
+        self.delete(set(expired) | set(surplus))
+        deleted = len(set(expired) | set(surplus))
+        size = self.size_bytes()
+        if size > MAX_STORE_BYTES:
+            with self._connect() as connection:
+                oldest = connection.execute(
+                    "SELECT a.id, COALESCE(SUM(f.bytes), 0) FROM analyses a LEFT JOIN artifacts f ON f.analysis_id = a.id "
+                    "WHERE a.pinned = 0 GROUP BY a.id ORDER BY a.updated"
+                ).fetchall()
+            victims = []
+            for analysis_id, size_of in oldest:
+                if size <= MAX_STORE_BYTES:
+                    break
+                # Shared blobs are counted once per analysis, so this may delete slightly too few
+                victims.append(analysis_id)
+                size -= size_of
+            self.delete(victims)
+            deleted += len(victims)
+        return {"deleted": deleted, "freed_bytes": self.compact()}
+
+    @traced("artifacts.compact")
+    def compact(self):
+        """
+        Removes blobs no analysis references any more and reclaims index space.
+
+        Returns:
+            int: Bytes of the removed blobs
+        """
+        with self.lock:
+            with self._connect() as connection:
+                referenced = {row[0] for row in connection.execute("SELECT DISTINCT blob FROM artifacts")}
+            freed = 0
+            blobs = os.path.join(self.root, "blobs")
+            # Blobs written in the last minute may belong to a save that has not reached the index yet
+            cutoff = time.time() - 60
+            for directory, _, files in os.walk(blobs):
+                for name in files:
+                    path = os.path.join(directory, name)
+                    if name not in referenced and os.path.getmtime(path) < cutoff:
+                        freed += os.path.getsize(path)
+                        os.remove(path)
+            with span("artifacts.vacuum"):
+                with self._connect() as connection:
+                    connection.execute("VACUUM")
+        return freed
+
+
+def get_store():
+    """
+    Returns the store shared by every session of the app.
+
+    Returns:
+        ArtifactStore: Store in ARTIFACTS_DIR
+    """
+    global _default_store
+    if _default_store is None:
+        _default_store = ArtifactStore()
+    return _default_store
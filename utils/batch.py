@@ -0,0 +1,295 @@
+"""
+Headless batch analysis of many datasets.
+
+Runs the same pipeline as the Streamlit pages (ingestion, profiling, context
+detection, report generation, chart rendering and the PDF export) for every CSV
+file in a directory or glob, in a pool of worker processes:
+
+    python -m utils.batch extracts/*.csv --output batch_reports --workers 4
+
+Progress is recorded in <output>/manifest.json after every dataset, so an
+interrupted run resumes where it stopped when started again.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from utils import metering
+from utils.fingerprint import text_hash
+from utils.tracing import span, traced
+
+MANIFEST_NAME = "manifest.json"
+
+
+def find_datasets(sources):
+    """
+    Expands directories and glob patterns into CSV file paths.
+
+    Args:
+        sources (list): File paths, directories or glob patterns
+
+    Returns:
+        list: Sorted, de-duplicated absolute paths of the CSV files
+    """
+    paths = set()
+    for source in sources:
+        if os.path.isdir(source):
+            paths.update(glob.glob(os.path.join(source, "*.csv")))
+        else:
+            paths.update(p for p in glob.glob(source) if os.path.isfile(p))
+    return sorted(os.path.abspath(p) for p in paths)
+
+
+def file_signature(path):
+    """Returns the size and modification time of a file, used to detect changed inputs on resume."""
+    stat = os.stat(path)
+    return {"bytes": stat.st_size, "mtime": stat.st_mtime}
+
+
+def load_manifest(output_dir):
+    """
+    Reads the manifest of an earlier run.
+
+    Args:
+        output_dir (str): Output directory of the batch run
+
+    Returns:
+        dict: Mapping of dataset path to its manifest entry, empty if there is no manifest
+    """
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)["datasets"]
+
+
+def save_manifest(output_dir, datasets):
+    """Writes the manifest atomically, so an interrupted run never leaves it half written."""
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"updated": time.strftime("%Y-%m-%dT%H:%M:%S"), "datasets": datasets}, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def is_complete(entry, path):
+    """
+    Checks whether a dataset was analysed successfully and is unchanged since.
+
+    Args:
+        entry (dict or None): Manifest entry of the dataset
+        path (str): Path of the dataset
+
+    Returns:
+        bool: True if the dataset can be skipped
+    """
+    return bool(
+        entry
+        and entry.get("status") == "done"
+        and entry.get("input") == file_signature(path)
+        and all(os.path.exists(p) for p in entry.get("artifacts", {}).values())
+    )
+
+
+def artifact_names(paths):
+    """
+    Chooses an output folder name per dataset: its file name, plus a short hash of the
+    path when two datasets in different directories share a file name.
+
+    Args:
+        paths (list): Dataset paths
+
+    Returns:
+        dict: Mapping of dataset path to folder name
+    """
+    stems = {}
+    for path in paths:
+        stems.setdefault(os.path.splitext(os.path.basename(path))[0], []).append(path)
+    names = {}
+    for stem, group in stems.items():
+        for path in group:
+            names[path] = stem if len(group) == 1 else f"{stem}-{text_hash(path)[:8]}"
+    return names
+
+
+@traced("batch.analyze_dataset")
+def analyze_dataset(path, output_dir, refine=False, large_file=False, name=None):
+    """
+    Runs the full analysis of one dataset and writes its artifacts.
+
+    Args:
+        path (str): Path of the CSV file
+        output_dir (str): Directory the artifacts are written to
+        refine (bool): Let the model re-rank the chart suggestions
+        large_file (bool): Profile the dataset out-of-core with DuckDB; the model prompts
+            and row-level charts then use a sample, as in the upload page. The Parquet
+            copy this writes is deleted before returning
+        name (str, optional): Dataset name used in the PDF title, defaults to the file name
+
+    Returns:
+        dict: Paths of the written artifacts by name: context, report, charts, statistics,
+            pdf and one chart_<n> entry per rendered chart
+    """
+    from utils.analytics import compute_statistics, statistics_to_markdown
+    from utils.gemini_ai import context_detection, generate_report
+    from utils.pdf_generator import EnhancedReportGenerator, dataset_key
+    from utils.visualizer import generate_visualizations
+
+    os.makedirs(output_dir, exist_ok=True)
+    name = name or os.path.splitext(os.path.basename(path))[0]
+    with span("batch.read_csv", **{"file.bytes": os.path.getsize(path)}):
+        if large_file:
+            from utils.columnar import ColumnarDataset
+            dataset = ColumnarDataset.from_csv(path, name=name)
+            df = dataset.sample()
+        else:
+            dataset = df = pd.read_csv(path)
+
+    try:
+        artifacts = {}
+
+        def write_text(key, filename, text):
+            target = os.path.join(output_dir, filename)
+            with open(target, "w", encoding="utf-8") as f:
+                f.write(text)
+            artifacts[key] = target
+
+        write_text("statistics", "statistics.md", statistics_to_markdown(compute_statistics(df)))
+        # Model usage of the worker is metered against the dataset it analyses
+        with metering.scope(dataset=name):
+            context = context_detection(df)
+            write_text("context", "context.md", context or "")
+            report = generate_report(df)
+            write_text("report", "report.md", report or "")
+            charts = generate_visualizations(df, refine=refine)
+        write_text("charts", "charts.json", json.dumps(charts, indent=2, default=str))
+
+        generator = EnhancedReportGenerator()
+        data_key = dataset_key(dataset)
+        chart_images = []
+        for i, chart in enumerate(charts, 1):
+            png, _ = generator.chart_image(chart, dataset, data_key)
+            chart_images.append(png)
+            if png:
+                target = os.path.join(output_dir, f"chart_{i}.png")
+                with open(target, "wb") as f:
+                    f.write(chart_images[-1])
+                artifacts[f"chart_{i}"] = target
+
+        pdf_path = os.path.join(output_dir, "report.pdf")
+        success = generator.create_complete_report(
+            context_response=context,
+            report_response=report,
+            df=dataset,
+            figures=charts,
+            output_path=pdf_path,
+            report_title=f"Analysis report on {name}",
+            chart_images=chart_images,
+            data_hash=data_key,
+        )
+        if not success:
+            raise RuntimeError("The PDF report could not be generated")
+        artifacts["pdf"] = pdf_path
+        return artifacts
+    finally:
+        # The Parquet copy of a large file is only needed until the PDF is written
+        if large_file:
+            dataset.delete()
+
+
+def _run_one(path, output_dir, refine, large_file):
+    start = time.perf_counter()
+    artifacts = analyze_dataset(path, output_dir, refine=refine, large_file=large_file)
+    return artifacts, time.perf_counter() - start
+
+
+def _init_worker(llm_backend):
+    if llm_backend:
+        from utils import llm
+        llm.set_backend(llm_backend)
+
+
+def run_batch(sources, output_dir, workers=4, resume=True, refine=False, large_file=False, llm_backend=None, log=print):
+    """
+    Analyses every dataset matched by sources in parallel worker processes.
+
+    Args:
+        sources (list): File paths, directories or glob patterns of CSV files
+        output_dir (str): Directory for the manifest and one artifact folder per dataset
+        workers (int): Maximum number of datasets analysed at the same time. This also
+            bounds the number of concurrent model requests.
+        resume (bool): Skip datasets the manifest records as done whose file is unchanged
+        refine (bool): Let the model re-rank the chart suggestions
+        large_file (bool): Profile datasets out-of-core with DuckDB
+        llm_backend (str, optional): Model backend for the workers, e.g. "fake" for dry runs
+        log (callable): Receives one progress line per dataset
+
+    Returns:
+        dict: The manifest, mapping each dataset path to its status, artifacts, duration and error
+
+    Example:
+        >>> manifest = run_batch(["extracts/"], "batch_reports", workers=4)
+        >>> [p for p, entry in manifest.items() if entry["status"] == "failed"]
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    paths = find_datasets(sources)
+    manifest = load_manifest(output_dir) if resume else {}
+    names = artifact_names(paths)
+    pending = [p for p in paths if not (resume and is_complete(manifest.get(p), p))]
+    if len(pending) < len(paths):
+        log(f"Skipping {len(paths) - len(pending)} datasets already analysed")
+
+    with ProcessPoolExecutor(max_workers=max(1, workers), initializer=_init_worker, initargs=(llm_backend,)) as pool:
+        futures = {}
+        for path in pending:
+            manifest[path] = {"status": "running", "input": file_signature(path), "output": os.path.join(output_dir, names[path])}
+            futures[pool.submit(_run_one, path, manifest[path]["output"], refine, large_file)] = path
+        save_manifest(output_dir, manifest)
+        for done, future in enumerate(as_completed(futures), 1):
+            path = futures[future]
+            entry = manifest[path]
+            try:
+                entry["artifacts"], entry["seconds"] = future.result()
+                entry["status"] = "done"
+                entry.pop("error", None)
+                log(f"[{done}/{len(pending)}] {path}: done in {entry['seconds']:.1f}s")
+            except Exception as e:
+                entry["status"] = "failed"
+                entry["error"] = f"{type(e).__name__}: {e}"
+                log(f"[{done}/{len(pending)}] {path}: failed ({entry['error']})")
+            save_manifest(output_dir, manifest)
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyse many CSV datasets without the web app")
+    parser.add_argument("sources", nargs="+", help="CSV files, directories or glob patterns")
+    parser.add_argument("--output", "-o", default="batch_reports", help="directory for the manifest and the artifacts")
+    parser.add_argument("--workers", "-j", type=int, default=4, help="datasets analysed at the same time")
+    parser.add_argument("--no-resume", action="store_true", help="analyse every dataset again, ignoring the manifest")
+    parser.add_argument("--refine", action="store_true", help="let the model re-rank the chart suggestions")
+    parser.add_argument("--large-file", action="store_true", help="profile datasets out-of-core with DuckDB")
+    parser.add_argument("--llm-backend", choices=["gemini", "fake"], help="model backend, 'fake' for dry runs")
+    args = parser.parse_args(argv)
+
+    manifest = run_batch(
+        args.sources,
+        args.output,
+        workers=args.workers,
+        resume=not args.no_resume,
+        refine=args.refine,
+        large_file=args.large_file,
+        llm_backend=args.llm_backend,
+    )
+    failed = [path for path, entry in manifest.items() if entry["status"] != "done"]
+    print(f"{len(manifest) - len(failed)} of {len(manifest)} datasets analysed, manifest in {os.path.join(args.output, MANIFEST_NAME)}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,198 @@
+import numpy as np
+import pandas as pd
+from utils.geo import coordinate_role
+from utils.tracing import traced
+
+# Upper bound of distinct values for a column to count as a low-cardinality category
+MAX_CATEGORY_LEVELS = 20
+
+# Maximum number of rows inspected when profiling a column
+PROFILE_SAMPLE_ROWS = 50_000
+
+
+def _column_kind(series):
+    """Classifies a column as datetime, numeric, boolean, categorical or text."""
+    if pd.api.types.is_bool_dtype(series):
+        return "boolean"
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return "datetime"
+    if pd.api.types.is_numeric_dtype(series):
+        return "numeric"
+    non_null = series.dropna()
+    if non_null.empty:
+        return "text"
+    sample = non_null.head(200).astype(str)
+    if sample.str.match(r"^\d{4}[-/]\d{1,2}([-/]\d{1,2})?").mean() > 0.9:
+        parsed = pd.to_datetime(sample, errors="coerce")
+        if parsed.notna().mean() > 0.9:
+            return "datetime"
+    return "categorical"
+
+
+def profile_dataset(df):
+    """
+    Builds a lightweight profile of every column in a dataset.
+
+    Args:
+        df (pandas.DataFrame): Dataset to profile
+
+    Returns:
+        dict: Mapping of column name to a profile dictionary containing:
+            - kind: datetime, numeric, boolean, categorical or text
+            - unique: Number of distinct non-null values
+            - unique_ratio: Distinct values divided by non-null rows
+            - monotonic: True if the column is sorted ascending or descending
+            - geo: 'latitude', 'longitude' or None
+
+    Notes:
+        - Large datasets are profiled on their first PROFILE_SAMPLE_ROWS rows
+        - Coordinates are detected from the column name and a valid value range
+
+    Example:
+        >>> profile = profile_dataset(pd.read_csv("stores.csv"))
+        >>> profile["opened_on"]["kind"]
+        'datetime'
+    """
+    sample = df.head(PROFILE_SAMPLE_ROWS)
+    profile = {}
+    for column in sample.columns:
+        series = sample[column]
+        non_null = series.dropna()
+        kind = _column_kind(series)
+        unique = int(non_null.nunique())
+        monotonic = False
+        if kind in ("numeric", "datetime") and len(non_null) > 2:
+            monotonic = bool(non_null.is_monotonic_increasing or non_null.is_monotonic_decreasing)
+
+        geo = None
+        role = coordinate_role(column)
+        if kind == "numeric" and role and not non_null.empty:
+            low, high = non_null.min(), non_null.max()
+            if role == "latitude" and -90 <= low and high <= 90:
+                geo = "latitude"
+            elif role == "longitude" and -180 <= low and high <= 180:
+                geo = "longitude"
+
+        profile[column] = {
+            "kind": kind,
+            "unique": unique,
+            "unique_ratio": unique / len(non_null) if len(non_null) else 0.0,
+            "monotonic": monotonic,
+            "geo": geo,
+        }
+    return profile
+
+
+@traced("charts.recommend_charts")
+def recommend_charts(df, max_charts=3, profile=None):
+    """
+    Recommends charts for a dataset using deterministic rules instead of a model call.
+
+    Args:
+        df (pandas.DataFrame): Dataset to recommend charts for
+        max_charts (int): Maximum number of recommendations to return
+        profile (dict, optional): Precomputed output of profile_dataset
+
+    Returns:
+        list: Chart specifications ranked by score, each containing:
+            - chart_type: line, bar, pie, scatter, histogram or map
+            - x_column: Column to use for the x-axis
+            - y_column: Column to use for the y-axis
+            - reason: Explanation of the insight the chart reveals
+            - score: Confidence of the rule between 0 and 1
+
+    Rules:
+        - Datetime or monotonic column with a numeric measure: line chart
+        - Latitude and longitude columns: map
+        - Low-cardinality category with a numeric measure: bar chart (pie for a few levels)
+        - Strongly correlated numeric pair: scatter plot
+        - Numeric measure on its own: histogram
+
+    Example:
+        >>> recommend_charts(pd.read_csv("sales_data.csv"))
+        [
+            {
+                "chart_type": "line",
+                "x_column": "order_date",
+                "y_column": "revenue",
+                "reason": "Shows how revenue changes over order_date.",
+                "score": 0.95
+            },
+            ...
+        ]
+    """
+    if profile is None:
+        profile = profile_dataset(df)
+
+    numeric = [c for c, p in profile.items() if p["kind"] == "numeric" and p["geo"] is None and p["unique"] > 1]
+    # Identifier-like numeric columns (every value distinct and sorted) make poor measures
+    measures = [c for c in numeric if not (profile[c]["unique_ratio"] == 1.0 and profile[c]["monotonic"])] or numeric
+    datetimes = [c for c, p in profile.items() if p["kind"] == "datetime"]
+    sequences = [c for c in numeric if profile[c]["monotonic"] and profile[c]["unique_ratio"] > 0.9]
+    categories = [
+        c for c, p in profile.items()
+        if p["kind"] in ("categorical", "boolean") and 1 < p["unique"] <= MAX_CATEGORY_LEVELS
+    ]
+    latitude = next((c for c, p in profile.items() if p["geo"] == "latitude"), None)
+    longitude = next((c for c, p in profile.items() if p["geo"] == "longitude"), None)
+
+    candidates = []
+
+    for x in datetimes:
+        for y in measures[:2]:
+            candidates.append(("line", x, y, 0.95, f"Shows how {y} changes over {x}."))
+    for x in sequences:
+        for y in measures[:2]:
+            if y != x:
+                candidates.append(("line", x, y, 0.7, f"Shows the trend of {y} along the ordered {x} column."))
+
+    if latitude and longitude:
+        candidates.append(("map", longitude, latitude, 0.9, "Shows where the records are located geographically."))
+
+    for x in categories:
+        levels = profile[x]["unique"]
+        for y in measures[:2]:
+            candidates.append(("bar", x, y, 0.85 - levels / 200, f"Compares {y} across the {levels} {x} categories."))
+            if levels <= 6 and (df[y].head(PROFILE_SAMPLE_ROWS).dropna() >= 0).all():
+                candidates.append(("pie", x, y, 0.6, f"Shows the share of total {y} contributed by each {x}."))
+
+    if len(measures) >= 2:
+        corr = df[measures].head(PROFILE_SAMPLE_ROWS).corr().abs().to_numpy()
+        np.fill_diagonal(corr, 0)
+        corr = np.nan_to_num(corr)
+        rows, cols = np.triu_indices_from(corr, k=1)
+        for idx in np.argsort(corr[rows, cols])[::-1][:3]:
+            strength = float(corr[rows[idx], cols[idx]])
+            x, y = measures[rows[idx]], measures[cols[idx]]
+            candidates.append((
+                "scatter", x, y, 0.4 + 0.5 * strength,
+                f"Shows the relationship between {x} and {y} (|r| = {strength:.2f}).",
+            ))
+
+    for y in measures[:3]:
+        candidates.append(("histogram", y, y, 0.45, f"Shows the distribution of {y} and any skew or outliers."))
+
+    candidates.sort(key=lambda c: c[3], reverse=True)
+
+    recommendations = []
+    seen_charts = set()
+    # First pass keeps one chart per type so the suggestions show different views of the data
+    for one_per_type in (True, False):
+        seen_types = {chart["chart_type"] for chart in recommendations}
+        for chart_type, x, y, score, reason in candidates:
+            key = (chart_type, x, y)
+            if len(recommendations) >= max_charts:
+                break
+            if key in seen_charts or (one_per_type and chart_type in seen_types):
+                continue
+            seen_charts.add(key)
+            seen_types.add(chart_type)
+            recommendations.append({
+                "chart_type": chart_type,
+                "x_column": x,
+                "y_column": y,
+                "reason": reason,
+                "score": round(score, 2),
+            })
+    recommendations.sort(key=lambda chart: chart["score"], reverse=True)
+    return recommendations
@@ -0,0 +1,219 @@
+import io
+import streamlit as st
+import pandas as pd
+from utils import frontend_data, geo, reshape
+from utils.tracing import traced
+
+# matplotlib is imported inside the rendering functions so pages only pay for it
+# when a chart that needs it is actually drawn
+
+
+def _show(fig, **options):
+    # Figures stay registered with pyplot until closed, so every rerun would leak them
+    import matplotlib.pyplot as plt
+    try:
+        st.pyplot(fig, **options)
+    finally:
+        plt.close(fig)
+
+
+@traced("charts.render_suggested_chart")
+def render_suggested_chart(chart, df, index):
+    """
+    Renders one suggested chart with its title and explanation.
+
+    Args:
+        chart (dict): Chart specification with chart_type, x_column, y_column and reason
+        df (pandas.DataFrame): Dataset to plot
+        index (int): Position of the chart, used in its title
+
+    Example:
+        >>> for i, chart in enumerate(st.session_state["plot"]):
+        ...     render_suggested_chart(chart, df, i + 1)
+    """
+    chart_type = chart.get("chart_type")
+    x_column = chart.get("x_column")
+    y_column = chart.get("y_column")
+    reason = chart.get("reason")
+
+    st.subheader(f"{index}. {chart_type.capitalize()} Chart")
+    st.text(f"🧠 {reason}")
+
+    fig = None
+    try:
+        with st.container(border=True):
+            # The dataset object itself is kept, so per-dataset caches such as map grids are reused
+            chart_df = df if isinstance(df, pd.DataFrame) else pd.DataFrame(df)
+            if chart.get("reshape") == "long":
+                # Charts of a wide dataset get only the long-format rows they plot
+                chart_df = reshape.chart_frame(chart_df, chart)
+            # Only the plotted columns, aggregated or decimated, are drawn and sent to the browser
+            chart_df = frontend_data.chart_data(chart_df, chart)
+            if chart_type == "scatter":
+                import matplotlib.pyplot as plt
+                fig, ax = plt.subplots(figsize=(3, 3))
+                ax.scatter(chart_df[x_column], chart_df[y_column])
+                ax.set_xlabel(x_column)
+                ax.set_ylabel(y_column)
+                _show(fig, use_container_width=True)
+            elif chart_type == "bar":
+                import matplotlib.pyplot as plt
+                fig, ax = plt.subplots(figsize=(9, 9))
+                ax.bar(chart_df[x_column], chart_df[y_column])
+                ax.set_xlabel(x_column)
+                ax.set_ylabel(y_column)
+                _show(fig, use_container_width=True)
+            elif chart_type == "line":
+                # Series over dates come with a rolling mean drawn alongside
+                series = [c for c in chart_df.columns if c != x_column]
+                st.line_chart(frontend_data.bounded(chart_df, "line_chart"), x=x_column, y=series)
+            elif chart_type == "area":
+                st.area_chart(frontend_data.bounded(chart_df, "area_chart"), x=x_column, y=y_column)
+            elif chart_type == "pie":
+                import matplotlib.pyplot as plt
+                fig, ax = plt.subplots(figsize=(3, 3))
+                ax.pie(chart_df[y_column], labels=chart_df[x_column], autopct='%1.1f%%', startangle=90)
+                ax.axis('equal') # Equal aspect ratio ensures the pie chart is circular.
+                _show(fig)
+            elif chart_type == "histogram":
+                if y_column in chart_df.columns:
+                    import matplotlib.pyplot as plt
+                    fig, ax = plt.subplots(figsize=(6, 4))
+                    ax.hist(chart_df[y_column].dropna(), bins=30, edgecolor='black')
+                    ax.set_xlabel(y_column)
+                    ax.set_ylabel('Frequency')
+                    _show(fig)
+                else:
+                    st.error("Histogram requires a numerical column.")
+            elif chart_type == "map":
+                if chart_df.empty:
+                    st.error("Map visualization requires latitude and longitude columns.")
+                else:
+                    # chart_df holds the finest grid that fits; coarser grids come from the same cached index
+                    finest = len(chart_df["geohash"].iloc[0])
+                    if finest > 1:
+                        precision = st.select_slider("Map detail", options=list(range(1, finest + 1)), value=finest, key=f"map_detail_{index}")
+                        if precision != finest:
+                            chart_df = geo.map_cells(df, chart, precision=precision)
+                    st.map(frontend_data.bounded(chart_df, "map"), latitude="latitude", longitude="longitude", size="radius")
+                    st.caption(f"{chart_df['count'].sum():,} points in {len(chart_df):,} grid cells")
+            else:
+                st.error(f"Unsupported chart type: {chart_type}")
+    except Exception as e:
+        if fig is not None:
+            import matplotlib.pyplot as plt
+            plt.close(fig)
+        st.error(f"Could not render chart due to: {e}")
+
+
+def custom_chart_figure(chart_type, Column_data, x_columns, y_columns):
+    """
+    Builds a chart configured by the user in the Custom Charts tab.
+
+    Args:
+        chart_type (str): Bar, Line, Scatter, Pie, Histogram or Heatmap
+        Column_data (pandas.DataFrame): Dataset to plot
+        x_columns (str or None): Column for the x-axis
+        y_columns (str or None): Column for the y-axis
+
+    Returns:
+        matplotlib.figure.Figure: The chart. The caller is responsible for closing it.
+
+    Raises:
+        ValueError: If the chart type is unknown
+    """
+    import matplotlib.pyplot as plt
+    if chart_type == "Scatter":
+        fig, ax = plt.subplots(figsize=(10, 6))
+        ax.scatter(Column_data[x_columns], Column_data[y_columns])
+        ax.set_xlabel(x_columns)
+        ax.set_ylabel(y_columns)
+
+    elif chart_type == "Bar":
+        fig, ax = plt.subplots(figsize=(10, 6))
+        ax.bar(Column_data[x_columns], Column_data[y_columns])
+        ax.set_xlabel(x_columns)
+        ax.set_ylabel(y_columns)
+        ax.tick_params(axis='x', labelrotation=45)
+        fig.tight_layout()
+
+    elif chart_type == "Line":
+        fig, ax = plt.subplots(figsize=(10, 6))
+        # The same reduction as suggested line charts: period means over dates, else sorted by x
+        line = frontend_data.chart_data(Column_data, {"chart_type": "line", "x_column": x_columns, "y_column": y_columns})
+        series = [c for c in line.columns if c != x_columns] or [y_columns]
+        for column in series:
+            ax.plot(line[x_columns], line[column], label=column)
+        if len(series) > 1:
+            ax.legend()
+        ax.set_xlabel(x_columns)
+        ax.set_ylabel(y_columns)
+        fig.tight_layout()
+
+    elif chart_type == "Pie":
+        fig, ax = plt.subplots(figsize=(10, 6))
+        # Group data for pie chart
+        pie_data = Column_data[y_columns].value_counts()
+        ax.pie(pie_data.values, labels=pie_data.index, autopct='%1.1f%%')
+        ax.axis('equal')
+        ax.set_title(f"Distribution of {y_columns}")
+
+    elif chart_type == "Histogram":
+        fig, ax = plt.subplots(figsize=(10, 6))
+        ax.hist(Column_data[y_columns], bins=30, edgecolor='black')
+        ax.set_xlabel(y_columns)
+        ax.set_ylabel('Frequency')
+        fig.tight_layout()
+
+    elif chart_type == "Heatmap":
+        fig, ax = plt.subplots(figsize=(12, 8))
+        correlation_matrix = Column_data.corr(numeric_only=True)
+        im = ax.imshow(correlation_matrix, cmap='coolwarm')
+
+        # Add colorbar
+        fig.colorbar(im, ax=ax, label='Correlation Coefficient')
+
+        # Add labels
+        ax.set_xticks(range(len(correlation_matrix.columns)))
+        ax.set_yticks(range(len(correlation_matrix.columns)))
+        ax.set_xticklabels(correlation_matrix.columns, rotation=45, ha='right')
+        ax.set_yticklabels(correlation_matrix.columns)
+
+        # Add correlation values
+        for i in range(len(correlation_matrix.columns)):
+            for j in range(len(correlation_matrix.columns)):
+                ax.text(j, i, f'{correlation_matrix.iloc[i, j]:.2f}',
+                        ha='center', va='center',
+                        color='white' if abs(correlation_matrix.iloc[i, j]) > 0.5 else 'black')
+
+        ax.set_title("Correlation Heatmap")
+        fig.tight_layout()
+
+    else:
+        raise ValueError(f"Unsupported chart type: {chart_type}")
+    return fig
+
+
+@traced("charts.custom_chart_png")
+def custom_chart_png(chart_type, Column_data, x_columns, y_columns, dpi=100):
+    """
+    Renders a custom chart to PNG bytes, so it can be cached and shown with st.image.
+
+    Args:
+        chart_type (str): Bar, Line, Scatter, Pie, Histogram or Heatmap
+        Column_data (pandas.DataFrame): Dataset to plot
+        x_columns (str or None): Column for the x-axis
+        y_columns (str or None): Column for the y-axis
+        dpi (int): Resolution of the image
+
+    Returns:
+        bytes: PNG image of the chart
+    """
+    import matplotlib.pyplot as plt
+    fig = custom_chart_figure(chart_type, Column_data, x_columns, y_columns)
+    try:
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format="png", dpi=dpi, bbox_inches="tight")
+        return buffer.getvalue()
+    finally:
+        plt.close(fig)
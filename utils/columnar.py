@@ -0,0 +1,298 @@
+import os
+import shutil
+import tempfile
+import uuid
+import pandas as pd
+
+try:
+    import duckdb
+except ImportError:  # Optional dependency, only needed for the large file mode
+    duckdb = None
+
+# Directory where uploads are stored as Parquet in the large file mode
+DATA_DIR = os.getenv("DATTAVISM_DATA_DIR", "data")
+
+# Directory whose CSV files may be analysed in place from the server; unset disables it, since
+# any path typed in the browser would otherwise be read with the server's permissions
+SERVER_DATA_DIR = os.getenv("DATTAVISM_SERVER_DATA_DIR") or None
+
+# Memory the embedded engine may use before spilling to disk
+MEMORY_LIMIT = os.getenv("DATTAVISM_ENGINE_MEMORY", "2GB")
+
+# Rows pulled into pandas for previews, model prompts and row-level charts
+SAMPLE_ROWS = 50_000
+
+
+def is_available():
+    """
+    Checks whether the embedded columnar engine is installed.
+
+    Returns:
+        bool: True if DuckDB can be imported
+    """
+    return duckdb is not None
+
+
+def resolve_server_path(path, allowed_dir=SERVER_DATA_DIR):
+    """
+    Checks that a CSV path typed by a user lies inside the allowed server directory.
+
+    Args:
+        path (str): Path relative to allowed_dir, or absolute
+        allowed_dir (str): Directory users may read from, SERVER_DATA_DIR by default
+
+    Returns:
+        str: The resolved path of an existing file, with symbolic links followed
+
+    Raises:
+        PermissionError: If no directory is allowed or the path leaves it
+        FileNotFoundError: If the file does not exist
+    """
+    if not allowed_dir:
+        raise PermissionError("Reading files from the server is disabled")
+    root = os.path.realpath(allowed_dir)
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, resolved]) != root:
+        raise PermissionError(f"Only files in {allowed_dir} can be analysed from the server")
+    if not os.path.isfile(resolved):
+        raise FileNotFoundError(f"No such file: {path}")
+    return resolved
+
+
+def _quote(column):
+    return '"' + str(column).replace('"', '""') + '"'
+
+
+class ColumnarDataset:
+    """
+    Dataset stored as Parquet on local disk and queried through DuckDB.
+
+    It offers the parts of the pandas DataFrame API used by the app (head, describe,
+    columns, len) plus aggregation helpers, so profiling and chart preparation run
+    out-of-core on all cores with bounded memory. Only the file path is kept in the
+    object, so it can be stored in st.session_state.
+
+    Args:
+        path (str): Path of the Parquet file
+        name (str, optional): Display name of the dataset
+
+    Example:
+        >>> dataset = ColumnarDataset.from_csv("huge_sales.csv")
+        >>> dataset.describe()
+        >>> dataset.aggregate("region", "sales", "sum")
+    """
+
+    def __init__(self, path, name=None):
+        if duckdb is None:
+            raise ImportError("The large file mode requires duckdb. Install it with: pip install duckdb")
+        self.path = path
+        self.name = name or os.path.splitext(os.path.basename(path))[0]
+        self._columns = None
+        self._rows = None
+
+    @classmethod
+    def from_csv(cls, source, name=None, data_dir=DATA_DIR):
+        """
+        Converts a CSV file into a Parquet-backed dataset without loading it into pandas.
+
+        Args:
+            source (str or file-like): Path of the CSV file, or an uploaded file object
+            name (str, optional): Display name of the dataset
+            data_dir (str): Directory the Parquet file is written to
+
+        Returns:
+            ColumnarDataset: Dataset backed by the new Parquet file
+        """
+        os.makedirs(data_dir, exist_ok=True)
+        target = os.path.join(data_dir, f"{uuid.uuid4().hex}.parquet")
+        temp_path = None
+        if not isinstance(source, (str, os.PathLike)):
+            # DuckDB reads from disk, so uploaded files are streamed to a temporary CSV first
+            with tempfile.NamedTemporaryFile(suffix=".csv", dir=data_dir, delete=False) as temp:
+                source.seek(0)
+                shutil.copyfileobj(source, temp)
+                temp_path = temp.name
+            name = name or os.path.splitext(getattr(source, "name", "dataset"))[0]
+        path = temp_path or os.fspath(source)
+        try:
+            with cls._connect() as con:
+                con.execute(
+                    f"COPY (SELECT * FROM read_csv_auto(?, sample_size=-1)) TO '{target}' (FORMAT PARQUET)",
+                    [path],
+                )
+        finally:
+            if temp_path:
+                os.remove(temp_path)
+        return cls(target, name=name or os.path.splitext(os.path.basename(path))[0])
+
+    def delete(self):
+        """Removes the Parquet file of a dataset created by from_csv once it is no longer used."""
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    @staticmethod
+    def _connect():
+        con = duckdb.connect(config={
+            "memory_limit": MEMORY_LIMIT,
+            "threads": os.cpu_count() or 1,
+            "temp_directory": os.path.join(DATA_DIR, ".spill"),
+        })
+        return con
+
+    def query(self, sql, params=None):
+        """
+        Runs SQL against the dataset, which is available as the table 'data'.
+
+        Args:
+            sql (str): Query referring to the dataset as data
+            params (list, optional): Query parameters
+
+        Returns:
+            pandas.DataFrame: Query result
+        """
+        with self._connect() as con:
+            con.execute(f"CREATE VIEW data AS SELECT * FROM read_parquet('{self.path}')")
+            return con.execute(sql, params or []).df()
+
+    @property
+    def columns(self):
+        if self._columns is None:
+            schema = self.query("DESCRIBE data")
+            self._columns = pd.Index(schema["column_name"])
+            self._types = dict(zip(schema["column_name"], schema["column_type"]))
+        return self._columns
+
+    @property
+    def dtypes(self):
+        self.columns
+        return pd.Series(self._types)
+
+    @property
+    def shape(self):
+        return (len(self), len(self.columns))
+
+    def __len__(self):
+        if self._rows is None:
+            self._rows = int(self.query("SELECT count(*) AS n FROM data")["n"].iloc[0])
+        return self._rows
+
+    def numeric_columns(self):
+        """Returns the columns with a numeric SQL type."""
+        numeric_types = ("TINYINT", "SMALLINT", "INTEGER", "BIGINT", "HUGEINT", "FLOAT", "DOUBLE", "DECIMAL", "UTINYINT", "USMALLINT", "UINTEGER", "UBIGINT")
+        return [c for c in self.columns if self._types[c].startswith(numeric_types)]
+
+    def head(self, n=5):
+        return self.query(f"SELECT * FROM data LIMIT {int(n)}")
+
+    def sample(self, n=SAMPLE_ROWS, seed=0):
+        """
+        Draws a uniform random sample of rows.
+
+        Args:
+            n (int): Number of rows
+            seed (int): Sampling seed, so the sample is stable across reruns
+
+        Returns:
+            pandas.DataFrame: Sampled rows, or every row if the dataset is smaller than n
+        """
+        if len(self) <= n:
+            return self.query("SELECT * FROM data")
+        return self.query(f"SELECT * FROM data USING SAMPLE reservoir({int(n)} ROWS) REPEATABLE ({int(seed)})")
+
+    def describe(self):
+        """
+        Computes the same summary as pandas.DataFrame.describe() for the numeric columns.
+
+        Returns:
+            pandas.DataFrame: count, mean, std, min, 25%, 50%, 75% and max per numeric column
+        """
+        columns = self.numeric_columns()
+        if not columns:
+            return pd.DataFrame()
+        stats = [
+            ("count", "count({c})"),
+            ("mean", "avg({c})"),
+            ("std", "stddev_samp({c})"),
+            ("min", "min({c})"),
+            ("25%", "quantile_cont({c}, 0.25)"),
+            ("50%", "quantile_cont({c}, 0.5)"),
+            ("75%", "quantile_cont({c}, 0.75)"),
+            ("max", "max({c})"),
+        ]
+        select = ", ".join(
+            f"CAST({expr.format(c=_quote(column))} AS DOUBLE) AS {_quote(f'{column}|{stat}')}"
+            for column in columns for stat, expr in stats
+        )
+        row = self.query(f"SELECT {select} FROM data").iloc[0]
+        return pd.DataFrame(
+            {column: [row[f"{column}|{stat}"] for stat, _ in stats] for column in columns},
+            index=[stat for stat, _ in stats],
+        )
+
+    def corr(self):
+        """
+        Computes the Pearson correlation matrix of the numeric columns.
+
+        Returns:
+            pandas.DataFrame: Square correlation matrix
+        """
+        columns = self.numeric_columns()
+        if not columns:
+            return pd.DataFrame()
+        select = ", ".join(
+            f"corr({_quote(a)}, {_quote(b)}) AS {_quote(f'{a}|{b}')}"
+            for i, a in enumerate(columns) for b in columns[i + 1:]
+        ) or "1 AS unused"
+        row = self.query(f"SELECT {select} FROM data").iloc[0]
+        matrix = pd.DataFrame(1.0, index=columns, columns=columns)
+        for i, a in enumerate(columns):
+            for b in columns[i + 1:]:
+                matrix.loc[a, b] = matrix.loc[b, a] = row[f"{a}|{b}"]
+        return matrix
+
+    def aggregate(self, by, column, how="mean", limit=None):
+        """
+        Groups the dataset by one column and aggregates another.
+
+        Args:
+            by (str): Column to group by
+            column (str): Column to aggregate
+            how (str): SQL aggregate function such as mean, sum, count, min or max
+            limit (int, optional): Keep only the groups with the largest aggregate
+
+        Returns:
+            pandas.DataFrame: Columns by and column, one row per group
+        """
+        how = "avg" if how == "mean" else how
+        order = f"ORDER BY {_quote(column)} DESC LIMIT {int(limit)}" if limit else f"ORDER BY {_quote(by)}"
+        return self.query(
+            f"SELECT {_quote(by)}, {how}({_quote(column)}) AS {_quote(column)} FROM data "
+            f"GROUP BY {_quote(by)} {order}"
+        )
+
+    def chart_data(self, chart, max_points=SAMPLE_ROWS):
+        """
+        Prepares the data a chart needs without materializing the full dataset.
+
+        Args:
+            chart (dict): Chart specification with chart_type, x_column and y_column
+            max_points (int): Maximum rows returned for row-level charts
+
+        Returns:
+            pandas.DataFrame: Aggregated groups for bar (mean) and pie (sum) charts, rows
+                ordered by x for line charts, and a sample for scatter plots and histograms
+        """
+        chart_type = chart.get("chart_type")
+        x_column, y_column = chart.get("x_column"), chart.get("y_column")
+        if chart_type == "bar":
+            return self.aggregate(x_column, y_column, "mean", limit=50)
+        if chart_type == "pie":
+            return self.aggregate(x_column, y_column, "sum", limit=12)
+        columns = list(dict.fromkeys(c for c in (x_column, y_column) if c in self.columns))
+        select = ", ".join(_quote(c) for c in columns) or "*"
+        sample = f"USING SAMPLE reservoir({int(max_points)} ROWS) REPEATABLE (0)" if len(self) > max_points else ""
+        if chart_type == "line" and x_column in self.columns:
+            return self.query(f"SELECT * FROM (SELECT {select} FROM data {sample}) ORDER BY {_quote(x_column)}")
+        return self.query(f"SELECT {select} FROM data {sample}")
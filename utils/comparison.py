@@ -0,0 +1,390 @@
+import re
+import numpy as np
+import pandas as pd
+from utils.analytics import markdown_table
+from utils.geo import coordinate_role
+from utils.timeseries import IDENTIFIER
+from utils.tracing import traced
+from utils.versioning import DatasetProfile, profile_changes
+
+# Rows sampled from each dataset when measuring how many key values the two share
+KEY_SAMPLE_ROWS = 10_000
+
+# Share of sampled key values that must be found in the other dataset
+MIN_KEY_OVERLAP = 0.2
+
+# Distinct values per row above which a column counts as unique, i.e. one row per key
+MIN_KEY_UNIQUENESS = 0.99
+
+# Most groups a shared non-unique column may have to be used for alignment and drivers
+MAX_GROUPS = 1000
+
+# Rows a join may produce; many-to-many keys beyond that are compared by group instead
+MAX_JOIN_ROWS = 5_000_000
+
+# Measures and driver rows reported in a comparison
+MAX_MEASURES = 3
+MAX_DRIVERS = 10
+
+
+def _normalize(name):
+    return re.sub(r"[^a-z0-9]", "", str(name).lower())
+
+
+def _comparable(left, right):
+    # Keys of different kinds, e.g. integer ids and text ids, are matched as text
+    if pd.api.types.is_numeric_dtype(left) != pd.api.types.is_numeric_dtype(right):
+        return left.astype(str), right.astype(str)
+    return left, right
+
+
+def shared_codes(left, right):
+    """
+    Encodes the values of two key columns as integer codes of one shared category list.
+
+    Args:
+        left (pandas.Series): Key column of the first dataset
+        right (pandas.Series): Key column of the second dataset
+
+    Returns:
+        tuple: (left codes, right codes, number of categories); missing values get -1, and
+            values found only in left get codes right never has
+    """
+    left, right = _comparable(left, right)
+    right_codes, categories = pd.factorize(right)
+    left_codes = pd.Index(categories).get_indexer(left)
+    # Values only in left get codes after those of right
+    missing = (left_codes < 0) & left.notna().to_numpy()
+    if missing.any():
+        extra_codes, _ = pd.factorize(left[missing])
+        left_codes[missing] = extra_codes + len(categories)
+        return left_codes, right_codes, len(categories) + extra_codes.max() + 1
+    return left_codes, right_codes, len(categories)
+
+
+class KeyCandidate:
+    """
+    A pair of columns that can align two datasets.
+
+    Args:
+        left (str): Column of the first dataset
+        right (str): Column of the second dataset
+        left_unique (bool): Whether every row of the first dataset has its own key
+        right_unique (bool): Whether every row of the second dataset has its own key
+        overlap (float): Share of sampled key values of the first dataset found in the second
+    """
+
+    def __init__(self, left, right, left_unique, right_unique, overlap):
+        self.left = left
+        self.right = right
+        self.left_unique = left_unique
+        self.right_unique = right_unique
+        self.overlap = overlap
+
+    @property
+    def relationship(self):
+        return {
+            (True, True): "one-to-one",
+            (False, True): "many-to-one",
+            (True, False): "one-to-many",
+        }.get((self.left_unique, self.right_unique), "many-to-many")
+
+    def __repr__(self):
+        columns = self.left if self.left == self.right else f"{self.left} ↔ {self.right}"
+        return f"{columns} ({self.relationship}, {self.overlap:.0%} overlap)"
+
+
+def _uniqueness(series):
+    values = series.dropna()
+    return values.nunique() / max(1, len(values))
+
+
+@traced("comparison.detect_keys")
+def detect_keys(left, right):
+    """
+    Finds columns that can join or align two datasets.
+
+    Args:
+        left (pandas.DataFrame): First dataset, e.g. last quarter or the sales table
+        right (pandas.DataFrame): Second dataset, e.g. this quarter or the product table
+
+    Returns:
+        list: KeyCandidate objects, columns unique on at least one side first, then by overlap
+
+    Notes:
+        - Columns pair up by name, ignoring case and punctuation, and identifier-like columns
+          also pair with each other (product_id with id)
+        - A pair qualifies when at least MIN_KEY_OVERLAP of a sample of left's values occur in
+          right, and it is unique on one side or is a text or identifier column with at most
+          MAX_GROUPS values
+    """
+    pairs = [(l, r) for l in left.columns for r in right.columns if _normalize(l) == _normalize(r)]
+    identifiers = lambda df: [c for c in df.columns if IDENTIFIER.search(str(c).lower())]
+    pairs += [(l, r) for l in identifiers(left) for r in identifiers(right) if (l, r) not in pairs]
+    candidates = []
+    for l, r in pairs:
+        if pd.api.types.is_float_dtype(left[l]) or pd.api.types.is_float_dtype(right[r]):
+            continue
+        sample = left[l].dropna()
+        sample = sample.sample(min(KEY_SAMPLE_ROWS, len(sample)), random_state=0)
+        values, others = _comparable(sample, right[r].dropna())
+        overlap = float(values.isin(others.unique()).mean()) if len(values) else 0.0
+        if overlap < MIN_KEY_OVERLAP:
+            continue
+        left_unique = _uniqueness(left[l]) >= MIN_KEY_UNIQUENESS
+        right_unique = _uniqueness(right[r]) >= MIN_KEY_UNIQUENESS
+        if not (left_unique or right_unique) and not _is_dimension(left, right, l, r):
+            continue
+        candidates.append(KeyCandidate(l, r, left_unique, right_unique, overlap))
+    return sorted(candidates, key=lambda c: (not (c.left_unique or c.right_unique), -c.overlap))
+
+
+@traced("comparison.join")
+def join(left, right, left_on, right_on=None, how="left", suffix="_right", max_rows=MAX_JOIN_ROWS):
+    """
+    Joins two datasets on a key with a sorted merge of shared integer codes.
+
+    Only the key columns are encoded and the rows of each side are gathered once, so no
+    intermediate copies of either dataset are made, whatever the key's cardinality.
+
+    Args:
+        left (pandas.DataFrame): Dataset whose rows are kept
+        right (pandas.DataFrame): Dataset whose columns are added
+        left_on (str): Key column of left
+        right_on (str, optional): Key column of right, left_on if not given
+        how (str): "left" keeps rows of left without a match, "inner" drops them
+        suffix (str): Added to right's column names that left already has
+        max_rows (int): Maximum rows of the result
+
+    Returns:
+        pandas.DataFrame: The rows of left in their order, each repeated once per matching row
+            of right, with right's columns except its key
+
+    Raises:
+        ValueError: If how is unknown or the join would produce more than max_rows rows
+    """
+    if how not in ("left", "inner"):
+        raise ValueError(f"Unknown join type: {how}")
+    right_on = right_on or left_on
+    left_codes, right_codes, categories = shared_codes(left[left_on], right[right_on])
+    # Rows of right sorted by key code, and where each code's run starts
+    valid_right = np.flatnonzero(right_codes >= 0)
+    order = valid_right[np.argsort(right_codes[valid_right], kind="stable")]
+    counts = np.bincount(right_codes[valid_right], minlength=categories)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    matches = np.where(left_codes >= 0, counts[np.maximum(left_codes, 0)], 0)
+    if how == "left":
+        # Rows without a match appear once, with missing values from right
+        repeats = np.maximum(matches, 1)
+    else:
+        repeats = matches
+    total = int(repeats.sum())
+    if total > max_rows:
+        raise ValueError(
+            f"Joining on {left_on} would produce {total:,} rows, more than {max_rows:,}; "
+            f"compare the datasets by {left_on} instead"
+        )
+    left_rows = np.repeat(np.arange(len(left)), repeats)
+    offset = np.arange(total) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+    matched = np.repeat(matches > 0, repeats)
+    right_rows = np.full(total, -1)
+    positions = np.repeat(starts[np.maximum(left_codes, 0)], repeats) + offset
+    right_rows[matched] = order[positions[matched]]
+    result = {column: left[column].take(left_rows).to_numpy() for column in left.columns}
+    for column in right.columns:
+        if column == right_on:
+            continue
+        name = f"{column}{suffix}" if column in result else column
+        result[name] = pd.api.extensions.take(right[column].to_numpy(), right_rows, allow_fill=True)
+    return pd.DataFrame(result, columns=list(result))
+
+
+def _is_dimension(left, right, l, r=None):
+    # Text or identifier columns with few enough values to group by
+    r = r or l
+    numeric = pd.api.types.is_numeric_dtype(left[l]) or pd.api.types.is_numeric_dtype(right[r])
+    if numeric and not IDENTIFIER.search(str(l).lower()):
+        return False
+    return max(left[l].nunique(), right[r].nunique()) <= MAX_GROUPS
+
+
+def _measures(left, right):
+    shared = [c for c in left.columns if c in right.columns]
+    numeric = lambda df, c: pd.api.types.is_numeric_dtype(df[c]) and not pd.api.types.is_bool_dtype(df[c])
+    return [
+        c for c in shared
+        if numeric(left, c) and numeric(right, c) and not IDENTIFIER.search(str(c).lower()) and coordinate_role(c) is None
+    ]
+
+
+def _group_sums(left, right, dimension, measure):
+    left_codes, right_codes, categories = shared_codes(left[dimension], right[dimension])
+    labels = pd.concat([left[dimension], right[dimension]], ignore_index=True)
+    codes = np.concatenate([left_codes, right_codes])
+    names = pd.Series(labels.to_numpy(), index=codes)
+    names = names[~names.index.duplicated()].reindex(range(categories))
+    sums = lambda c, values: np.bincount(c[c >= 0], weights=values[c >= 0], minlength=categories)
+    before = sums(left_codes, left[measure].fillna(0).to_numpy(dtype="float64"))
+    after = sums(right_codes, right[measure].fillna(0).to_numpy(dtype="float64"))
+    return names.to_numpy(), before, after
+
+
+class Comparison:
+    """
+    Comparative profile of two datasets, small enough to show and to send to the model.
+
+    Attributes:
+        names (tuple): Names of the baseline and the comparison dataset
+        rows (tuple): Row counts of both datasets
+        schema (pandas.DataFrame): Columns added, removed or with a changed type
+        columns (pandas.DataFrame): Per shared column the mean, distinct count and most
+            frequent value in both datasets, largest relative change of the mean first
+        keys (pandas.DataFrame): Key values only in the baseline, only in the comparison and in both
+        matched (pandas.DataFrame): For one-to-one keys, per measure the matched rows whose value
+            changed, the total change and the key with the largest change
+        drivers (pandas.DataFrame): Groups that contribute most to the change of each measure's total
+    """
+
+    def __init__(self, names, rows, schema, columns, keys, matched, drivers):
+        self.names = names
+        self.rows = rows
+        self.schema = schema
+        self.columns = columns
+        self.keys = keys
+        self.matched = matched
+        self.drivers = drivers
+
+    def sections(self):
+        """
+        Lists the non-empty tables of the comparison.
+
+        Returns:
+            list: (title, table, index label) tuples in the order they are shown
+        """
+        tables = (
+            ("Schema Changes", self.schema, "Column"),
+            ("Column Changes", self.columns, "Column"),
+            ("Key Overlap", self.keys, None),
+            ("Matched Rows", self.matched, "Measure"),
+            ("Drivers Of Change", self.drivers, None),
+        )
+        return [(title, table, label) for title, table, label in tables if not table.empty]
+
+    def summary(self):
+        """Returns the row counts of both datasets as a markdown bullet."""
+        return f"- Rows: {self.rows[0]:,} in {self.names[0]}, {self.rows[1]:,} in {self.names[1]}\n"
+
+    def to_markdown(self):
+        """
+        Renders the comparison as markdown.
+
+        Returns:
+            str: Row counts followed by one subsection per non-empty table
+        """
+        parts = [self.summary()]
+        for title, table, index_label in self.sections():
+            parts.append(f"### {title}\n\n{markdown_table(table, index_label=index_label)}")
+        return "\n".join(parts)
+
+
+@traced("comparison.compare")
+def compare(left, right, key=None, names=("baseline", "comparison")):
+    """
+    Compares two datasets, e.g. two quarters of the same extract.
+
+    Args:
+        left (pandas.DataFrame): Baseline dataset
+        right (pandas.DataFrame): Dataset compared with the baseline
+        key (KeyCandidate, optional): Columns aligning the datasets
+        names (tuple): Names of the two datasets used in the tables
+
+    Returns:
+        Comparison: The comparative profile
+
+    Notes:
+        - Column statistics come from versioning.DatasetProfile sketches of each dataset
+        - Drivers split the change in each measure's total, for the MAX_MEASURES measures whose
+          mean changed most, over the groups of every shared text or identifier column with at
+          most MAX_GROUPS values, and keep the MAX_DRIVERS largest contributions
+        - Measures are shared numeric columns other than identifiers, coordinates and the key
+        - Columns unique in both datasets, and a unique key, are not used as driver dimensions
+    """
+    schema_rows = []
+    for column in dict.fromkeys([*left.columns, *right.columns]):
+        before = str(left[column].dtype) if column in left.columns else None
+        after = str(right[column].dtype) if column in right.columns else None
+        if before != after:
+            status = "added" if before is None else "removed" if after is None else "type changed"
+            schema_rows.append({"column": column, "status": status, f"dtype_{names[0]}": before, f"dtype_{names[1]}": after})
+    schema = pd.DataFrame(schema_rows).set_index("column") if schema_rows else pd.DataFrame()
+
+    shared = [c for c in right.columns if c in left.columns]
+    if not shared:
+        # Nothing to profile side by side; the schema table lists every column as added or removed
+        return Comparison(names, (len(left), len(right)), schema, pd.DataFrame(), pd.DataFrame(), pd.DataFrame(), pd.DataFrame())
+    columns = profile_changes(DatasetProfile.from_frame(left[shared]), DatasetProfile.from_frame(right[shared]), k=len(shared))
+    # A numeric key such as sku is not a measure, even when its name does not look like an identifier
+    key_columns = {key.left, key.right} if key is not None else set()
+    candidates = set(_measures(left, right)) - key_columns
+    measures = [c for c in columns.index if c in candidates][:MAX_MEASURES]
+
+    keys = matched = pd.DataFrame()
+    if key is not None:
+        left_codes, right_codes, categories = shared_codes(left[key.left], right[key.right])
+        in_left = np.bincount(left_codes[left_codes >= 0], minlength=categories) > 0
+        in_right = np.bincount(right_codes[right_codes >= 0], minlength=categories) > 0
+        keys = pd.DataFrame({
+            "key": [key.left] * 3,
+            "values": [f"only in {names[0]}", f"only in {names[1]}", "in both"],
+            "count": [int((in_left & ~in_right).sum()), int((in_right & ~in_left).sum()), int((in_left & in_right).sum())],
+        })
+        if key.relationship == "one-to-one":
+            matched = _matched_changes(left, right, key, measures)
+
+    drivers = []
+    # Columns with one row per value, such as order_id, would only list single rows
+    dimensions = [
+        c for c in shared
+        if c not in measures and _is_dimension(left, right, c)
+        and not (c in key_columns and (key.left_unique or key.right_unique))
+        and min(_uniqueness(left[c]), _uniqueness(right[c])) < MIN_KEY_UNIQUENESS
+    ]
+    for measure in measures:
+        total_change = right[measure].sum() - left[measure].sum()
+        for dimension in dimensions:
+            groups, before, after = _group_sums(left, right, dimension, measure)
+            for i in np.argsort(-np.abs(after - before))[:MAX_DRIVERS]:
+                drivers.append({
+                    "measure": measure,
+                    "dimension": dimension,
+                    "group": groups[i],
+                    names[0]: before[i],
+                    names[1]: after[i],
+                    "change": after[i] - before[i],
+                    "share_of_change_pct": 100 * (after[i] - before[i]) / total_change if total_change else np.nan,
+                })
+    drivers = pd.DataFrame(drivers)
+    if not drivers.empty:
+        drivers = drivers.reindex(drivers["change"].abs().sort_values(ascending=False).index).head(MAX_DRIVERS).reset_index(drop=True)
+    return Comparison(names, (len(left), len(right)), schema, columns, keys, matched, drivers)
+
+
+def _matched_changes(left, right, key, measures):
+    # Rows with the same key in both datasets, compared value by value
+    joined = join(left[[key.left, *measures]], right[[key.right, *measures]], key.left, key.right, how="inner", suffix="__after")
+    rows = []
+    for measure in measures:
+        before = joined[measure].astype("float64")
+        after = joined[f"{measure}__after"].astype("float64")
+        change = after - before
+        changed = change.fillna(0).ne(0)
+        largest = change.abs().idxmax() if changed.any() else None
+        rows.append({
+            "measure": measure,
+            "matched_rows": len(joined),
+            "changed_rows": int(changed.sum()),
+            "total_change": float(change.sum()),
+            "largest_change_key": joined[key.left].iloc[largest] if largest is not None else None,
+            "largest_change": float(change.iloc[largest]) if largest is not None else np.nan,
+        })
+    return pd.DataFrame(rows).set_index("measure")
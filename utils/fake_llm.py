@@ -0,0 +1,139 @@
+import json
+import re
+import time
+
+CONTEXT_TEXT = """This dataset appears to be a tabular extract of operational records. Each row is one
+observation with a mix of categorical attributes and numerical measures.
+
+- **Domain:** business / operations
+- **Tracking:** amounts, counts and categories over time
+- **Likely goal:** compare groups, follow trends and find unusual records"""
+
+REPORT_TEXT = """# Dataset Analysis Report
+
+## 1. Dataset Description
+
+The dataset contains structured records with categorical and numerical columns. It most likely
+belongs to the business domain and mixes numerical measures with categorical attributes.
+
+## Statistical Overview
+
+[[STATISTICS_TABLES]]
+
+The computed statistics show measures on comparable scales with few missing values. Columns with
+large IQR outlier counts deserve a closer look before drawing conclusions.
+
+## 3. Hidden Patterns
+
+- Group-level differences between categories are moderate.
+- The strongest correlations listed above indicate related measures.
+- A small number of records fall outside the typical range.
+
+## 5. Key Findings
+
+- The data is complete enough for reliable aggregate analysis.
+- A few measures move together and can be monitored jointly.
+- Outliers should be reviewed with the data owner.
+"""
+
+CHANGES_TEXT = """- The appended rows follow the same structure as the previous extract.
+- Averages of the main measures moved only slightly; the table below lists the largest shifts.
+- The number of distinct values grew in line with the new rows.
+- Keep monitoring the columns with the largest change in the next extract."""
+
+COMPARISON_TEXT = """- The comparison dataset has more rows than the baseline, with the same columns.
+- The total of the main measure rose; the drivers table attributes most of the change to a few groups.
+- Matched rows changed value for value, so the difference is not only due to new rows.
+- Check whether the leading groups' growth continues in the next extract."""
+
+ANSWER_TEXT = """Based on the report excerpts, the answer depends on the grouped statistics. The relevant
+section shows that the leading group is ahead on the main measure, while the remaining groups are
+close to each other. Review the suggested charts for the full breakdown."""
+
+
+class _Usage:
+    def __init__(self, prompt_tokens, response_tokens):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = response_tokens
+        self.total_token_count = prompt_tokens + response_tokens
+
+
+class FakeResponse:
+    """Response object with the text and usage_metadata attributes of a Gemini response."""
+
+    def __init__(self, text, prompt_tokens):
+        self.text = text
+        self.usage_metadata = _Usage(prompt_tokens, max(1, len(text) // 4))
+
+
+class FakeModel:
+    """
+    Deterministic stand-in for google.generativeai.GenerativeModel.
+
+    It recognises which task a prompt belongs to and returns canned context, report,
+    chart JSON or Q&A text after a configurable delay, so performance can be measured
+    offline and reproducibly.
+
+    Args:
+        model_name (str): Name reported by the model
+        system_instruction (str, optional): Ignored, accepted for API compatibility
+        latency (float): Fixed delay in seconds before every response
+        seconds_per_token (float): Additional delay per response token, to mimic streaming cost
+
+    Example:
+        >>> model = FakeModel("gemini-2.0-flash", latency=0.5)
+        >>> model.generate_content(contents="Given the following dataset : ...").text
+    """
+
+    def __init__(self, model_name, system_instruction=None, latency=0.0, seconds_per_token=0.0):
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+        self.latency = latency
+        self.seconds_per_token = seconds_per_token
+        self.calls = 0
+
+    def _respond(self, prompt):
+        if "Candidate charts:" in prompt:
+            # Re-rank request: return the candidates unchanged, in the same order
+            match = re.search(r"Candidate charts:\s*(\[.*?\])\s*\n\s*Re-rank", prompt, re.DOTALL)
+            return match.group(1) if match else "[]"
+        if "pure JSON" in prompt:
+            described = prompt.split("Suggest", 1)[0]
+            # Column names are the keys of a column type mapping, or else any quoted names
+            names = re.findall(r"'([^']+)': '", described) or re.findall(r"'([^']+)'", described)
+            columns = names[:2] or ["variable", "value"]
+            return json.dumps([{
+                "chart_type": "bar",
+                "x_column": columns[0],
+                "y_column": columns[-1],
+                "reason": "Compares the measure across groups.",
+            }])
+        if "What Changed" in prompt:
+            return CHANGES_TEXT
+        if "Differences And Drivers" in prompt:
+            return COMPARISON_TEXT
+        if "User Query:" in prompt:
+            return ANSWER_TEXT
+        if "Generate a detailed report" in prompt or "[[STATISTICS_TABLES]]" in prompt:
+            return REPORT_TEXT
+        return CONTEXT_TEXT
+
+    def generate_content(self, contents, **kwargs):
+        """
+        Returns the canned response for a prompt.
+
+        Args:
+            contents (str): Prompt text
+            **kwargs: Ignored, accepted for API compatibility
+
+        Returns:
+            FakeResponse: Response with text and usage_metadata
+        """
+        self.calls += 1
+        prompt = str(contents)
+        text = self._respond(prompt)
+        response = FakeResponse(text, max(1, len(prompt) // 4))
+        delay = self.latency + self.seconds_per_token * response.usage_metadata.candidates_token_count
+        if delay > 0:
+            time.sleep(delay)
+        return response
@@ -0,0 +1,53 @@
+import hashlib
+import pandas as pd
+
+
+def row_hashes(df):
+    """
+    Hashes every row of a dataset.
+
+    Args:
+        df (pandas.DataFrame): Dataset to hash
+
+    Returns:
+        numpy.ndarray: One uint64 hash per row, independent of the index
+    """
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+
+def dataset_hash(df, hashes=None):
+    """
+    Computes a content hash of a dataset.
+
+    Args:
+        df (pandas.DataFrame): Dataset to hash
+        hashes (numpy.ndarray, optional): Output of row_hashes(df), if already computed
+
+    Returns:
+        str: Hex digest that changes whenever a value, column name, dtype or row order changes
+
+    Example:
+        >>> dataset_hash(pd.read_csv("sales_data.csv"))
+        '3f1c9a...'
+    """
+    digest = hashlib.sha256()
+    digest.update(repr(list(zip(map(str, df.columns), map(str, df.dtypes)))).encode())
+    digest.update((row_hashes(df) if hashes is None else hashes).tobytes())
+    return digest.hexdigest()
+
+
+def text_hash(*parts):
+    """
+    Computes a hash of one or more text values, such as a report and its context.
+
+    Args:
+        *parts: Values to hash; None is treated as an empty string
+
+    Returns:
+        str: Hex digest of the values
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(("" if part is None else str(part)).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
@@ -0,0 +1,154 @@
+import math
+import os
+import numpy as np
+import pandas as pd
+import streamlit as st
+from utils import geo, timeseries
+from utils.tracing import span
+
+# Largest payload sent to the browser for one element; larger frames are thinned out
+MAX_PAYLOAD_BYTES = int(os.getenv("DATTAVISM_MAX_PAYLOAD_BYTES", 5 * 1024 * 1024))
+
+# Points of a line or area chart; longer series are decimated keeping each bucket's min and max
+MAX_LINE_POINTS = 2000
+
+# Points of scatter plots
+MAX_SAMPLE_POINTS = 5000
+
+# Bars of a bar chart, the groups with the highest mean
+MAX_BARS = 50
+
+# Slices of a pie chart; the remaining groups are summed into "Other"
+MAX_SLICES = 12
+
+# Rows of one page of a table preview
+PREVIEW_PAGE_ROWS = 50
+
+
+def _sort_by(frame, column):
+    if column not in frame.columns or frame[column].is_monotonic_increasing:
+        return frame
+    try:
+        return frame.sort_values(column, kind="stable")
+    except TypeError:
+        return frame
+
+
+def decimate(frame, x_column, y_column, max_points=MAX_LINE_POINTS):
+    """
+    Thins out a series for a line chart while keeping its peaks and troughs.
+
+    Args:
+        frame (pandas.DataFrame): Rows sorted by x_column
+        x_column (str): Column on the x-axis
+        y_column (str): Numeric column on the y-axis
+        max_points (int): Maximum rows returned
+
+    Returns:
+        pandas.DataFrame: The rows holding the minimum and maximum of y in each of
+            max_points / 2 consecutive buckets, in their original order
+    """
+    if len(frame) <= max_points:
+        return frame
+    buckets = max(1, max_points // 2)
+    values = pd.to_numeric(frame[y_column], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    bucket = np.arange(len(frame)) * buckets // len(frame)
+    if np.isnan(values).all():
+        return frame.iloc[np.unique(np.searchsorted(bucket, np.arange(buckets)))]
+    # NaN never wins a bucket's min or max, and buckets of only NaN keep their first row
+    lows = pd.Series(np.where(np.isnan(values), np.inf, values)).groupby(bucket).idxmin()
+    highs = pd.Series(np.where(np.isnan(values), -np.inf, values)).groupby(bucket).idxmax()
+    return frame.iloc[np.union1d(lows.to_numpy(), highs.to_numpy())]
+
+
+def chart_data(df, chart):
+    """
+    Reduces a dataset to what one suggested chart displays, before it is drawn or sent to the browser.
+
+    Args:
+        df (pandas.DataFrame): Dataset to plot
+        chart (dict): Chart specification with chart_type, x_column and y_column
+
+    Returns:
+        pandas.DataFrame: Only the plotted columns; bar charts get the MAX_BARS groups with the
+            highest mean, pie charts the MAX_SLICES largest sums plus "Other", line and area
+            charts over dates period means with a rolling mean (timeseries.line_frame) and
+            other line charts a decimated series sorted by x, scatter plots a sample, and maps the
+            points binned into at most geo.MAX_MAP_CELLS cells
+    """
+    chart_type = chart.get("chart_type")
+    x_column, y_column = chart.get("x_column"), chart.get("y_column")
+    if chart_type == "map":
+        cells = geo.map_cells(df, chart)
+        return cells if cells is not None else df.iloc[:0]
+    columns = list(dict.fromkeys(c for c in (x_column, y_column) if c in df.columns))
+    frame = df[columns]
+    if chart_type in ("bar", "pie") and x_column in frame.columns and y_column in frame.columns and x_column != y_column:
+        how = "mean" if chart_type == "bar" else "sum"
+        groups = frame.groupby(x_column, sort=False, observed=True)[y_column].agg(how)
+        if chart_type == "bar":
+            groups = groups.nlargest(MAX_BARS)
+        elif len(groups) > MAX_SLICES:
+            groups = groups.sort_values(ascending=False)
+            other = pd.Series([groups.iloc[MAX_SLICES - 1:].sum()], index=["Other"])
+            groups = pd.concat([groups.iloc[:MAX_SLICES - 1], other])
+        return pd.DataFrame({x_column: groups.index, y_column: groups.to_numpy()})
+    if chart_type in ("line", "area") and x_column in frame.columns and y_column in frame.columns:
+        series = timeseries.line_frame(frame, x_column, y_column)
+        if series is not None:
+            return series
+        return decimate(_sort_by(frame, x_column), x_column, y_column)
+    if chart_type == "scatter" and len(frame) > MAX_SAMPLE_POINTS:
+        return frame.sample(MAX_SAMPLE_POINTS, random_state=0).sort_index()
+    return frame
+
+
+def bounded(frame, element):
+    """
+    Caps the payload of a frame sent to the browser and records its size.
+
+    Args:
+        frame (pandas.DataFrame): Frame about to be passed to a Streamlit element
+        element (str): Name of the element, e.g. "line_chart" or "preview"
+
+    Returns:
+        pandas.DataFrame: The frame, or every n-th row of it if it is larger than MAX_PAYLOAD_BYTES
+
+    Notes:
+        - Every call is recorded as a frontend.payload span with the element, rows and bytes
+    """
+    size = int(frame.memory_usage(index=True, deep=True).sum())
+    with span("frontend.payload", element=element, rows=len(frame), bytes=size) as payload:
+        if size > MAX_PAYLOAD_BYTES:
+            step = math.ceil(size / MAX_PAYLOAD_BYTES)
+            frame = frame.iloc[::step]
+            payload.set("capped_rows", len(frame))
+            payload.set("capped_bytes", int(frame.memory_usage(index=True, deep=True).sum()))
+    return frame
+
+
+def _page_rows(dataset, start, n):
+    if isinstance(dataset, pd.DataFrame):
+        return dataset.iloc[start:start + n]
+    # Out-of-core datasets only read the requested page
+    return dataset.query(f"SELECT * FROM data LIMIT {int(n)} OFFSET {int(start)}")
+
+
+def paged_preview(dataset, key, page_rows=PREVIEW_PAGE_ROWS):
+    """
+    Shows a dataset one page at a time, so only the visible rows are sent to the browser.
+
+    Args:
+        dataset (pandas.DataFrame or ColumnarDataset): Dataset to preview
+        key (str): Widget key of the page selector, unique on the page
+        page_rows (int): Rows per page
+
+    Example:
+        >>> paged_preview(df, key="overview_preview")
+    """
+    total = len(dataset)
+    pages = max(1, math.ceil(total / page_rows))
+    page = st.number_input("Page", min_value=1, max_value=pages, value=1, step=1, key=key) if pages > 1 else 1
+    start = (int(page) - 1) * page_rows
+    st.dataframe(bounded(_page_rows(dataset, start, page_rows), "preview"))
+    st.caption(f"Rows {min(start + 1, total):,}-{min(start + page_rows, total):,} of {total:,}")
@@ -1,16 +1,61 @@
-import os
+import re
 import pandas as pd
-import google.generativeai as genai
+from utils.llm import generate, token_budget
+from utils.prompt_budget import column_types, estimate_tokens, fit_items, sample_table, summarize_history
+from utils.tracing import traced
+from utils.retrieval import build_qa_index
+from utils.analytics import compute_statistics, statistics_to_markdown, markdown_table
+from utils.versioning import profile_changes
 
-# Configure Gemini AI with API key from environment variables
-Api_Key = os.getenv("GEMINI_API")
-genai.configure(
-    api_key= Api_Key
-)
+# System instruction of the Gemini model used for data analysis
+SYSTEM_INSTRUCTION = "You are a data analysis assistant. You will help users analyze their datasets and generate insights."
 
-# Initialize Gemini AI model with data analysis capabilities
-model = genai.GenerativeModel("gemini-2.0-flash", system_instruction="You are a data analysis assistant. You will help users analyze their datasets and generate insights.")
+# Marker the model writes where the locally computed statistics tables are inserted
+STATISTICS_PLACEHOLDER = "[[STATISTICS_TABLES]]"
 
+# Heading of the section added to a report when rows are appended to its dataset
+CHANGES_HEADING = "## What Changed"
+
+# Heading of the report comparing two datasets
+COMPARISON_HEADING = "## Differences And Drivers"
+
+# Rows per statistics table tried in turn when the tables exceed their share of a prompt budget
+PROMPT_TABLE_ROWS = (20, 10, 5)
+
+# Shortest usable description; shorter responses are retried with a larger model
+MIN_RESPONSE_CHARS = 40
+
+# Openings of responses that decline to answer instead of answering, retried with a larger model
+REFUSAL = re.compile(r"^\W*(i'?m sorry|sorry|i cannot|i can'?t|i am unable|i'?m unable|as an ai)\b", re.IGNORECASE)
+
+
+def _is_description(text):
+    return len(text.strip()) >= MIN_RESPONSE_CHARS
+
+
+def _is_answer(text):
+    # Short answers such as "North, with 1,204 units." are fine; empty ones and refusals are not
+    return bool(text.strip()) and not REFUSAL.match(text.strip())
+
+
+def _is_report(text):
+    return len(text.strip()) >= 10 * MIN_RESPONSE_CHARS and (STATISTICS_PLACEHOLDER in text or "## " in text)
+
+
+def _is_bullet_list(text):
+    return any(line.lstrip().startswith(("-", "*", "•")) for line in text.splitlines())
+
+
+def _fit_table(table, max_tokens, **markdown_options):
+    # Renders a table for a prompt, keeping fewer rows until it fits its budget
+    text = markdown_table(table, **markdown_options)
+    for rows in PROMPT_TABLE_ROWS:
+        if estimate_tokens(text) <= max_tokens or len(table) <= rows:
+            break
+        text = markdown_table(table.head(rows), **markdown_options) + f"(first {rows} of {len(table)} rows)\n"
+    return text
+
+@traced("gemini.context_detection")
 def context_detection(data):
     """
     Analyzes a dataset to determine its context and domain.
@@ -24,6 +69,10 @@ def context_detection(data):
             - Domain/sector classification
             - Information being tracked
             - Potential analysis objectives
+
+    Notes:
+        - The dataset is described by its shape, column types and sample rows compressed to
+          token_budget("context")
             
     Example:
         >>> df = pd.read_csv("sales_data.csv")
@@ -31,24 +80,29 @@ def context_detection(data):
         >>> print(context)
     """
     content = pd.DataFrame(data)
+    budget = token_budget("context")
     prompt = f"""
-            Given the following dataset : {content}, describe:
+            Given the following dataset of {content.shape[0]:,} rows x {content.shape[1]} columns
+            with column types {column_types(content, budget // 4)} and sample rows :
+            {sample_table(content, budget // 2)}
+            describe:
             - What the dataset is about
             - Which domain or sector it most likely belongs to (e.g., business, healthcare, science, finance, etc.)
             - What kind of information it is tracking
             - What the user might be trying to analyze using this data
     """
-    model_response = model.generate_content(
-        contents=prompt
-    )
+    model_response = generate(SYSTEM_INSTRUCTION, prompt, task="context", validate=_is_description)
     return model_response.text
 
-def generate_report(data):
+@traced("gemini.generate_report")
+def generate_report(data, segments=None):
     """
     Generates a comprehensive analysis report from the provided dataset.
     
     Args:
         data (pandas.DataFrame): The dataset to analyze
+        segments (segmentation.Segmentation, optional): Segments of the dataset if already
+            computed, passed to compute_statistics
         
     Returns:
         str: A detailed markdown-formatted report containing:
@@ -61,7 +115,11 @@ def generate_report(data):
             
     Notes:
         - Report is generated in markdown format suitable for PDF conversion
-        - Includes detailed statistical analysis and business insights
+        - Statistics are computed locally by utils.analytics and inserted as exact tables;
+          the model only writes the narrative around them
+        - The prompt is compressed to token_budget("report"): sample rows and column types are
+          trimmed, and statistics tables are cut to fewer rows in the prompt while the report
+          gets them in full
         - No code snippets are included in the output
         
     Example:
@@ -70,10 +128,24 @@ def generate_report(data):
         >>> print(report)
     """
     content = pd.DataFrame(data)
+    stats = compute_statistics(content, segments=segments)
+    statistics = statistics_to_markdown(stats)
+    budget = token_budget("report")
+    prompt_statistics = statistics
+    for rows in PROMPT_TABLE_ROWS:
+        if estimate_tokens(prompt_statistics) <= budget // 2:
+            break
+        prompt_statistics = statistics_to_markdown(stats, max_rows=rows)
     prompt = f"""
-    You are a domain expert. Based on the column names, data types, and sample values below, guess what kind of dataset this is and describe the type of analysis that would be useful.
+    You are a domain expert. Based on the column names, data types, sample values and computed statistics below, guess what kind of dataset this is and describe the type of analysis that would be useful.
 
-    DataSet : {content}
+    DataSet : {content.shape[0]} rows x {content.shape[1]} columns
+    Column types : {column_types(content, budget // 8)}
+    Sample rows :
+    {sample_table(content, budget // 8)}
+
+    Computed statistics (exact, calculated over the full dataset) :
+    {prompt_statistics}
 
     Report generated by you should be of more than 2 pages and should be in a professional tone.
 
@@ -83,21 +155,20 @@ def generate_report(data):
             - The domain or industry it belongs to (e.g., business, healthcare, research)
             - The type of data it contains (e.g., numerical, categorical, time series)
         
-        2. Provide a statistical overview of the dataset:
-            - For numerical columns: mean, median, mode, min, max, and standard deviation
-            - For categorical columns: list the most frequent categories and their counts
-            - Mention any columns that have unusually high or low values (potential outliers)
-            - Identify any strong correlations between numerical columns
-            - Identify any missing values in key columns
+        2. A section headed "## Statistical Overview" that contains only the line {STATISTICS_PLACEHOLDER}
+           followed by your interpretation of the computed statistics:
+            - Columns that have unusually high or low values (potential outliers)
+            - Strong correlations between numerical columns and what they may mean
+            - Missing values in key columns and how they affect the analysis
             
                     
         3. Examine the dataset and uncover hidden patterns.
             Look for:
-            - Trends or seasonality (if applicable)
+            - Trends or seasonality (if applicable; interpret the computed Trends And Seasonality
+              and Change Points tables when they are present instead of guessing from the sample rows)
             - Group-level patterns (e.g., category-wise differences)
-            - Correlations between features(show and calculate correlations )
-            - Clusters or data segments
-            - Outliers or anomalies
+            - Clusters or data segments (interpret the computed Segments table when it is present)
+            - Outliers or anomalies (explain the rows in the computed Top Anomalies table when it is present)
         
         (optional) only if a dataset is related to business or sales(it should be in very detailed manner and should account for all the columns in the dataset):
         4. Business Recommendations:
@@ -107,29 +178,112 @@ def generate_report(data):
             - Risk factors and mitigation
             - Customer segmentation strategies
             - Any other actionable insights based on the data
-
-
-        4. top insights under the following categories:
-            1. Top 5 columns with the most unique values
-            2. Top 5 most frequent values from the top categorical columns
-            3. Top 5 strongest correlations between numerical columns (positive or negative)
-            4. Top 5 columns with the highest percentage of missing values
-            5. Top 5 numerical columns with the highest average values
         
         5. Based on the analysis of the dataset below, summarize:
             - Key findings in 3-5 bullet points
             - Practical recommendations or next steps a user could take
             - Any interesting observations or actions worth pursuing
     
-    Note : No need to include any code or programming language in the response and all the calculations should be done by you and their answers are to be provided by you in table form.
+    Note : No need to include any code or programming language in the response. Do not recalculate or repeat the computed statistics tables, they are inserted in place of {STATISTICS_PLACEHOLDER}; quote their values where your narrative refers to them.
            and the report should be in markdown and that are suitable for PDF and response by you should be in detailed manner and should be in a professional tone, don't add any opening or closing statements (e.g.,"Okay, I will generate a detailed report based on the plant growth dataset you provided.",etc.)
     """
-    model_response = model.generate_content(
-        contents=f"Generate a detailed report on this data based on its {prompt}"
+    model_response = generate(SYSTEM_INSTRUCTION, f"Generate a detailed report on this data based on its {prompt}", task="report", validate=_is_report)
+    narrative = model_response.text
+    if STATISTICS_PLACEHOLDER in narrative:
+        return narrative.replace(STATISTICS_PLACEHOLDER, statistics, 1)
+    return f"{narrative}\n\n## Statistical Overview\n\n{statistics}"
+
+@traced("gemini.update_report")
+def update_report(previous_report, previous_profile, profile, appended):
+    """
+    Updates the report of a dataset after rows were appended to it.
+
+    Only the new rows and the merged column statistics are sent to the model, which
+    writes a "What Changed" section; the rest of the previous report is kept.
+
+    Args:
+        previous_report (str): Report generated for the previous version
+        previous_profile (versioning.DatasetProfile): Profile of the previous version
+        profile (versioning.DatasetProfile): Profile of the new version
+        appended (pandas.DataFrame): The appended rows
+
+    Returns:
+        str: The previous report followed by a "What Changed" section with the model's
+            summary, the column changes and the updated column statistics
+
+    Example:
+        >>> version = versioning.get_store().register("sales", df)
+        >>> report = update_report(old_report, version["previous_profile"], version["profile"],
+        ...                        df.tail(version["delta_rows"]))
+    """
+    change_table = profile_changes(previous_profile, profile)
+    changes = markdown_table(change_table, index_label="Column")
+    budget = token_budget("report.changes")
+    prompt = f"""
+    A dataset you wrote a report on received {len(appended):,} new rows. It had {previous_profile.rows:,} rows and now has {profile.rows:,}.
+
+    Column changes between the previous and the new version (exact, computed locally) :
+    {_fit_table(change_table, budget // 2, index_label="Column")}
+
+    Sample of the appended rows :
+    {sample_table(appended, budget // 4)}
+
+    Write the body of a section titled "What Changed" for the report: 3 to 6 bullet points on the
+    most important differences, what they may mean and what to watch next. Do not add headings,
+    do not repeat the table, do not include code or opening and closing statements.
+    """
+    model_response = generate(SYSTEM_INSTRUCTION, prompt, task="report.changes", validate=_is_bullet_list)
+    base = previous_report.split(f"\n{CHANGES_HEADING}")[0].rstrip()
+    return (
+        f"{base}\n\n{CHANGES_HEADING}\n\n"
+        f"_The sections above describe the previous version ({previous_profile.rows:,} rows); "
+        f"the figures below cover all {profile.rows:,} rows._\n\n"
+        f"{model_response.text}\n\n"
+        f"### Column Changes\n\n{changes}\n"
+        f"### Updated Column Statistics\n\n{markdown_table(profile.summary(), index_label='Column')}"
+    )
+
+@traced("gemini.compare_datasets")
+def compare_datasets(comparison):
+    """
+    Explains the differences between two datasets and what drives them.
+
+    Only the locally computed comparison tables are sent to the model, never the rows.
+
+    Args:
+        comparison (comparison.Comparison): Output of comparison.compare
+
+    Returns:
+        str: A "Differences And Drivers" section with the model's summary followed by the
+            full comparison tables
+
+    Example:
+        >>> result = comparison.compare(q1, q2, key, names=("Q1", "Q2"))
+        >>> st.markdown(compare_datasets(result))
+    """
+    budget = token_budget("comparison")
+    sections = comparison.sections()
+    share = budget // max(1, len(sections))
+    tables = "\n".join(
+        f"{title} :\n{_fit_table(table, share, index_label=label)}" for title, table, label in sections
     )
-    return model_response.text 
+    baseline, current = comparison.names
+    prompt = f"""
+    Compare two datasets: the baseline "{baseline}" and "{current}".
+    {comparison.summary()}
+    Differences (exact, computed locally) :
+    {tables}
+
+    Write the body of a section titled "Differences And Drivers": 4 to 8 bullet points on the most
+    important differences between {current} and {baseline}, which groups drive them, what they may
+    mean and what to check next. Quote figures from the tables. Do not add headings, do not repeat
+    the tables, do not include code or opening and closing statements.
+    """
+    model_response = generate(SYSTEM_INSTRUCTION, prompt, task="comparison", validate=_is_bullet_list)
+    return f"{COMPARISON_HEADING}\n\n{model_response.text}\n\n{comparison.to_markdown()}"
 
-def answer_user_query(data, query, history,data_set,plots):
+@traced("gemini.answer_user_query")
+def answer_user_query(data, query, history,data_set,plots,index=None,top_k=4):
     """
     Answers user queries about the dataset based on the analysis report and visualizations.
     
@@ -139,29 +293,53 @@ def answer_user_query(data, query, history,data_set,plots):
         history (list): Previous conversation history
         data_set (pandas.DataFrame): The original dataset
         plots (list): Generated visualizations and their descriptions
+        index (retrieval.BM25Index, optional): Index built once per report with
+            retrieval.build_qa_index. Built from data and plots if not given.
+        top_k (int): Number of report, context and chart chunks included in the prompt
         
     Returns:
         str: A detailed answer to the user's query based on the available information
+
+    Notes:
+        - Only the top_k chunks most relevant to the query are sent, not the whole report
+        - The dataset is described by its shape, column types and first rows
+        - The prompt is compressed to token_budget("qa"): chunks that do not fit are dropped,
+          least relevant first, and older chat turns are reduced to their questions
         
     Example:
+        >>> index = build_qa_index(report_text, context_text, visualization_list)
         >>> response = answer_user_query(
         ...     report_text,
         ...     "What are the top selling products?",
         ...     chat_history,
         ...     sales_df,
-        ...     visualization_list
+        ...     visualization_list,
+        ...     index=index
         ... )
         >>> print(response)
     """
-    content = data
+    if index is None:
+        index = build_qa_index(data, plots=plots)
+    hits = [chunk for _, chunk in index.search(query, top_k=top_k)]
+    if not hits:
+        # Nothing matched the query terms, fall back to the opening sections of the report
+        hits = index.chunks[:top_k]
+    budget = token_budget("qa")
+    excerpts = [f"[{chunk['source']}: {chunk['title']}]\n{chunk['text']}" for chunk in hits]
+    content = "\n\n".join(fit_items(excerpts, budget // 2))
+    dataset = pd.DataFrame(data_set)
+    dataset_summary = (
+        f"{dataset.shape[0]} rows x {dataset.shape[1]} columns\n"
+        f"Column types: {column_types(dataset, budget // 10)}\n"
+        f"First rows:\n{sample_table(dataset, budget // 8, max_rows=5)}"
+    )
+    history = summarize_history(history, budget // 5)
     prompt = f"""
-    You are a data analysis assistant. Based on the report below, answer the user's query.
+    You are a data analysis assistant. Based on the report excerpts below, answer the user's query.
 
-    Data-set : {data_set}
+    Data-set : {dataset_summary}
 
-    Report : {content}
-
-    Visualizations : {plots}
+    Relevant report excerpts : {content}
 
     User Query: {query}
 
@@ -169,8 +347,5 @@ def answer_user_query(data, query, history,data_set,plots):
 
     Provide a detailed answer to the user's query based on the dataset.
     """
-    model_response = model.generate_content(
-        contents=f"Answer the user's query based on this data: {prompt}"
-    )
-    return model_response.text
-    
\ No newline at end of file
+    model_response = generate(SYSTEM_INSTRUCTION, f"Answer the user's query based on this data: {prompt}", task="qa", validate=_is_answer)
+    return model_response.text
\ No newline at end of file
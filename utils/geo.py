@@ -0,0 +1,331 @@
+import re
+import threading
+import weakref
+import numpy as np
+import pandas as pd
+from utils.tracing import traced
+
+# Name tokens of latitude and longitude columns, e.g. "lat", "pickup_latitude" or "gpsLng"
+LATITUDE_TOKENS = ("latitude", "lat")
+LONGITUDE_TOKENS = ("longitude", "lng", "lon")
+
+# Longitude tokens that are also ordinary words, e.g. "long_term_debt": they only mark a
+# longitude as the whole name or next to a latitude column with the same rest of its name
+AMBIGUOUS_LONGITUDE_TOKENS = ("long",)
+
+# Finest grid, in geohash characters (5 bits each): cells of about 38 m x 19 m
+MAX_PRECISION = 8
+
+# Most cells drawn on one map
+MAX_MAP_CELLS = 5000
+
+# Geohash alphabet
+BASE32 = np.array(list("0123456789bcdefghjkmnpqrstuvwxyz"))
+
+# Metres per degree of latitude
+METRES_PER_DEGREE = 111_320
+
+_indexes = {}
+_lock = threading.Lock()
+
+
+def _tokens(name):
+    name = re.sub(r"([a-z])([A-Z])", r"\1 \2", str(name))
+    return [t for t in re.split(r"[^a-z0-9]+", name.lower()) if t]
+
+
+def coordinate_role(name):
+    """
+    Classifies a column name as a coordinate.
+
+    Args:
+        name (str): Column name
+
+    Returns:
+        str or None: 'latitude', 'longitude' or None
+    """
+    tokens = _tokens(name)
+    if any(t in LATITUDE_TOKENS for t in tokens):
+        return "latitude"
+    if any(t in LONGITUDE_TOKENS for t in tokens) or tokens in ([t] for t in AMBIGUOUS_LONGITUDE_TOKENS):
+        return "longitude"
+    return None
+
+
+def _in_range(series, limit):
+    if not pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+        return False
+    values = series.dropna()
+    return not values.empty and -limit <= values.min() and values.max() <= limit
+
+
+def detect_coordinates(df):
+    """
+    Finds the latitude and longitude columns of a dataset.
+
+    Args:
+        df (pandas.DataFrame): Dataset to inspect
+
+    Returns:
+        tuple or None: (latitude column, longitude column), or None if there is no pair
+
+    Notes:
+        - Names such as latitude, lat, Lat, pickup_latitude, lng and lon are recognised; long
+          only as the whole name or beside a matching latitude, e.g. gpsLong with gpsLat
+        - Values must be numeric and within ±90 (latitude) or ±180 (longitude)
+        - With several pairs, e.g. pickup_lat/pickup_lng and dropoff_lat/dropoff_lng,
+          columns sharing the rest of their name are paired and the first pair is returned
+    """
+    latitudes = [c for c in df.columns if coordinate_role(c) == "latitude" and _in_range(df[c], 90)]
+    longitudes = [c for c in df.columns if coordinate_role(c) == "longitude" and _in_range(df[c], 180)]
+    ambiguous = [
+        c for c in df.columns
+        if coordinate_role(c) is None and any(t in AMBIGUOUS_LONGITUDE_TOKENS for t in _tokens(c)) and _in_range(df[c], 180)
+    ]
+    if not latitudes or not (longitudes or ambiguous):
+        return None
+    stem = lambda column, tokens: [t for t in _tokens(column) if t not in tokens]
+    for latitude in latitudes:
+        for longitude in longitudes + ambiguous:
+            if stem(latitude, LATITUDE_TOKENS) == stem(longitude, LONGITUDE_TOKENS + AMBIGUOUS_LONGITUDE_TOKENS):
+                return latitude, longitude
+    return (latitudes[0], longitudes[0]) if longitudes else None
+
+
+def _spread_bits(values):
+    # Moves bit i of each value to bit 2i, so two coordinates interleave into a Morton code
+    values = values.astype(np.uint64)
+    for shift, mask in ((16, 0x0000FFFF0000FFFF), (8, 0x00FF00FF00FF00FF), (4, 0x0F0F0F0F0F0F0F0F),
+                        (2, 0x3333333333333333), (1, 0x5555555555555555)):
+        values = (values | (values << np.uint64(shift))) & np.uint64(mask)
+    return values
+
+
+def geohash_codes(latitude, longitude, precision=MAX_PRECISION):
+    """
+    Computes the geohash cell of each point as an integer.
+
+    Args:
+        latitude (numpy.ndarray): Latitudes in degrees
+        longitude (numpy.ndarray): Longitudes in degrees
+        precision (int): Geohash characters, at most 12
+
+    Returns:
+        numpy.ndarray: uint64 codes whose 5 * precision bits are the geohash bits, so
+            shifting a code right by 5 bits gives the cell one character coarser
+    """
+    bits = 5 * precision
+    lng_bits, lat_bits = (bits + 1) // 2, bits // 2
+    lng = np.clip((longitude + 180) / 360 * 2 ** lng_bits, 0, 2 ** lng_bits - 1).astype(np.uint64)
+    lat = np.clip((latitude + 90) / 180 * 2 ** lat_bits, 0, 2 ** lat_bits - 1).astype(np.uint64)
+    # Geohash bits alternate starting with longitude, so with an odd number of bits the
+    # last one is a longitude bit, and with an even number a latitude bit
+    if bits % 2:
+        return _spread_bits(lng) | (_spread_bits(lat) << np.uint64(1))
+    return (_spread_bits(lng) << np.uint64(1)) | _spread_bits(lat)
+
+
+def geohash_strings(codes, precision):
+    """
+    Converts integer cells from geohash_codes to geohash strings.
+
+    Args:
+        codes (numpy.ndarray): Cell codes at the given precision
+        precision (int): Geohash characters
+
+    Returns:
+        list: Geohash strings such as 'u4pruyd'
+    """
+    codes = np.asarray(codes, dtype=np.uint64)
+    characters = BASE32[[(codes >> np.uint64(5 * (precision - 1 - i))) & np.uint64(31) for i in range(precision)]]
+    return ["".join(column) for column in characters.T]
+
+
+class SpatialIndex:
+    """
+    Points binned into geohash cells at every precision, for maps of millions of rows.
+
+    Points are binned once at MAX_PRECISION; coarser levels are built from those cells
+    rather than from the points and are cached, so switching map detail is cheap.
+
+    Args:
+        latitude (numpy.ndarray): Latitudes in degrees
+        longitude (numpy.ndarray): Longitudes in degrees
+        metric (numpy.ndarray, optional): Values summed and averaged per cell
+        metric_name (str, optional): Name of the metric in the cell tables
+
+    Example:
+        >>> index = spatial_index(df)
+        >>> index.cells(index.precision_for(max_cells=5000))
+    """
+
+    def __init__(self, latitude, longitude, metric=None, metric_name=None):
+        valid = ~(np.isnan(latitude) | np.isnan(longitude))
+        valid &= (np.abs(latitude) <= 90) & (np.abs(longitude) <= 180)
+        latitude, longitude = latitude[valid], longitude[valid]
+        self.points = int(valid.sum())
+        self.metric_name = metric_name
+        codes = geohash_codes(latitude, longitude, MAX_PRECISION)
+        self._codes, inverse = np.unique(codes, return_inverse=True)
+        sums = lambda weights=None: np.bincount(inverse, weights=weights, minlength=len(self._codes))
+        self._count = sums()
+        self._latitude = sums(latitude)
+        self._longitude = sums(longitude)
+        self._metric = self._metric_count = None
+        if metric is not None:
+            values = metric[valid].astype("float64")
+            present = ~np.isnan(values)
+            self._metric = sums(np.where(present, values, 0.0))
+            self._metric_count = sums(present.astype("float64"))
+        self._levels = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.points
+
+    def cell_count(self, precision):
+        """Returns the number of non-empty cells at a precision."""
+        return len(self._level(precision)[0])
+
+    def precision_for(self, max_cells=MAX_MAP_CELLS):
+        """
+        Picks the finest precision whose cells fit on a map.
+
+        Args:
+            max_cells (int): Maximum number of cells
+
+        Returns:
+            int: Geohash precision between 1 and MAX_PRECISION
+        """
+        for precision in range(MAX_PRECISION, 0, -1):
+            if self.cell_count(precision) <= max_cells:
+                return precision
+        return 1
+
+    def _level(self, precision):
+        with self._lock:
+            if precision not in self._levels:
+                parents = self._codes >> np.uint64(5 * (MAX_PRECISION - precision))
+                codes, inverse = np.unique(parents, return_inverse=True)
+                sums = lambda weights: np.bincount(inverse, weights=weights, minlength=len(codes))
+                self._levels[precision] = (codes, inverse, sums)
+            return self._levels[precision]
+
+    @traced("geo.cells")
+    def cells(self, precision):
+        """
+        Aggregates the points into the cells of one precision.
+
+        Args:
+            precision (int): Geohash characters, 1 to MAX_PRECISION
+
+        Returns:
+            pandas.DataFrame: One row per non-empty cell with geohash, latitude and longitude
+                (mean position of its points), count, radius (half the cell height in metres,
+                for st.map sizes) and, with a metric, <metric>_sum and <metric>_mean
+        """
+        codes, _, sums = self._level(precision)
+        count = sums(self._count)
+        cells = pd.DataFrame({
+            "geohash": geohash_strings(codes, precision),
+            "latitude": sums(self._latitude) / count,
+            "longitude": sums(self._longitude) / count,
+            "count": count.astype("int64"),
+        })
+        cells["radius"] = 180 / 2 ** ((5 * precision) // 2) * METRES_PER_DEGREE / 2
+        if self._metric is not None:
+            total = sums(self._metric)
+            present = sums(self._metric_count)
+            cells[f"{self.metric_name}_sum"] = total
+            with np.errstate(invalid="ignore", divide="ignore"):
+                cells[f"{self.metric_name}_mean"] = np.where(present > 0, total / present, np.nan)
+        return cells
+
+    def cells_for_zoom(self, zoom, max_cells=MAX_MAP_CELLS):
+        """
+        Aggregates the points for a web map zoom level.
+
+        Args:
+            zoom (int): Map zoom, 0 for the whole world
+            max_cells (int): Maximum number of cells
+
+        Returns:
+            pandas.DataFrame: Cells of about 1/32 of a 256-pixel map tile, coarser if there would
+                be more than max_cells of them
+        """
+        # A tile spans 360 / 2**zoom degrees, so 5 more longitude bits give 32 cells per tile
+        wanted = max(1, min(MAX_PRECISION, (2 * (zoom + 5)) // 5))
+        return self.cells(min(wanted, self.precision_for(max_cells)))
+
+
+def _numeric(series):
+    return pd.to_numeric(series, errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+
+
+@traced("geo.spatial_index")
+def spatial_index(df, latitude=None, longitude=None, metric=None):
+    """
+    Returns the spatial index of a dataset, building it on first use.
+
+    Args:
+        df (pandas.DataFrame): Dataset with coordinates
+        latitude (str, optional): Latitude column, detected if not given
+        longitude (str, optional): Longitude column, detected if not given
+        metric (str, optional): Numeric column aggregated per cell
+
+    Returns:
+        SpatialIndex or None: The index, or None if the dataset has no coordinates
+
+    Notes:
+        - Indexes are kept while the DataFrame object is alive, so reruns of a page reuse them
+    """
+    key = (latitude, longitude, metric)
+    with _lock:
+        entry = _indexes.get(id(df))
+        if entry is None or entry[0]() is not df:
+            forget = lambda _, frame_id=id(df): _indexes.pop(frame_id, None)
+            entry = (weakref.ref(df, forget), {})
+            _indexes[id(df)] = entry
+        if key in entry[1]:
+            return entry[1][key]
+    if latitude is None or longitude is None:
+        detected = detect_coordinates(df)
+        index = None
+        if detected is not None:
+            index = spatial_index(df, *detected, metric=metric)
+    else:
+        index = SpatialIndex(
+            _numeric(df[latitude]),
+            _numeric(df[longitude]),
+            _numeric(df[metric]) if metric is not None else None,
+            metric,
+        )
+    with _lock:
+        entry[1][key] = index
+    return index
+
+
+def map_cells(df, chart=None, max_cells=MAX_MAP_CELLS, precision=None):
+    """
+    Bins the points of a dataset for a map.
+
+    Args:
+        df (pandas.DataFrame): Dataset with coordinates
+        chart (dict, optional): Map specification; x_column and y_column are used as
+            longitude and latitude when they are coordinate columns
+        max_cells (int): Maximum number of cells
+        precision (int, optional): Coarser precision to use instead of the finest that fits
+
+    Returns:
+        pandas.DataFrame or None: Cells as returned by SpatialIndex.cells at the finest precision
+            with at most max_cells cells, or None if the dataset has no coordinates
+    """
+    latitude = longitude = None
+    if chart and chart.get("x_column") in df.columns and chart.get("y_column") in df.columns:
+        if coordinate_role(chart["y_column"]) == "latitude" and coordinate_role(chart["x_column"]) == "longitude":
+            latitude, longitude = chart["y_column"], chart["x_column"]
+    index = spatial_index(df, latitude, longitude)
+    if index is None:
+        return None
+    finest = index.precision_for(max_cells)
+    return index.cells(min(precision, finest) if precision else finest)
@@ -0,0 +1,186 @@
+import os
+from functools import lru_cache
+from utils import metering
+from utils.prompt_budget import estimate_tokens
+from utils.tracing import span
+
+# Gemini model of each tier, smallest first; a task starts at its own tier and moves up a tier
+# only when its output fails validation
+MODEL_TIERS = {
+    "small": os.getenv("DATTAVISM_MODEL_SMALL", "gemini-2.0-flash-lite"),
+    "standard": os.getenv("DATTAVISM_MODEL_STANDARD", "gemini-2.0-flash"),
+    "large": os.getenv("DATTAVISM_MODEL_LARGE", "gemini-2.5-flash"),
+}
+
+# Starting tier and prompt token budget of each task; sub-tasks without their own route, such
+# as "charts.refine", use the route of their parent task
+TASK_ROUTES = {
+    "context": ("small", 800),
+    "charts": ("small", 2500),
+    "report": ("standard", 8000),
+    "report.changes": ("small", 3000),
+    "comparison": ("standard", 4000),
+    "qa": ("standard", 3000),
+}
+
+# Route of tasks not listed in TASK_ROUTES
+DEFAULT_ROUTE = ("standard", 8000)
+
+# "gemini" calls the Gemini API, "fake" uses the deterministic stand-in in utils.fake_llm
+BACKEND = os.getenv("DATTAVISM_LLM_BACKEND", "gemini")
+
+# Options of the fake backend
+FAKE_OPTIONS = {
+    "latency": float(os.getenv("DATTAVISM_FAKE_LLM_LATENCY", "0")),
+    "seconds_per_token": float(os.getenv("DATTAVISM_FAKE_LLM_SECONDS_PER_TOKEN", "0")),
+}
+
+
+def set_backend(backend, **fake_options):
+    """
+    Switches every subsequent model call to another backend.
+
+    Args:
+        backend (str): "gemini" or "fake"
+        **fake_options: latency and seconds_per_token of the fake backend
+
+    Example:
+        >>> set_backend("fake", latency=0.8)
+    """
+    global BACKEND
+    if backend not in ("gemini", "fake"):
+        raise ValueError(f"Unknown LLM backend: {backend}")
+    BACKEND = backend
+    FAKE_OPTIONS.update(fake_options)
+    get_model.cache_clear()
+
+
+def route(task):
+    """
+    Looks up the starting tier and prompt token budget of a task.
+
+    Args:
+        task (str): Task name, e.g. 'report' or 'charts.refine'
+
+    Returns:
+        tuple: (tier, token budget)
+    """
+    while task not in TASK_ROUTES and "." in task:
+        task = task.rsplit(".", 1)[0]
+    return TASK_ROUTES.get(task, DEFAULT_ROUTE)
+
+
+def token_budget(task):
+    """
+    Returns the prompt token budget of a task, which callers compress their inputs to fit.
+
+    Args:
+        task (str): Task name, e.g. 'qa'
+
+    Returns:
+        int: Maximum estimated prompt tokens
+    """
+    return route(task)[1]
+
+
+@lru_cache(maxsize=None)
+def get_model(system_instruction, model_name=MODEL_TIERS["standard"]):
+    """
+    Returns a configured Gemini model, creating it on first use.
+
+    google.generativeai takes about a second to import, so it is only loaded when
+    the first prompt is sent rather than when a page module is imported.
+
+    Args:
+        system_instruction (str): System instruction of the model
+        model_name (str): Gemini model name
+
+    Returns:
+        google.generativeai.GenerativeModel: Model shared by every caller with the same
+            arguments, or a fake_llm.FakeModel when the fake backend is selected
+
+    Example:
+        >>> model = get_model("You are a data analysis assistant.")
+        >>> model.generate_content(contents="Describe this dataset").text
+    """
+    if BACKEND == "fake":
+        from utils.fake_llm import FakeModel
+        return FakeModel(model_name, system_instruction, **FAKE_OPTIONS)
+
+    import google.generativeai as genai
+
+    # Configure Gemini AI with API key from environment variables
+    genai.configure(api_key=os.getenv("GEMINI_API"))
+    return genai.GenerativeModel(model_name, system_instruction=system_instruction)
+
+
+def _is_valid(validate, text):
+    try:
+        return bool(validate(text))
+    except Exception:
+        return False
+
+
+def generate(system_instruction, contents, task, validate=None):
+    """
+    Sends a prompt to the model tier of a task inside a tracing span that records its size and token usage.
+
+    Args:
+        system_instruction (str): System instruction of the model
+        contents (str): Prompt text, already compressed to token_budget(task)
+        task (str): Name of the task, used for routing and as the span name (e.g. 'report', 'qa')
+        validate (callable, optional): Takes the response text and returns whether it is usable;
+            if it returns False or raises, the prompt is sent again to the next larger tier
+
+    Returns:
+        google.generativeai.types.GenerateContentResponse: The first valid response, or the
+            response of the largest tier if none is valid
+
+    Raises:
+        metering.BudgetExceeded: If the call does not fit the user's or the global token budget
+
+    Notes:
+        - Every attempt is recorded as an llm.<task> span with the model, tier, attempt number,
+          estimated prompt tokens, the task's budget, its cost and whether the output was valid
+        - The call is estimated and checked against the token budgets before it is sent, and the
+          usage of every attempt is recorded by metering.get_meter(); calls of users close to
+          their budget are degraded to the smallest tier without escalation
+
+    Example:
+        >>> response = generate(SYSTEM_INSTRUCTION, prompt, task="context")
+        >>> response.text
+    """
+    tier, budget = route(task)
+    tiers = list(MODEL_TIERS)
+    estimate = estimate_tokens(system_instruction) + estimate_tokens(contents)
+    meter = metering.get_meter()
+    reservation = meter.reserve(task, estimate)
+    tiers = tiers[:1] if reservation.degraded else tiers[tiers.index(tier):]
+    try:
+        for attempt, tier in enumerate(tiers, start=1):
+            attributes = {
+                "llm.model": MODEL_TIERS[tier],
+                "llm.tier": tier,
+                "llm.attempt": attempt,
+                "llm.backend": BACKEND,
+                "llm.prompt_bytes": len(contents.encode()),
+                "llm.prompt_tokens_estimate": estimate,
+                "llm.token_budget": budget,
+                "llm.degraded": reservation.degraded,
+            }
+            with span(f"llm.{task}", **attributes) as s:
+                response = get_model(system_instruction, MODEL_TIERS[tier]).generate_content(contents=contents)
+                usage = getattr(response, "usage_metadata", None)
+                prompt_tokens = getattr(usage, "prompt_token_count", None)
+                response_tokens = getattr(usage, "candidates_token_count", None)
+                s.set("llm.prompt_tokens", prompt_tokens)
+                s.set("llm.response_tokens", response_tokens)
+                s.set("llm.cost_usd", meter.record(reservation, MODEL_TIERS[tier], tier, attempt, prompt_tokens, response_tokens))
+                s.set("llm.response_bytes", len(response.text.encode()))
+                valid = validate is None or _is_valid(validate, response.text)
+                s.set("llm.valid", valid)
+            if valid:
+                break
+    finally:
+        meter.release(reservation)
+    return response
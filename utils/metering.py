@@ -0,0 +1,481 @@
+"""
+Token metering of model calls.
+
+Every model call is estimated before it is sent and recorded with its actual usage
+afterwards in a local SQLite database, so per-user and global budgets can be enforced
+and usage can be reported per user, dataset, task or model.
+
+Usage reports from the command line:
+
+    python -m utils.metering --by user
+    python -m utils.metering --by dataset --days 30
+"""
+import argparse
+import contextvars
+import getpass
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+import pandas as pd
+from utils.tracing import span
+
+# SQLite database usage is recorded in; an empty string disables recording and budgets
+METERING_DB = os.getenv("DATTAVISM_METERING_DB", os.path.join("data", "metering.sqlite"))
+
+# Tokens one user may use per BUDGET_WINDOW_SECONDS, prompts and responses together
+USER_TOKEN_BUDGET = int(os.getenv("DATTAVISM_USER_TOKEN_BUDGET", 500_000))
+
+# Tokens all users together may use per BUDGET_WINDOW_SECONDS
+GLOBAL_TOKEN_BUDGET = int(os.getenv("DATTAVISM_GLOBAL_TOKEN_BUDGET", 5_000_000))
+
+# Window the token budgets apply to, a rolling day
+BUDGET_WINDOW_SECONDS = 24 * 3600
+
+# Tokens all calls of this process may send per minute, the quota of the model API;
+# calls over it wait for earlier calls to leave the minute
+TOKENS_PER_MINUTE = int(os.getenv("DATTAVISM_TOKENS_PER_MINUTE", 1_000_000))
+
+# Longest a call waits for the per-minute quota before it is rejected
+MAX_QUEUE_SECONDS = float(os.getenv("DATTAVISM_MAX_QUEUE_SECONDS", 30))
+
+# Share of a budget after which calls are degraded to the smallest model tier without escalation
+DEGRADE_SHARE = 0.8
+
+# Response tokens assumed for a task that has no recorded calls yet
+DEFAULT_RESPONSE_TOKENS = 1000
+
+# Recent calls of a task averaged to estimate its response tokens
+RESPONSE_HISTORY = 50
+
+# US dollars per million prompt and response tokens of each model; other models cost DEFAULT_PRICE
+MODEL_PRICES = {
+    "gemini-2.0-flash-lite": (0.075, 0.30),
+    "gemini-2.0-flash": (0.10, 0.40),
+    "gemini-2.5-flash": (0.30, 2.50),
+}
+DEFAULT_PRICE = (0.0, 0.0)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage (
+    id INTEGER PRIMARY KEY,
+    created REAL NOT NULL,
+    user TEXT NOT NULL,
+    dataset TEXT,
+    dataset_hash TEXT,
+    task TEXT NOT NULL,
+    model TEXT NOT NULL,
+    tier TEXT NOT NULL,
+    attempt INTEGER NOT NULL,
+    degraded INTEGER NOT NULL,
+    prompt_tokens_estimate INTEGER NOT NULL,
+    prompt_tokens INTEGER,
+    response_tokens INTEGER,
+    cost_usd REAL
+);
+CREATE INDEX IF NOT EXISTS usage_user_created ON usage (user, created);
+CREATE INDEX IF NOT EXISTS usage_created ON usage (created);
+CREATE INDEX IF NOT EXISTS usage_task_id ON usage (task, id);
+"""
+
+_scope = contextvars.ContextVar("dattavism_metering_scope", default={})
+_default_meter = None
+
+
+class BudgetExceeded(RuntimeError):
+    """Raised when a model call does not fit the user's or the global token budget."""
+
+
+def cost(model, prompt_tokens, response_tokens):
+    """
+    Prices a model call.
+
+    Args:
+        model (str): Model name
+        prompt_tokens (int): Prompt tokens
+        response_tokens (int): Response tokens
+
+    Returns:
+        float: Cost in US dollars according to MODEL_PRICES
+    """
+    prompt_price, response_price = MODEL_PRICES.get(model, DEFAULT_PRICE)
+    return ((prompt_tokens or 0) * prompt_price + (response_tokens or 0) * response_price) / 1e6
+
+
+@contextmanager
+def scope(user=None, dataset=None, dataset_hash=None):
+    """
+    Attributes the model calls made inside the block to a user and a dataset.
+
+    Outside a block the Streamlit session provides them, see current_scope.
+
+    Example:
+        >>> with metering.scope(dataset="sales_2024"):
+        ...     report = generate_report(df)
+    """
+    values = {k: v for k, v in {"user": user, "dataset": dataset, "dataset_hash": dataset_hash}.items() if v}
+    token = _scope.set({**_scope.get(), **values})
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def current_scope():
+    """
+    Returns who a model call is made for and on which dataset.
+
+    Returns:
+        dict: user, dataset and dataset_hash. The dataset is the one set with scope, else the
+            session's uploaded file; the user is the first of:
+
+            - the user set with scope
+            - the signed-in Streamlit user's email, when [auth] is configured
+            - DATTAVISM_USER, for single-user deployments
+            - "ip-<address>" for a browser on another machine
+            - the operating system user, for a browser on the same machine or outside Streamlit
+
+    Notes:
+        Without [auth], remote users are told apart by IP address only: the identity and the
+        per-user budget survive reloads and new sessions, but users behind one proxy or NAT
+        share them. Configure [auth] for per-person budgets.
+    """
+    values = dict(_scope.get())
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx(suppress_warning=True)
+    except ImportError:
+        ctx = None
+    if ctx is not None:
+        import streamlit as st
+
+        if "user" not in values:
+            try:
+                email = st.user.get("email")
+            except Exception:
+                email = None
+            try:
+                # None when the browser runs on the server's machine
+                address = st.context.ip_address
+            except Exception:
+                address = None
+            user = email or os.getenv("DATTAVISM_USER") or (f"ip-{address}" if address else None)
+            if user:
+                values["user"] = user
+        values.setdefault("dataset", st.session_state.get("filename"))
+        values.setdefault("dataset_hash", st.session_state.get("dataset_hash"))
+    values.setdefault("user", os.getenv("DATTAVISM_USER") or getpass.getuser())
+    values.setdefault("dataset", None)
+    values.setdefault("dataset_hash", None)
+    return values
+
+
+class Reservation:
+    """
+    Tokens set aside for one model call until its usage is recorded.
+
+    Attributes:
+        task (str): Task of the call
+        tokens (int): Estimated prompt and response tokens
+        prompt_tokens_estimate (int): Estimated prompt tokens
+        degraded (bool): Whether the call must use the smallest tier without escalation
+        scope (dict): user, dataset and dataset_hash of the call
+    """
+
+    def __init__(self, task, tokens, prompt_tokens_estimate, degraded, scope):
+        self.task = task
+        self.tokens = tokens
+        self.prompt_tokens_estimate = prompt_tokens_estimate
+        self.degraded = degraded
+        self.scope = scope
+
+
+class UsageMeter:
+    """
+    Records the token usage of model calls and enforces token budgets.
+
+    Daily usage is read from the database, so budgets hold across restarts and processes
+    sharing the database, e.g. batch workers. The per-minute quota is tracked in memory for
+    this process, including calls still in flight.
+
+    Args:
+        path (str): SQLite database, created on first use
+        user_budget (int): Tokens per user per BUDGET_WINDOW_SECONDS
+        global_budget (int): Tokens of all users per BUDGET_WINDOW_SECONDS
+        tokens_per_minute (int): Tokens this process may send per minute
+        max_queue_seconds (float): Longest a call waits for the per-minute quota
+
+    Example:
+        >>> meter = get_meter()
+        >>> reservation = meter.reserve("report", prompt_tokens_estimate=3200)
+        >>> meter.record(reservation, "gemini-2.0-flash", "standard", 1, 3150, 900)
+        >>> meter.release(reservation)
+    """
+
+    def __init__(self, path=METERING_DB, user_budget=USER_TOKEN_BUDGET, global_budget=GLOBAL_TOKEN_BUDGET,
+                 tokens_per_minute=TOKENS_PER_MINUTE, max_queue_seconds=MAX_QUEUE_SECONDS):
+        self.path = path
+        self.user_budget = user_budget
+        self.global_budget = global_budget
+        self.tokens_per_minute = tokens_per_minute
+        self.max_queue_seconds = max_queue_seconds
+        self.recent = deque()
+        self.in_flight = 0
+        # Tokens of calls that passed the budget check but are not released yet, per user
+        self.reserved = {}
+        self.condition = threading.Condition()
+        self.ready = False
+
+    @contextmanager
+    def _connect(self):
+        # One connection per operation, committed and closed when the block ends; the
+        # directory is created first, as data/ does not exist in a fresh checkout
+        if not self.ready:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            if not self.ready:
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.executescript(SCHEMA)
+                self.ready = True
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def used(self, user=None, since=None):
+        """
+        Returns the tokens used in the budget window.
+
+        Args:
+            user (str, optional): Only count this user's calls
+            since (float, optional): Start of the window as a Unix time, by default
+                BUDGET_WINDOW_SECONDS ago
+
+        Returns:
+            int: Prompt and response tokens; calls without usage metadata count their estimate
+        """
+        since = time.time() - BUDGET_WINDOW_SECONDS if since is None else since
+        query = "SELECT SUM(COALESCE(prompt_tokens, prompt_tokens_estimate) + COALESCE(response_tokens, 0)) FROM usage WHERE created >= ?"
+        params = [since]
+        if user is not None:
+            query += " AND user = ?"
+            params.append(user)
+        with self._connect() as connection:
+            return int(connection.execute(query, params).fetchone()[0] or 0)
+
+    def expected_response_tokens(self, task):
+        """
+        Estimates the response tokens of a task from its recent calls.
+
+        Args:
+            task (str): Task name
+
+        Returns:
+            int: Average response tokens of the last RESPONSE_HISTORY calls of the task, or
+                DEFAULT_RESPONSE_TOKENS before its first call
+        """
+        query = "SELECT AVG(response_tokens) FROM (SELECT response_tokens FROM usage WHERE task = ? AND response_tokens IS NOT NULL ORDER BY id DESC LIMIT ?)"
+        with self._connect() as connection:
+            average = connection.execute(query, (task, RESPONSE_HISTORY)).fetchone()[0]
+        return int(average) if average is not None else DEFAULT_RESPONSE_TOKENS
+
+    def _minute_tokens(self, now):
+        while self.recent and now - self.recent[0][0] > 60:
+            self.recent.popleft()
+        return sum(tokens for _, tokens in self.recent) + self.in_flight
+
+    def reserve(self, task, prompt_tokens_estimate):
+        """
+        Checks that a model call fits the budgets and waits for the per-minute quota.
+
+        Args:
+            task (str): Task name, e.g. 'report'
+            prompt_tokens_estimate (int): Estimated prompt tokens, see prompt_budget.estimate_tokens
+
+        Returns:
+            Reservation: To be passed to record and release
+
+        Raises:
+            BudgetExceeded: If the call does not fit the user's or the global budget left in the
+                window, or the per-minute quota has no room within max_queue_seconds
+
+        Notes:
+            - The call is estimated at its prompt tokens plus the task's expected response tokens
+            - Once a user or all users together have used DEGRADE_SHARE of their budget, calls
+              are degraded: they use the smallest model tier and are not escalated
+            - Calls reserved but not yet released count against the budgets as well
+        """
+        current = current_scope()
+        user = current["user"]
+        tokens = prompt_tokens_estimate + self.expected_response_tokens(task)
+        with span("metering.reserve", task=task, **{"metering.tokens_estimate": tokens}) as s:
+            recorded_user = self.used(user=user)
+            recorded_global = self.used()
+            with self.condition:
+                # Calls in flight count too, so concurrent calls cannot all pass the same check
+                user_used = recorded_user + self.reserved.get(user, 0)
+                global_used = recorded_global + sum(self.reserved.values())
+                s.set("metering.user_tokens", user_used)
+                s.set("metering.global_tokens", global_used)
+                if user_used + tokens > self.user_budget:
+                    raise BudgetExceeded(
+                        f"Your token budget of {self.user_budget:,} tokens per day is used up "
+                        f"({user_used:,} used, this request needs about {tokens:,}). Please try again later."
+                    )
+                if global_used + tokens > self.global_budget:
+                    raise BudgetExceeded(
+                        "Dattavism has reached its daily token budget. Please try again later."
+                    )
+                self.reserved[user] = self.reserved.get(user, 0) + tokens
+            degraded = (
+                user_used + tokens > DEGRADE_SHARE * self.user_budget
+                or global_used + tokens > DEGRADE_SHARE * self.global_budget
+            )
+            s.set("metering.degraded", degraded)
+            reservation = Reservation(task, tokens, prompt_tokens_estimate, degraded, current)
+            start = time.time()
+            deadline = start + self.max_queue_seconds
+            with self.condition:
+                # A call larger than the whole quota is sent when nothing else is in the minute
+                while (self.recent or self.in_flight) and self._minute_tokens(time.time()) + tokens > self.tokens_per_minute:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        self._unreserve(reservation)
+                        raise BudgetExceeded("Dattavism is busy right now. Please try again in a minute.")
+                    # Woken when a call is released, or when the oldest call leaves the minute
+                    until_free = self.recent[0][0] + 60 - time.time() if self.recent else remaining
+                    self.condition.wait(max(0.01, min(remaining, until_free)))
+                self.in_flight += tokens
+            s.set("metering.queued_seconds", round(time.time() - start, 3))
+        return reservation
+
+    def _unreserve(self, reservation):
+        # Called with self.condition held
+        user = reservation.scope["user"]
+        left = self.reserved.get(user, 0) - reservation.tokens
+        if left > 0:
+            self.reserved[user] = left
+        else:
+            self.reserved.pop(user, None)
+
+    def record(self, reservation, model, tier, attempt, prompt_tokens=None, response_tokens=None):
+        """
+        Records one attempt of a model call.
+
+        Args:
+            reservation (Reservation): Returned by reserve
+            model (str): Model name
+            tier (str): Model tier
+            attempt (int): Attempt number, 1 for the first tier tried
+            prompt_tokens (int, optional): Prompt tokens reported by the model
+            response_tokens (int, optional): Response tokens reported by the model
+
+        Returns:
+            float: Cost of the attempt in US dollars
+        """
+        price = cost(model, prompt_tokens or reservation.prompt_tokens_estimate, response_tokens)
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT INTO usage (created, user, dataset, dataset_hash, task, model, tier, attempt, degraded, "
+                "prompt_tokens_estimate, prompt_tokens, response_tokens, cost_usd) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (time.time(), reservation.scope["user"], reservation.scope["dataset"], reservation.scope["dataset_hash"],
+                 reservation.task, model, tier, attempt, int(reservation.degraded), reservation.prompt_tokens_estimate,
+                 prompt_tokens, response_tokens, price),
+            )
+        with self.condition:
+            used = (prompt_tokens or reservation.prompt_tokens_estimate) + (response_tokens or 0)
+            self.recent.append((time.time(), used))
+        return price
+
+    def release(self, reservation):
+        """Frees the in-flight tokens of a call once all its attempts are recorded."""
+        with self.condition:
+            self.in_flight = max(0, self.in_flight - reservation.tokens)
+            self._unreserve(reservation)
+            self.condition.notify_all()
+
+    def report(self, by="user", days=None):
+        """
+        Summarizes the recorded usage.
+
+        Args:
+            by (str): Grouping column: 'user', 'dataset', 'task' or 'model'
+            days (float, optional): Only include the last days, by default everything
+
+        Returns:
+            pandas.DataFrame: Per group the number of calls, degraded calls, prompt and response
+                tokens and cost in US dollars, most tokens first
+        """
+        if by not in ("user", "dataset", "task", "model"):
+            raise ValueError(f"Unknown usage grouping: {by}")
+        since = 0 if days is None else time.time() - days * 86400
+        query = f"""
+            SELECT COALESCE({by}, '(none)') AS {by}, COUNT(*) AS calls, SUM(degraded) AS degraded_calls,
+                   SUM(COALESCE(prompt_tokens, prompt_tokens_estimate)) AS prompt_tokens,
+                   SUM(COALESCE(response_tokens, 0)) AS response_tokens, SUM(cost_usd) AS cost_usd
+            FROM usage WHERE created >= ? GROUP BY 1 ORDER BY prompt_tokens + response_tokens DESC
+        """
+        with self._connect() as connection:
+            return pd.read_sql_query(query, connection, params=(since,))
+
+
+class _NoMeter:
+    # Stand-in used when METERING_DB is empty: no budgets, nothing recorded
+    def reserve(self, task, prompt_tokens_estimate):
+        return Reservation(task, 0, prompt_tokens_estimate, False, current_scope())
+
+    def record(self, reservation, model, tier, attempt, prompt_tokens=None, response_tokens=None):
+        return cost(model, prompt_tokens or reservation.prompt_tokens_estimate, response_tokens)
+
+    def release(self, reservation):
+        pass
+
+
+def get_meter():
+    """
+    Returns the meter shared by every session of the app.
+
+    Returns:
+        UsageMeter: Meter recording to METERING_DB, or one that records nothing when
+            DATTAVISM_METERING_DB is set to an empty string
+    """
+    global _default_meter
+    if _default_meter is None:
+        _default_meter = UsageMeter() if METERING_DB else _NoMeter()
+    return _default_meter
+
+
+def set_meter(meter):
+    """
+    Replaces the meter shared by every session.
+
+    Args:
+        meter (UsageMeter or None): New meter, or None to stop recording and enforcing budgets
+
+    Example:
+        >>> set_meter(None)  # benchmarks with the fake backend
+    """
+    global _default_meter
+    _default_meter = meter if meter is not None else _NoMeter()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report the token usage of model calls")
+    parser.add_argument("--by", choices=["user", "dataset", "task", "model"], default="user", help="grouping of the report")
+    parser.add_argument("--days", type=float, default=None, help="only include the last days")
+    parser.add_argument("--db", default=METERING_DB, help="metering database")
+    args = parser.parse_args(argv)
+    if not args.db or not os.path.exists(args.db):
+        print("No usage has been recorded yet.")
+        return 0
+    table = UsageMeter(args.db).report(by=args.by, days=args.days)
+    print(table.to_string(index=False, float_format=lambda v: f"{v:,.4f}"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
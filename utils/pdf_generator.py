@@ -9,14 +9,150 @@ from reportlab.pdfbase.ttfonts import TTFont
 import markdown
 import re
 import matplotlib.pyplot as plt
-import seaborn as sns
 import io
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
 import datetime
+from collections import OrderedDict
+import pandas as pd
+from utils.tracing import span, traced
+from utils import frontend_data, profiling, reshape
+from utils.fingerprint import dataset_hash
+
+# Resolution of charts as printed on the page, in dots per inch, for each DPI profile
+DPI_PROFILES = {"print": 300, "screen": 150, "draft": 96}
+
+# Size of the charts on the page, and of the matplotlib figures they are drawn on
+CHART_WIDTH_INCHES = 6
+CHART_HEIGHT_INCHES = 3.5
+FIGURE_SIZE = (10, 6)
+
+# Directory of exported PDFs and chart images, each named by a hash of its inputs
+PDF_CACHE_DIR = os.getenv("DATTAVISM_PDF_CACHE_DIR", os.path.join(tempfile.gettempdir(), "dattavism_pdf_cache"))
+
+# Size of PDF_CACHE_DIR above which the least recently used files are deleted
+MAX_PDF_CACHE_BYTES = int(os.getenv("DATTAVISM_PDF_CACHE_BYTES", 512 * 2**20))
+
+# Section inputs (converted markdown, summary tables) kept in memory
+MAX_CACHED_SECTIONS = 64
+
+# Bump when the layout changes, so PDFs cached by an older version are not served
+LAYOUT_VERSION = 1
+
+_sections = OrderedDict()
+_sections_lock = threading.Lock()
+
+
+def content_key(*parts):
+    """
+    Hashes the inputs of a cached artifact.
+
+    Args:
+        *parts: Text, bytes, numbers, or JSON-serializable values such as chart specifications
+
+    Returns:
+        str: Hex digest that changes whenever any part changes
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        if not isinstance(part, bytes):
+            part = part if isinstance(part, str) else json.dumps(part, sort_keys=True, default=str)
+            part = part.encode()
+        digest.update(len(part).to_bytes(8, "little"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+def dataset_key(df):
+    """
+    Identifies the content of a dataset for the PDF caches.
+
+    Args:
+        df (pandas.DataFrame or ColumnarDataset): Analysed dataset
+
+    Returns:
+        str: The dataset hash of a DataFrame, or for an out-of-core dataset a hash of its
+            Parquet file's path, size and modification time
+    """
+    if isinstance(df, pd.DataFrame):
+        return dataset_hash(df)
+    stat = os.stat(df.path)
+    return content_key(df.path, stat.st_size, stat.st_mtime_ns)
+
+
+def _trim_cache(directory, max_bytes=MAX_PDF_CACHE_BYTES):
+    # Deletes the least recently used files until the directory fits max_bytes
+    files = []
+    for root, _, names in os.walk(directory):
+        for name in names:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
 
 class EnhancedReportGenerator:
-    def __init__(self):
+    """
+    Builds PDF reports with reportlab.
+
+    Exported PDFs and chart images are cached on disk by a hash of their inputs, and the
+    inputs of the text and summary sections in memory, so exporting an unchanged report
+    copies the previous PDF and a re-export after a small change only redoes what changed.
+
+    Args:
+        theme (str): Matplotlib style of the charts
+        dpi_profile (str): Key of DPI_PROFILES, the resolution of the charts on the page
+        cache_dir (str or None): Directory of the PDF and chart caches; None disables all caching
+    """
+
+    def __init__(self, theme="bmh", dpi_profile="print", cache_dir=PDF_CACHE_DIR):
         self.styles = getSampleStyleSheet()
         self.setup_styles()
+        self.theme = theme
+        self.dpi_profile = dpi_profile
+        # Figures are drawn at FIGURE_SIZE and shown at CHART_WIDTH_INCHES, so they are saved
+        # with just enough pixels for the profile's resolution on the page
+        self.dpi = DPI_PROFILES[dpi_profile] * CHART_WIDTH_INCHES / FIGURE_SIZE[0]
+        self.cache_dir = cache_dir
+        self.sections_reused = 0
+
+    def _section(self, *parts, build):
+        # Inputs of a section are reused while its content is unchanged; the flowables
+        # themselves are recreated, reportlab changes them while laying out a document
+        if self.cache_dir is None:
+            return build(), False
+        key = content_key(self.theme, *parts)
+        with _sections_lock:
+            if key in _sections:
+                _sections.move_to_end(key)
+                self.sections_reused += 1
+                return _sections[key], True
+        value = build()
+        with _sections_lock:
+            _sections[key] = value
+            while len(_sections) > MAX_CACHED_SECTIONS:
+                _sections.popitem(last=False)
+        return value, False
+
+    def _cache_path(self, kind, key, extension):
+        directory = os.path.join(self.cache_dir, kind)
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, f"{key}.{extension}")
         
     def setup_styles(self):
         # Title style
@@ -78,7 +214,7 @@ class EnhancedReportGenerator:
             spaceAfter=12
         )
 
-    def create_cover_page(self, title):
+    def create_cover_page(self, title, date_str=None):
         elements = []
         
         elements.append(Paragraph("Data Analysis Report", self.caption_style))
@@ -96,7 +232,7 @@ class EnhancedReportGenerator:
         elements.append(Paragraph(title, title_with_style))
         elements.append(Spacer(1, 0.5*inch))
         
-        date_str = datetime.datetime.now().strftime("%B %d, %Y")
+        date_str = date_str or datetime.datetime.now().strftime("%B %d, %Y")
         elements.append(Paragraph(f"Generated on {date_str}", self.caption_style))
         elements.append(Spacer(1, 0.25*inch))
         elements.append(Paragraph("AI-Powered Analysis", self.subsection_style))
@@ -104,22 +240,38 @@ class EnhancedReportGenerator:
         elements.append(PageBreak())
         return elements
 
+    @traced("pdf.generate_chart")
     def generate_chart(self, chart, df):
-        plt.style.use('bmh') 
-        
-        fig, ax = plt.subplots(figsize=(10, 6))
+        # The theme only applies to this figure, pyplot's global style is left alone
+        with plt.style.context(self.theme):
+            return self._draw_chart(chart, df)
+
+    def _draw_chart(self, chart, df):
+        fig, ax = plt.subplots(figsize=FIGURE_SIZE)
         chart_type = chart.get("chart_type")
         x_column = chart.get("x_column")
         y_column = chart.get("y_column")
         
         try:
+            if chart.get("reshape") == "long":
+                # Charts of a wide dataset get only the long-format rows they plot
+                df = reshape.chart_frame(df if isinstance(df, pd.DataFrame) else df.sample(), chart)
+            elif hasattr(df, "chart_data"):
+                # Out-of-core datasets return only the aggregated or sampled rows the chart needs
+                df = df.chart_data(chart)
             if chart_type == "scatter":
                 ax.scatter(df[x_column], df[y_column], alpha=0.6)
             elif chart_type == "bar":
                 df_grouped = df.groupby(x_column)[y_column].mean()
                 ax.bar(df_grouped.index, df_grouped.values, color='#3949AB', alpha=0.7)
             elif chart_type == "line":
-                ax.plot(df[x_column], df[y_column], color='#303F9F', linewidth=2)
+                # Rows are sorted by x, and series over dates resampled with a rolling mean
+                series = frontend_data.chart_data(df, chart)
+                ax.plot(series[x_column], series[y_column], color='#303F9F', linewidth=2, label=y_column)
+                for column in series.columns.drop([x_column, y_column]):
+                    ax.plot(series[x_column], series[column], color='#E53935', linewidth=1.5, linestyle='--', label=column)
+                if len(series.columns) > 2:
+                    ax.legend()
             elif chart_type == "pie":
                 df_grouped = df.groupby(x_column)[y_column].sum()
                 ax.pie(df_grouped.values, labels=df_grouped.index, autopct='%1.1f%%')
@@ -133,21 +285,49 @@ class EnhancedReportGenerator:
             ax.grid(True, alpha=0.3)
             
             if chart_type in ["bar"]:
-                plt.xticks(rotation=45, ha='right')
+                plt.setp(ax.get_xticklabels(), rotation=45, ha='right')
             
-            plt.tight_layout()
+            fig.tight_layout()
             
             img_buffer = io.BytesIO()
-            plt.savefig(img_buffer, format='png', dpi=300, bbox_inches='tight')
+            fig.savefig(img_buffer, format='png', dpi=self.dpi, bbox_inches='tight')
             img_buffer.seek(0)
-            plt.close()
+            plt.close(fig)
             
             return img_buffer
         except Exception as e:
             print(f"Error generating chart: {e}")
-            plt.close()
+            plt.close(fig)
             return None
 
+    def chart_image(self, chart, df, data_key):
+        """
+        Returns the PNG of a chart, rendering it only if it is not cached.
+
+        Args:
+            chart (dict): Chart specification
+            df (pandas.DataFrame or ColumnarDataset): Analysed dataset
+            data_key (str): dataset_key(df)
+
+        Returns:
+            tuple: (PNG bytes or None if the chart could not be drawn, whether it was cached)
+        """
+        if self.cache_dir is None:
+            buffer = self.generate_chart(chart, df)
+            return (buffer.getvalue() if buffer else None), False
+        path = self._cache_path("charts", content_key("chart", LAYOUT_VERSION, data_key, chart, self.theme, self.dpi), "png")
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                return f.read(), True
+        buffer = self.generate_chart(chart, df)
+        if buffer is None:
+            return None, False
+        temporary = f"{path}.{threading.get_ident()}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(buffer.getvalue())
+        os.replace(temporary, path)
+        return buffer.getvalue(), False
+
     def create_table_style(self):
         return TableStyle([
             ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2C3E50')),
@@ -233,17 +413,25 @@ class EnhancedReportGenerator:
             
         return elements
 
+    def _convert_markdown(self, markdown_text):
+        # Tables stay markdown, the text between them is converted to HTML lines
+        parts = re.split(r'(\|.*\|[\r\n]\|[-|\s]*\|[\r\n](?:\|.*\|[\r\n])*)', markdown_text)
+        return [
+            ("table", part) if part.strip().startswith('|') else ("html", markdown.markdown(part).split('\n'))
+            for part in parts
+        ]
+
+    @traced("pdf.markdown_to_paragraphs")
     def markdown_to_paragraphs(self, markdown_text):
         elements = []
         
-        parts = re.split(r'(\|.*\|[\r\n]\|[-|\s]*\|[\r\n](?:\|.*\|[\r\n])*)', markdown_text)
+        parts, _ = self._section("markdown", markdown_text, build=lambda: self._convert_markdown(markdown_text))
         
-        for part in parts:
-            if part.strip().startswith('|'):
+        for kind, part in parts:
+            if kind == "table":
                 elements.extend(self.parse_markdown_table(part))
             else:
-                html = markdown.markdown(part)
-                paragraphs = html.split('\n')
+                paragraphs = part
                 for p in paragraphs:
                     if p.strip():
                         if p.startswith('<h1>'):
@@ -260,8 +448,48 @@ class EnhancedReportGenerator:
         
         return elements
 
-    def create_complete_report(self, context_response, report_response, df, figures, output_path, report_title):
+    @traced("pdf.create_complete_report")
+    def create_complete_report(self, context_response, report_response, df, figures, output_path, report_title, chart_images=None, data_hash=None):
+        """
+        Builds the PDF report.
+
+        Args:
+            context_response (str): Context detection text
+            report_response (str): Markdown report
+            df (pandas.DataFrame or ColumnarDataset): Analysed dataset
+            figures (list): Chart specifications
+            output_path (str): Path of the PDF file
+            report_title (str): Title on the cover page
+            chart_images (list, optional): PNG bytes of already rendered charts, one per
+                figure, so they are not drawn twice. Charts are rendered when None.
+            data_hash (str, optional): dataset_key(df), if already known
+
+        Returns:
+            bool: True if the PDF was written
+
+        Notes:
+            - A PDF with the same inputs (texts, dataset, chart specifications and images,
+              title, date, theme and DPI profile) is copied from the cache instead of rebuilt
+            - Otherwise cached chart images and section inputs are reused; the
+              pdf.create_complete_report span records what was reused
+        """
         try:
+            with span("pdf.cache") as cache_span:
+                data_key = data_hash or dataset_key(df)
+                date_str = datetime.datetime.now().strftime("%B %d, %Y")
+                images = ["rendered"] if chart_images is None else [content_key(image or b"") for image in chart_images]
+                key = content_key(
+                    "pdf", LAYOUT_VERSION, context_response or "", report_response or "", data_key,
+                    figures, images, report_title, date_str, self.theme, self.dpi_profile,
+                )
+                cached = self._cache_path("pdf", key, "pdf") if self.cache_dir is not None else None
+                cache_span.set("cache.hit", bool(cached) and os.path.exists(cached))
+            if cached and os.path.exists(cached):
+                shutil.copyfile(cached, output_path)
+                os.utime(cached)
+                return True
+
+            self.sections_reused = charts_reused = 0
             doc = SimpleDocTemplate(
                 output_path,
                 pagesize=letter,
@@ -272,7 +500,7 @@ class EnhancedReportGenerator:
             )
             elements = []
 
-            elements.extend(self.create_cover_page(report_title))
+            elements.extend(self.create_cover_page(report_title, date_str))
 
             toc_style = ParagraphStyle(
                 'TOC',
@@ -299,12 +527,16 @@ class EnhancedReportGenerator:
                 elements.append(PageBreak())
 
             elements.append(Paragraph("3. Data Summary", self.section_style))
-            summary_data = df.describe().round(2)
+            # Profiling an out-of-core dataset scans it, so the tables are kept per dataset
+            (summary_data, sample_data), _ = self._section(
+                "summary", data_key, build=lambda: (profiling.describe(df).round(2), df.head(30))
+            )
             summary_elements = self.format_large_tables(summary_data, max_rows_per_page=30)
             elements.extend(summary_elements)
+            if summary_data.attrs.get("approximate"):
+                elements.append(Paragraph(summary_data.attrs["error_note"], self.caption_style))
 
             elements.append(Paragraph("Sample Data", self.subsection_style))
-            sample_data = df.head(30)
             sample_elements = self.format_large_tables(sample_data, max_rows_per_page=30)
             elements.extend(sample_elements)
             elements.append(PageBreak())
@@ -314,11 +546,15 @@ class EnhancedReportGenerator:
                 chart_title = f"Figure {i}: {chart.get('chart_type').title()} Chart"
                 elements.append(Paragraph(chart_title, self.subsection_style))
                 
-                img_buffer = self.generate_chart(chart, df)
-                if img_buffer:
-                    img = Image(img_buffer)
-                    img.drawHeight = 3.5 * inch  
-                    img.drawWidth = 6 * inch
+                if chart_images is not None:
+                    png = chart_images[i - 1]
+                else:
+                    png, hit = self.chart_image(chart, df, data_key)
+                    charts_reused += hit
+                if png:
+                    img = Image(io.BytesIO(png))
+                    img.drawHeight = CHART_HEIGHT_INCHES * inch  
+                    img.drawWidth = CHART_WIDTH_INCHES * inch
                     elements.append(img)
                 
                 elements.append(Paragraph(chart.get('reason'), self.caption_style))
@@ -327,9 +563,15 @@ class EnhancedReportGenerator:
                 if i % 2 == 0 and i < len(figures):
                     elements.append(PageBreak())
 
-            doc.build(elements)
+            with span("pdf.build", sections_reused=self.sections_reused, charts_reused=charts_reused):
+                doc.build(elements)
+            if cached:
+                temporary = f"{cached}.{threading.get_ident()}.tmp"
+                shutil.copyfile(output_path, temporary)
+                os.replace(temporary, cached)
+                _trim_cache(self.cache_dir)
             return True
             
         except Exception as e:
             print(f"Error generating PDF: {e}")
-            return False
\ No newline at end of file
+            return False
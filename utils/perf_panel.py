@@ -0,0 +1,80 @@
+import os
+import pandas as pd
+import streamlit as st
+from utils import metering, sessions
+from utils.tracing import get_trace
+
+# Set DATTAVISM_PERF_PANEL=1 to show the per-rerun waterfall in the sidebar
+PERF_PANEL_ENABLED = os.getenv("DATTAVISM_PERF_PANEL", "0") == "1"
+
+
+def trace_to_frame(spans):
+    """
+    Converts the spans of one trace into a table for display.
+
+    Args:
+        spans (list): Span dictionaries returned by tracing.get_trace
+
+    Returns:
+        pandas.DataFrame: One row per span with its depth, start offset and duration in
+            milliseconds, model, token counts and memory delta, ordered by start time
+    """
+    if not spans:
+        return pd.DataFrame()
+    parents = {span["spanId"]: span["parentSpanId"] for span in spans}
+    start = min(span["startTimeUnixNano"] for span in spans)
+    rows = []
+    for span in spans:
+        depth, parent = 0, span["parentSpanId"]
+        while parent:
+            depth += 1
+            parent = parents.get(parent)
+        attributes = span["attributes"]
+        rows.append({
+            "span": "  " * depth + span["name"],
+            "start_ms": (span["startTimeUnixNano"] - start) / 1e6,
+            "duration_ms": (span["endTimeUnixNano"] - span["startTimeUnixNano"]) / 1e6,
+            "model": attributes.get("llm.model"),
+            "prompt_tokens": attributes.get("llm.prompt_tokens"),
+            "response_tokens": attributes.get("llm.response_tokens"),
+            "memory_delta_mb": (attributes.get("memory.rss_delta_bytes") or 0) / 2**20,
+            "status": span["status"]["code"],
+        })
+    return pd.DataFrame(rows).sort_values("start_ms").reset_index(drop=True)
+
+
+def render_perf_panel(trace_id):
+    """
+    Shows a waterfall of the spans recorded during this rerun, the memory of the
+    sessions in this process and the token usage per user in the sidebar.
+
+    Does nothing unless DATTAVISM_PERF_PANEL=1.
+
+    Args:
+        trace_id (str): Trace id returned by tracing.end_trace
+    """
+    if not PERF_PANEL_ENABLED:
+        return
+    import altair as alt
+
+    frame = trace_to_frame(get_trace(trace_id))
+    with st.sidebar.expander("⏱️ Performance", expanded=False):
+        if frame.empty:
+            st.caption("No spans were recorded in this rerun.")
+            return
+        frame["end_ms"] = frame["start_ms"] + frame["duration_ms"]
+        chart = alt.Chart(frame).mark_bar().encode(
+            x=alt.X("start_ms", title="ms since rerun start"),
+            x2="end_ms",
+            y=alt.Y("span", sort=None, title=None),
+            color=alt.Color("status", legend=None),
+            tooltip=["span", "duration_ms", "prompt_tokens", "response_tokens", "memory_delta_mb"],
+        )
+        st.altair_chart(chart, use_container_width=True)
+        st.dataframe(frame.drop(columns=["end_ms"]), hide_index=True)
+        st.caption(f"Sessions (limit {sessions.MAX_SESSION_BYTES / 2**20:,.0f} MB each)")
+        st.dataframe(sessions.usage(), hide_index=True)
+        meter = metering.get_meter()
+        if isinstance(meter, metering.UsageMeter):
+            st.caption(f"Token usage in the last 24 hours (budget {meter.user_budget:,} per user, {meter.global_budget:,} in total)")
+            st.dataframe(meter.report(by="user", days=1), hide_index=True)
@@ -0,0 +1,307 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from utils.sketches import CountMinSketch, HyperLogLog, Moments, TDigest, TopK, value_hashes
+from utils.tracing import traced
+
+# "auto" profiles datasets with at least APPROXIMATE_MIN_ROWS rows approximately, "on" and "off" force a mode
+APPROXIMATE_MODE = os.getenv("DATTAVISM_APPROXIMATE_PROFILING", "auto")
+
+# Row count from which the automatic mode switches to sketches
+APPROXIMATE_MIN_ROWS = 1_000_000
+
+# Rows summarized at a time, so memory stays bounded whatever the dataset size
+CHUNK_ROWS = 1_000_000
+
+# Quantiles reported by describe, as in pandas
+QUANTILES = [0.25, 0.5, 0.75]
+
+
+def use_approximate(df, approximate=None):
+    """
+    Decides whether a dataset is profiled with sketches.
+
+    Args:
+        df (pandas.DataFrame): Dataset to profile
+        approximate (bool, optional): Force a mode; by default APPROXIMATE_MODE decides
+
+    Returns:
+        bool: True for approximate profiling
+    """
+    if approximate is not None:
+        return approximate
+    if APPROXIMATE_MODE in ("on", "off"):
+        return APPROXIMATE_MODE == "on"
+    return len(df) >= APPROXIMATE_MIN_ROWS
+
+
+class ColumnSketch:
+    """
+    Sketches of one column: moments and a t-digest for numeric columns, a distinct count
+    sketch for every column, and frequent values with Count-Min frequency estimates for
+    the other columns. Sketches of separate chunks of rows merge.
+    """
+
+    def __init__(self, numeric, distinct=True, summaries=True):
+        self.numeric = numeric
+        self.rows = 0
+        self.moments = Moments() if numeric and summaries else None
+        self.digest = TDigest() if numeric and summaries else None
+        self.distinct = HyperLogLog() if distinct else None
+        self.top = TopK(capacity=32) if not numeric and summaries else None
+        self.frequencies = CountMinSketch() if not numeric and summaries else None
+        self.dtype = None
+
+    def add(self, series):
+        """Adds a chunk of the column."""
+        self.rows += len(series)
+        self.dtype = series.dtype
+        if self.numeric:
+            if self.distinct is not None:
+                self.distinct.add_hashes(value_hashes(series))
+            if self.moments is not None:
+                self.moments = self.moments.merge(Moments.from_series(series))
+                self.digest.add_array(series.to_numpy(dtype="float64", na_value=np.nan))
+            return
+        # Categorical values repeat, so every sketch is fed the distinct values with their counts
+        codes, uniques = pd.factorize(series)
+        counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+        hashes = value_hashes(pd.Series(uniques, dtype=series.dtype))
+        if self.distinct is not None:
+            self.distinct.add_hashes(hashes)
+        if self.top is not None:
+            self.frequencies.add_hashes(hashes, counts)
+            self.top = self.top.merge(TopK.from_counts(uniques, counts, capacity=self.top.capacity))
+
+    def merge(self, other):
+        merged = ColumnSketch(self.numeric)
+        merged.rows = self.rows + other.rows
+        merged.dtype = other.dtype or self.dtype
+        both = lambda mine, theirs: mine.merge(theirs) if mine is not None and theirs is not None else None
+        merged.distinct = both(self.distinct, other.distinct)
+        merged.moments = both(self.moments, other.moments)
+        merged.digest = both(self.digest, other.digest)
+        merged.top = both(self.top, other.top)
+        merged.frequencies = both(self.frequencies, other.frequencies)
+        return merged
+
+    def heavy_hitters(self, n=5):
+        """
+        Returns the most frequent values with frequency estimates.
+
+        Args:
+            n (int): Number of values
+
+        Returns:
+            list: (value, estimated count, error bound) tuples, most frequent first. The true
+                count lies between estimate - error and estimate.
+        """
+        if self.top is None:
+            return []
+        candidates = [value for value, _, _ in self.top.most_common(n)]
+        if not candidates:
+            return []
+        estimates = self.frequencies.estimate_hashes(value_hashes(pd.Series(candidates, dtype=self.dtype)))
+        bound = self.frequencies.error_bound
+        return sorted(
+            ((value, int(estimate), int(np.ceil(bound))) for value, estimate in zip(candidates, estimates)),
+            key=lambda item: item[1], reverse=True,
+        )
+
+
+def _is_numeric(series):
+    return pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+
+
+def _sketch_column(series, chunk_rows, distinct=True, summaries=True):
+    sketch = ColumnSketch(_is_numeric(series), distinct=distinct, summaries=summaries)
+    for start in range(0, len(series), chunk_rows):
+        sketch.add(series.iloc[start:start + chunk_rows])
+    return sketch
+
+
+class ApproximateProfile:
+    """
+    Profile of a dataset built from per-column sketches in bounded memory.
+
+    Example:
+        >>> profile = approximate_profile(df)
+        >>> profile.describe()
+        >>> profile.error_bounds()
+    """
+
+    def __init__(self, sketches, rows):
+        self.sketches = sketches
+        self.rows = rows
+
+    def describe(self):
+        """
+        Summarizes the numeric columns in the layout of pandas.DataFrame.describe().
+
+        Returns:
+            pandas.DataFrame: count, mean, std, min, 25%, 50%, 75% and max per numeric column.
+                Count, mean, std, min and max are exact; the quartiles are estimates.
+        """
+        columns = {}
+        for column, sketch in self.sketches.items():
+            if sketch.moments is None:
+                continue
+            m = sketch.moments
+            quartiles = sketch.digest.quantile(QUANTILES)
+            columns[column] = [m.count, m.mean if m.count else np.nan, m.std, m.minimum, *quartiles, m.maximum]
+        table = pd.DataFrame(columns, index=["count", "mean", "std", "min", "25%", "50%", "75%", "max"])
+        table.attrs["approximate"] = True
+        table.attrs["error_note"] = self.error_note()
+        return table
+
+    def nunique(self):
+        """
+        Estimates the number of distinct values per column.
+
+        Returns:
+            pandas.Series: Estimated distinct count per column, within about 0.8%
+        """
+        counts = {
+            column: min(sketch.distinct.count(), sketch.rows)
+            for column, sketch in self.sketches.items() if sketch.distinct is not None
+        }
+        return pd.Series(counts, dtype="int64")
+
+    def heavy_hitters(self, n=5):
+        """
+        Estimates the most frequent values of the non-numeric columns.
+
+        Args:
+            n (int): Values per column
+
+        Returns:
+            pandas.DataFrame: Rows of column, value, estimated count and error bound
+        """
+        rows = [
+            {"column": column, "value": value, "count": count, "error": error}
+            for column, sketch in self.sketches.items() if not sketch.numeric
+            for value, count, error in sketch.heavy_hitters(n)
+        ]
+        return pd.DataFrame(rows, columns=["column", "value", "count", "error"])
+
+    def error_bounds(self):
+        """
+        Reports how far each estimate may be from the exact value.
+
+        Returns:
+            pandas.DataFrame: Per column the largest rank error of the quartiles (fraction of rows),
+                the relative standard error of the distinct count and the Count-Min overcount bound
+        """
+        rows = {}
+        for column, sketch in self.sketches.items():
+            row = {}
+            if sketch.distinct is not None:
+                row["distinct_relative_error"] = 1.04 / np.sqrt(sketch.distinct.registers.size)
+            if sketch.digest is not None:
+                row["quartile_rank_error"] = float(np.nanmax(sketch.digest.rank_error(QUANTILES))) if sketch.digest.weights.size else np.nan
+            elif sketch.frequencies is not None:
+                row["frequency_overcount"] = sketch.frequencies.error_bound
+            rows[column] = row
+        return pd.DataFrame.from_dict(rows, orient="index")
+
+    def error_note(self):
+        """Returns a one-line description of the error bounds, for captions."""
+        bounds = self.error_bounds()
+        parts = []
+        if "quartile_rank_error" in bounds and bounds["quartile_rank_error"].notna().any():
+            parts.append(f"quartiles within ±{100 * bounds['quartile_rank_error'].max():.2f}% of rows in rank; "
+                         "counts, means, std, min and max are exact")
+        if "distinct_relative_error" in bounds and bounds["distinct_relative_error"].notna().any():
+            parts.append(f"distinct counts within ±{100 * bounds['distinct_relative_error'].max():.1f}% (one standard error)")
+        return f"Approximate profile of {self.rows:,} rows: " + ", ".join(parts) + "."
+
+
+@traced("profiling.approximate_profile")
+def approximate_profile(df, workers=None, chunk_rows=CHUNK_ROWS, distinct=True, summaries=True):
+    """
+    Sketches every column of a dataset, columns in parallel and rows in chunks.
+
+    Args:
+        df (pandas.DataFrame): Dataset to profile
+        workers (int, optional): Columns processed at the same time, defaults to the CPU count
+        chunk_rows (int): Rows summarized at a time
+        distinct (bool): Estimate distinct counts; describe does not need them
+        summaries (bool): Compute moments, quantiles and frequent values; nunique does not need them
+
+    Returns:
+        ApproximateProfile: Profile with describe, nunique, heavy_hitters and error_bounds
+    """
+    workers = workers or os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # Sorting and hashing run in numpy and pandas code that releases the GIL
+        futures = {column: pool.submit(_sketch_column, df[column], chunk_rows, distinct, summaries) for column in df.columns}
+        sketches = {column: future.result() for column, future in futures.items()}
+    return ApproximateProfile(sketches, len(df))
+
+
+@traced("profiling.approximate_profile_csv")
+def approximate_profile_csv(path, chunk_rows=CHUNK_ROWS, **read_csv_options):
+    """
+    Sketches a CSV file chunk by chunk, without loading it into memory.
+
+    Args:
+        path (str or file-like): CSV file
+        chunk_rows (int): Rows read at a time
+        **read_csv_options: Passed to pandas.read_csv
+
+    Returns:
+        ApproximateProfile: Profile of the whole file
+    """
+    profile = None
+    for chunk in pd.read_csv(path, chunksize=chunk_rows, **read_csv_options):
+        part = approximate_profile(chunk, chunk_rows=chunk_rows)
+        if profile is None:
+            profile = part
+            continue
+        for column, sketch in part.sketches.items():
+            previous = profile.sketches.get(column)
+            if previous is None or previous.numeric != sketch.numeric:
+                # A column whose type changed between chunks is profiled from this chunk on
+                profile.sketches[column] = sketch
+            else:
+                profile.sketches[column] = previous.merge(sketch)
+        profile.rows += part.rows
+    return profile or ApproximateProfile({}, 0)
+
+
+def describe(df, approximate=None):
+    """
+    Summarizes the numeric columns like pandas.DataFrame.describe(), with sketches for large datasets.
+
+    Args:
+        df (pandas.DataFrame or ColumnarDataset): Dataset to summarize; datasets that are not
+            DataFrames use their own describe method
+        approximate (bool, optional): Force exact (False) or approximate (True) profiling
+
+    Returns:
+        pandas.DataFrame: The summary. Approximate summaries have attrs["approximate"] set and
+            a description of their error bounds in attrs["error_note"].
+    """
+    if not isinstance(df, pd.DataFrame):
+        return df.describe()
+    if use_approximate(df, approximate):
+        numeric = [c for c in df.columns if _is_numeric(df[c])]
+        return approximate_profile(df[numeric], distinct=False).describe()
+    return df.describe()
+
+
+def nunique(df, approximate=None):
+    """
+    Counts distinct values per column like pandas.DataFrame.nunique(), with sketches for large datasets.
+
+    Args:
+        df (pandas.DataFrame): Dataset to analyze
+        approximate (bool, optional): Force exact (False) or approximate (True) counting
+
+    Returns:
+        pandas.Series: Distinct count per column
+    """
+    if use_approximate(df, approximate):
+        return approximate_profile(df, summaries=False).nunique()
+    return df.nunique()
@@ -0,0 +1,162 @@
+import math
+import re
+import pandas as pd
+
+# Characters per token of English text and tables, for estimates made before a prompt is sent
+CHARS_PER_TOKEN = 4
+
+# Sample rows shown to the model at most, fewer if they do not fit the budget
+MAX_SAMPLE_ROWS = 10
+
+# Longest cell text in a sample, longer values are cut with an ellipsis
+MAX_CELL_CHARS = 40
+
+# Latest chat turns kept word for word; older questions are listed without their answers
+RECENT_TURNS = 4
+
+# Start of a turn in a history string, e.g. "user: How many rows are there?" or "ai: There are..."
+TURN = re.compile(r"^(user|ai|assistant): ", re.MULTILINE)
+
+
+def estimate_tokens(text):
+    """
+    Estimates the number of tokens of a prompt without calling the model.
+
+    Args:
+        text (str): Prompt text
+
+    Returns:
+        int: Estimated token count, about one token per CHARS_PER_TOKEN characters
+    """
+    return math.ceil(len(str(text)) / CHARS_PER_TOKEN)
+
+
+def informative_columns(df):
+    """
+    Lists the columns worth showing the model.
+
+    Args:
+        df (pandas.DataFrame): Dataset
+
+    Returns:
+        list: Columns in their original order without the low-information ones: columns that are
+            empty or constant in the given rows, and text columns with a distinct value per row
+            (identifiers), as long as at least one column is left
+    """
+    keep = []
+    for column in df.columns:
+        values = df[column].dropna()
+        distinct = values.nunique()
+        if distinct <= 1:
+            continue
+        if distinct == len(values) and len(values) > 1 and not pd.api.types.is_numeric_dtype(values):
+            if not pd.api.types.is_datetime64_any_dtype(values):
+                continue
+        keep.append(column)
+    return keep or list(df.columns[:1])
+
+
+def column_types(df, max_tokens):
+    """
+    Describes the column types of a dataset within a token budget.
+
+    Args:
+        df (pandas.DataFrame): Dataset
+        max_tokens (int): Budget of the description
+
+    Returns:
+        str: The column to type mapping, or for wide datasets that do not fit, the number of
+            columns of each type with the first few names
+    """
+    types = df.dtypes.astype(str)
+    text = str(types.to_dict())
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    groups = types.groupby(types, sort=False).groups
+    return "; ".join(
+        f"{dtype}: {len(columns)} columns ({', '.join(map(str, columns[:3]))}{', ...' if len(columns) > 3 else ''})"
+        for dtype, columns in groups.items()
+    )
+
+
+def sample_table(df, max_tokens, max_rows=MAX_SAMPLE_ROWS):
+    """
+    Renders sample rows of a dataset as text that fits a token budget.
+
+    Args:
+        df (pandas.DataFrame): Dataset
+        max_tokens (int): Budget of the rendered table
+        max_rows (int): Maximum number of rows
+
+    Returns:
+        str: The first rows as a plain text table with cell text cut at MAX_CELL_CHARS.
+            Low-information columns are dropped first, then rows and finally trailing columns
+            until the table fits; the number of left-out columns is noted below the table
+
+    Example:
+        >>> prompt = f"Sample rows :\n{sample_table(df, max_tokens=800)}"
+    """
+    head = df.head(max_rows)
+    head = head[informative_columns(head)]
+    rows, width = len(head), head.shape[1]
+    while True:
+        shown = head.iloc[:rows, :width]
+        text = shown.to_string(max_colwidth=MAX_CELL_CHARS)
+        if width < df.shape[1]:
+            text += f"\n({df.shape[1] - width} more columns not shown)"
+        if estimate_tokens(text) <= max_tokens or (rows == 1 and width == 1):
+            return text
+        if rows > 1:
+            rows -= 1
+        else:
+            width = max(1, width * max_tokens // estimate_tokens(text))
+
+
+def summarize_history(history, max_tokens, recent_turns=RECENT_TURNS):
+    """
+    Shortens a chat history to a token budget.
+
+    Args:
+        history (str or list): "role: content" lines as built by the Q&A page, or a list of
+            {"role", "content"} messages
+        max_tokens (int): Budget of the returned history
+        recent_turns (int): Latest turns kept word for word
+
+    Returns:
+        str: Earlier questions listed one per line without their answers, followed by the latest
+            turns; if that still does not fit, the oldest text is cut
+    """
+    if isinstance(history, list):
+        history = "\n".join(f"{m['role']}: {m['content']}" for m in history)
+    history = str(history or "")
+    if estimate_tokens(history) <= max_tokens:
+        return history
+    starts = [m.start() for m in TURN.finditer(history)] or [0]
+    turns = [history[a:b].strip() for a, b in zip(starts, starts[1:] + [len(history)])]
+    older, recent = turns[:-recent_turns], turns[-recent_turns:]
+    questions = [t.split("\n", 1)[0] for t in older if t.lower().startswith("user:")]
+    summary = "\n".join(["Earlier questions:"] + questions) if questions else ""
+    text = "\n".join(p for p in [summary, *recent] if p)
+    budget = max_tokens * CHARS_PER_TOKEN
+    return text if len(text) <= budget else "…" + text[-budget:]
+
+
+def fit_items(items, max_tokens, keep=1):
+    """
+    Keeps the leading items of a ranked list that fit a token budget.
+
+    Args:
+        items (list): Text items, most relevant first
+        max_tokens (int): Budget of all kept items together
+        keep (int): Items kept even if they exceed the budget
+
+    Returns:
+        list: The longest prefix of items within the budget, and at least keep items
+    """
+    kept, used = [], 0
+    for item in items:
+        used += estimate_tokens(item)
+        if used > max_tokens and len(kept) >= keep:
+            break
+        kept.append(item)
+    return kept
@@ -0,0 +1,225 @@
+import re
+import numpy as np
+import pandas as pd
+from utils import profiling
+
+# Column names holding one period each, e.g. "1960", "2020 [YR2020]" or "FY2021"
+YEAR_COLUMN = re.compile(r"^\D{0,4}((?:1[89]|20)\d{2})(?:\D.*)?$")
+
+# Minimum number of period-like columns for a dataset to count as wide
+MIN_VALUE_COLUMNS = 3
+
+# Cells melted when a chart needs actual long-format rows, e.g. for a prompt or a scatter plot
+MAX_LONG_CELLS = 20_000
+
+# Groups shown in bar and pie charts of a wide dataset
+MAX_GROUPS = 20
+
+
+class WideLayout:
+    """
+    Roles of the columns of a wide dataset, where each row is an entity and each of
+    many columns holds the same measure for one period or item.
+
+    Args:
+        id_columns (list): Columns identifying a row, e.g. country and indicator
+        value_columns (list): Columns holding the measure, e.g. one per year
+        labels (list): x-axis label of each value column, e.g. the year as an int, or the
+            column name when several columns share a year
+        variable_name (str): Name of the column the value column labels go to in long format
+        value_name (str): Name of the column the values go to in long format
+    """
+
+    def __init__(self, id_columns, value_columns, labels, variable_name="variable", value_name="value"):
+        self.id_columns = id_columns
+        self.value_columns = value_columns
+        self.labels = labels
+        self.variable_name = variable_name
+        self.value_name = value_name
+
+
+def detect_wide_layout(df, min_value_columns=MIN_VALUE_COLUMNS):
+    """
+    Detects whether a dataset is wide and which columns are ids and which are values.
+
+    Args:
+        df (pandas.DataFrame): Dataset to inspect
+        min_value_columns (int): Minimum number of period-like columns
+
+    Returns:
+        WideLayout or None: The column roles, or None if the dataset is not wide
+
+    Notes:
+        - Value columns are named like years ("1960", "2020 [YR2020]") or are plain numbers ("1", "2");
+          periods within a year ("2020-01", "2020-Q2") keep their full name as the label
+        - Id columns are the other columns with more than one distinct value; constant columns
+          such as a repeated indicator code are left out of the long view
+        - Only the few non-value columns are counted, never the value block
+    """
+    names = [str(c) for c in df.columns]
+    years = {c: YEAR_COLUMN.match(n.strip()) for c, n in zip(df.columns, names)}
+    value_columns = [c for c, match in years.items() if match]
+    if len(value_columns) >= min_value_columns:
+        labels = [int(years[c].group(1)) for c in value_columns]
+        variable_name = "year"
+        if len(set(labels)) < len(labels):
+            # Several columns per year, e.g. "2020-01" and "2020-02", so each keeps its own name
+            labels = [str(c).strip() for c in value_columns]
+            variable_name = "period"
+    else:
+        value_columns = [c for c, n in zip(df.columns, names) if n.strip().isdigit()]
+        if len(value_columns) < min_value_columns:
+            return None
+        labels = [str(c).strip() for c in value_columns]
+        variable_name = "variable"
+    others = [c for c in df.columns if c not in set(value_columns)]
+    counts = profiling.nunique(df[others]) if others else pd.Series(dtype="int64")
+    id_columns = [c for c in others if counts.get(c, 0) > 1]
+    taken = {str(c) for c in df.columns}
+    while variable_name in taken:
+        variable_name += "_"
+    value_name = "value"
+    while value_name in taken:
+        value_name += "_"
+    return WideLayout(id_columns, value_columns, labels, variable_name, value_name)
+
+
+def value_block(df, layout):
+    """
+    Returns the value columns as numbers, converting text such as ".." to missing values.
+
+    Args:
+        df (pandas.DataFrame): Wide dataset
+        layout (WideLayout): Its column roles
+
+    Returns:
+        pandas.DataFrame: The value columns as floats, in the original row order
+    """
+    return pd.concat({c: _numeric(df[c]) for c in layout.value_columns}, axis=1)
+
+
+def _numeric(series):
+    if pd.api.types.is_numeric_dtype(series):
+        return series
+    return pd.to_numeric(series, errors="coerce")
+
+
+def _row_totals(df, layout, how):
+    # Sums value columns one at a time, so memory stays at a few arrays of one column
+    total = np.zeros(len(df))
+    count = np.zeros(len(df))
+    for column in layout.value_columns:
+        values = _numeric(df[column]).to_numpy(dtype="float64", na_value=np.nan)
+        present = ~np.isnan(values)
+        total += np.where(present, values, 0.0)
+        count += present
+    with np.errstate(invalid="ignore", divide="ignore"):
+        result = total if how == "sum" else total / count
+    return pd.Series(np.where(count > 0, result, np.nan), index=df.index)
+
+
+def long_sample(df, layout, max_cells=MAX_LONG_CELLS, seed=0):
+    """
+    Melts a random sample of rows into long format.
+
+    Args:
+        df (pandas.DataFrame): Wide dataset
+        layout (WideLayout): Its column roles
+        max_cells (int): Maximum rows of the long result
+        seed (int): Sampling seed, so the sample is stable across reruns
+
+    Returns:
+        pandas.DataFrame: Id columns, the variable column (labels such as years) and the value column
+    """
+    rows = max(1, max_cells // max(1, len(layout.value_columns)))
+    sample = df.sample(rows, random_state=seed).sort_index() if len(df) > rows else df
+    wide = pd.concat([sample[layout.id_columns], value_block(sample, layout)], axis=1)
+    long = pd.melt(
+        wide,
+        id_vars=layout.id_columns,
+        value_vars=layout.value_columns,
+        var_name=layout.variable_name,
+        value_name=layout.value_name,
+    )
+    long[layout.variable_name] = long[layout.variable_name].map(dict(zip(layout.value_columns, layout.labels)))
+    return long
+
+
+def wide_recommendations(df, layout):
+    """
+    Recommends charts of a wide dataset in terms of its long-format columns.
+
+    Args:
+        df (pandas.DataFrame): Wide dataset
+        layout (WideLayout): Its column roles
+
+    Returns:
+        list: Chart specifications like chart_recommender.recommend_charts, with "reshape": "long"
+            so renderers build the long-format data the chart needs through chart_frame
+    """
+    variable, value = layout.variable_name, layout.value_name
+    span = f"{layout.labels[0]} to {layout.labels[-1]}"
+    charts = [{
+        "chart_type": "line",
+        "x_column": variable,
+        "y_column": value,
+        "reason": f"Shows how the average value changes over the {len(layout.value_columns)} {variable} columns ({span}).",
+        "score": 0.9,
+        "reshape": "long",
+    }]
+    if layout.id_columns:
+        group = layout.id_columns[0]
+        shown = min(MAX_GROUPS, int(profiling.nunique(df[[group]])[group]))
+        charts.append({
+            "chart_type": "bar",
+            "x_column": group,
+            "y_column": value,
+            "reason": f"Compares the {shown} {group} values with the highest average over {span}.",
+            "score": 0.8,
+            "reshape": "long",
+        })
+    charts.append({
+        "chart_type": "histogram",
+        "x_column": value,
+        "y_column": value,
+        "reason": f"Shows the distribution of all values across the {variable} columns.",
+        "score": 0.6,
+        "reshape": "long",
+    })
+    return charts
+
+
+def chart_frame(df, chart, layout=None, max_cells=MAX_LONG_CELLS):
+    """
+    Builds the long-format data one chart of a wide dataset needs, without melting the dataset.
+
+    Args:
+        df (pandas.DataFrame): Wide dataset
+        chart (dict): Chart specification referring to long-format columns
+        layout (WideLayout, optional): Column roles, detected from df if not given
+        max_cells (int): Maximum rows for charts that need individual long-format rows
+
+    Returns:
+        pandas.DataFrame: For the variable on x, one row per value column with the mean
+            (sum for pie charts) over all rows; for an id column on x, the groups with the
+            highest average; for histograms, a sample of all values; otherwise a melted sample
+    """
+    layout = layout or detect_wide_layout(df)
+    if layout is None:
+        return df
+    chart_type = chart.get("chart_type")
+    x_column, y_column = chart.get("x_column"), chart.get("y_column")
+    how = "sum" if chart_type == "pie" else "mean"
+    if x_column == layout.variable_name and y_column == layout.value_name:
+        totals = [_numeric(df[c]).agg(how) for c in layout.value_columns]
+        return pd.DataFrame({x_column: layout.labels, y_column: totals})
+    if x_column in layout.id_columns and y_column == layout.value_name:
+        row_values = _row_totals(df, layout, how)
+        groups = row_values.groupby(df[x_column]).agg(how).nlargest(MAX_GROUPS)
+        return pd.DataFrame({x_column: groups.index, y_column: groups.to_numpy()})
+    if chart_type == "histogram" and layout.value_name in (x_column, y_column):
+        rows = max(1, max_cells // max(1, len(layout.value_columns)))
+        sample = df.sample(rows, random_state=0) if len(df) > rows else df
+        values = value_block(sample, layout).to_numpy(dtype="float64", na_value=np.nan).ravel()
+        return pd.DataFrame({layout.value_name: values[~np.isnan(values)]})
+    return long_sample(df, layout, max_cells=max_cells)
@@ -0,0 +1,168 @@
+import math
+import re
+from collections import Counter
+
+# Common words that carry no meaning for matching questions against report sections
+STOPWORDS = frozenset("""
+a an and are as at be by can do does for from has have how i in is it its me of on or show
+tell that the their there these this to was what when where which who why will with you your
+""".split())
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+HEADING_PATTERN = re.compile(r"^(#{1,6})\s+(.*)$", re.MULTILINE)
+
+
+def tokenize(text):
+    """
+    Splits text into lowercase search terms without stopwords.
+
+    Args:
+        text (str): Text to tokenize
+
+    Returns:
+        list: Search terms in the order they appear in the text
+    """
+    return [token for token in TOKEN_PATTERN.findall(str(text).lower()) if token not in STOPWORDS]
+
+
+def chunk_markdown(text, source, max_chars=1500):
+    """
+    Splits a markdown document into chunks along its section headings.
+
+    Args:
+        text (str): Markdown text to split
+        source (str): Label of the document the chunks come from (e.g., 'report')
+        max_chars (int): Sections longer than this are split further at paragraph breaks
+
+    Returns:
+        list: Chunk dictionaries with 'source', 'title' and 'text' keys. Each chunk keeps
+            the heading of its section so it still makes sense on its own in a prompt.
+
+    Example:
+        >>> chunk_markdown("# Sales\\nRevenue grew.\\n## Regions\\nNorth led.", "report")
+        [{'source': 'report', 'title': 'Sales', 'text': '# Sales\\nRevenue grew.'}, ...]
+    """
+    if not text:
+        return []
+    text = str(text)
+    starts = [match.start() for match in HEADING_PATTERN.finditer(text)]
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    starts.append(len(text))
+
+    chunks = []
+    for start, end in zip(starts, starts[1:]):
+        section = text[start:end].strip()
+        if not section:
+            continue
+        heading = HEADING_PATTERN.match(section)
+        title = heading.group(2).strip() if heading else source.title()
+
+        piece = ""
+        for paragraph in re.split(r"\n\s*\n", section):
+            if piece and len(piece) + len(paragraph) > max_chars:
+                chunks.append({"source": source, "title": title, "text": piece})
+                piece = f"(continued: {title})\n"
+            piece = f"{piece}\n\n{paragraph}" if piece else paragraph
+        if piece.strip():
+            chunks.append({"source": source, "title": title, "text": piece})
+    return chunks
+
+
+class BM25Index:
+    """
+    In-memory Okapi BM25 index over text chunks.
+
+    Args:
+        chunks (list): Chunk dictionaries with at least a 'text' key
+        k1 (float): Term frequency saturation parameter
+        b (float): Document length normalization parameter
+
+    Example:
+        >>> index = BM25Index(chunk_markdown(report, "report"))
+        >>> index.search("which region grew fastest?", top_k=3)
+    """
+
+    def __init__(self, chunks, k1=1.5, b=0.75):
+        self.chunks = list(chunks)
+        self.k1 = k1
+        self.b = b
+        self.term_freqs = [Counter(tokenize(chunk["text"])) for chunk in self.chunks]
+        self.lengths = [sum(freqs.values()) for freqs in self.term_freqs]
+        self.avg_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+
+        doc_freqs = Counter()
+        for freqs in self.term_freqs:
+            doc_freqs.update(freqs.keys())
+        total = len(self.chunks)
+        self.idf = {
+            term: math.log(1 + (total - count + 0.5) / (count + 0.5))
+            for term, count in doc_freqs.items()
+        }
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def scores(self, query):
+        """
+        Scores every chunk against a query.
+
+        Args:
+            query (str): Search query
+
+        Returns:
+            list: BM25 score for each chunk, in index order
+        """
+        terms = [term for term in set(tokenize(query)) if term in self.idf]
+        results = []
+        for freqs, length in zip(self.term_freqs, self.lengths):
+            score = 0.0
+            norm = self.k1 * (1 - self.b + self.b * length / self.avg_length) if self.avg_length else self.k1
+            for term in terms:
+                tf = freqs.get(term)
+                if tf:
+                    score += self.idf[term] * tf * (self.k1 + 1) / (tf + norm)
+            results.append(score)
+        return results
+
+    def search(self, query, top_k=4):
+        """
+        Returns the chunks most relevant to a query.
+
+        Args:
+            query (str): Search query
+            top_k (int): Maximum number of chunks to return
+
+        Returns:
+            list: Up to top_k (score, chunk) tuples with a positive score, best first
+        """
+        ranked = sorted(zip(self.scores(query), range(len(self.chunks))), reverse=True)
+        return [(score, self.chunks[i]) for score, i in ranked[:top_k] if score > 0]
+
+
+def build_qa_index(report, context=None, plots=None):
+    """
+    Indexes a report, its context description and chart reasons for Q&A retrieval.
+
+    Args:
+        report (str): Markdown analysis report
+        context (str, optional): Context detection text
+        plots (list, optional): Chart specifications with 'reason' explanations
+
+    Returns:
+        BM25Index: Index over the report sections, context sections and one chunk per chart
+
+    Example:
+        >>> index = build_qa_index(st.session_state["report"], st.session_state["context"], st.session_state["plot"])
+    """
+    chunks = chunk_markdown(report, "report") + chunk_markdown(context, "context")
+    for i, chart in enumerate(plots or [], 1):
+        chunks.append({
+            "source": "chart",
+            "title": f"Chart {i}",
+            "text": (
+                f"Chart {i}: {chart.get('chart_type')} chart of {chart.get('y_column')} "
+                f"by {chart.get('x_column')}. {chart.get('reason')}"
+            ),
+        })
+    return BM25Index(chunks)
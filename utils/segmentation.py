@@ -0,0 +1,504 @@
+import numpy as np
+import pandas as pd
+from utils.timeseries import IDENTIFIER
+from utils.tracing import traced
+
+# Numeric columns used to find segments and anomalies, the most variable first
+MAX_FEATURES = 8
+
+# Rows clusters and isolation trees are fitted on; every row is then assigned and scored
+FIT_SAMPLE_ROWS = 20_000
+
+# Rows the silhouette score of each candidate k is computed on
+SILHOUETTE_ROWS = 2000
+
+# Candidate numbers of clusters
+K_RANGE = range(2, 9)
+
+# Rows per mini-batch of k-means
+BATCH_ROWS = 1024
+
+# Mini-batch iterations of k-means
+ITERATIONS = 100
+
+# Trees of the isolation forest and rows per tree
+TREES = 50
+TREE_ROWS = 256
+
+# Trees every row is scored with first, and share of rows rescored with the whole forest
+SCREEN_TREES = 10
+SCREEN_SHARE = 0.02
+
+# Rows assigned and scored at a time, so memory stays bounded for large datasets
+CHUNK_ROWS = 200_000
+
+# Robust z-score (median and MAD) above which a value is extreme
+ROBUST_Z_THRESHOLD = 3.5
+
+
+def feature_columns(df, max_features=MAX_FEATURES):
+    """
+    Picks the numeric columns segments and anomalies are computed on.
+
+    Args:
+        df (pandas.DataFrame): Dataset
+        max_features (int): Maximum number of columns
+
+    Returns:
+        list: Numeric columns that are not identifiers, booleans or constant, the ones with the
+            largest robust spread relative to their median first
+    """
+    candidates = [
+        c for c in df.columns
+        if pd.api.types.is_numeric_dtype(df[c]) and not pd.api.types.is_bool_dtype(df[c]) and not IDENTIFIER.search(str(c))
+    ]
+    sample = df[candidates].head(FIT_SAMPLE_ROWS)
+    spread = (sample.quantile(0.75) - sample.quantile(0.25)) / (sample.median().abs() + 1e-9)
+    spread = spread.where(spread > 0, sample.std() / (sample.mean().abs() + 1e-9))
+    spread = spread[spread > 0].sort_values(ascending=False)
+    return spread.index[:max_features].tolist()
+
+
+class RobustScaler:
+    """
+    Centres columns on their median and divides by their IQR; missing values become the median.
+    """
+
+    def __init__(self, frame):
+        self.median = frame.median().to_numpy(dtype="float64")
+        spread = (frame.quantile(0.75) - frame.quantile(0.25)).to_numpy(dtype="float64")
+        fallback = frame.std().to_numpy(dtype="float64")
+        self.scale = np.where(spread > 0, spread, np.where(fallback > 0, fallback, 1.0))
+
+    def transform(self, frame):
+        values = frame.to_numpy(dtype="float64", na_value=np.nan)
+        values = (values - self.median) / self.scale
+        return np.nan_to_num(values, nan=0.0)
+
+
+def _squared_distances(points, centers):
+    return (
+        (points ** 2).sum(axis=1)[:, None]
+        - 2 * points @ centers.T
+        + (centers ** 2).sum(axis=1)[None, :]
+    )
+
+
+class MiniBatchKMeans:
+    """
+    k-means fitted on random mini-batches with per-centre learning rates (Sculley, 2010),
+    seeded with k-means++.
+
+    Args:
+        k (int): Number of clusters
+        seed (int): Random seed
+    """
+
+    def __init__(self, k, seed=0):
+        self.k = k
+        self.rng = np.random.default_rng(seed)
+        self.centers = None
+
+    def _init_centers(self, points):
+        centers = [points[self.rng.integers(len(points))]]
+        closest = ((points - centers[0]) ** 2).sum(axis=1)
+        for _ in range(1, self.k):
+            total = closest.sum()
+            i = self.rng.choice(len(points), p=closest / total) if total > 0 else self.rng.integers(len(points))
+            centers.append(points[i])
+            closest = np.minimum(closest, ((points - points[i]) ** 2).sum(axis=1))
+        return np.array(centers)
+
+    def fit(self, points, iterations=ITERATIONS, batch_rows=BATCH_ROWS):
+        self.centers = self._init_centers(points)
+        counts = np.zeros(self.k)
+        for _ in range(iterations):
+            batch = points[self.rng.integers(len(points), size=min(batch_rows, len(points)))]
+            labels = _squared_distances(batch, self.centers).argmin(axis=1)
+            batch_counts = np.bincount(labels, minlength=self.k)
+            sums = np.zeros_like(self.centers)
+            np.add.at(sums, labels, batch)
+            moved = batch_counts > 0
+            counts[moved] += batch_counts[moved]
+            # Each centre moves towards its batch mean by the share of its points seen in this batch
+            rate = batch_counts[moved] / counts[moved]
+            means = sums[moved] / batch_counts[moved][:, None]
+            self.centers[moved] += rate[:, None] * (means - self.centers[moved])
+        return self
+
+    def predict(self, points):
+        return _squared_distances(points, self.centers).argmin(axis=1)
+
+
+def silhouette(points, labels):
+    """
+    Computes the mean silhouette coefficient of a clustering.
+
+    Args:
+        points (numpy.ndarray): Scaled rows
+        labels (numpy.ndarray): Cluster of each row
+
+    Returns:
+        float: Between -1 and 1, higher for compact, well separated clusters
+    """
+    distances = np.sqrt(np.maximum(_squared_distances(points, points), 0))
+    clusters = np.unique(labels)
+    if len(clusters) < 2:
+        return -1.0
+    members = labels[None, :] == clusters[:, None]
+    mean_distance = (distances @ members.T) / members.sum(axis=1)
+    own = clusters.searchsorted(labels)
+    sizes = members.sum(axis=1)[own]
+    inside = mean_distance[np.arange(len(points)), own] * sizes / np.maximum(sizes - 1, 1)
+    mean_distance[np.arange(len(points)), own] = np.inf
+    nearest = mean_distance.min(axis=1)
+    scores = (nearest - inside) / np.maximum(np.maximum(nearest, inside), 1e-12)
+    return float(np.mean(np.where(sizes > 1, scores, 0.0)))
+
+
+def _average_path(n):
+    # Average path length of an unsuccessful search in a binary search tree of n points
+    n = np.asarray(n, dtype="float64")
+    return np.where(n > 2, 2 * (np.log(np.maximum(n - 1, 1)) + 0.5772156649) - 2 * (n - 1) / np.maximum(n, 1), np.where(n == 2, 1.0, 0.0))
+
+
+class IsolationForest:
+    """
+    Isolation forest (Liu et al., 2008): rows that random axis-aligned splits isolate in few
+    steps are anomalous. Trees are stored as arrays and every row descends them in lock step.
+
+    Args:
+        trees (int): Number of trees
+        tree_rows (int): Rows each tree is grown on
+        seed (int): Random seed
+    """
+
+    def __init__(self, trees=TREES, tree_rows=TREE_ROWS, seed=0):
+        self.trees = trees
+        self.tree_rows = tree_rows
+        self.rng = np.random.default_rng(seed)
+        self.forest = []
+
+    def _grow(self, points):
+        max_depth = int(np.ceil(np.log2(max(len(points), 2))))
+        feature, threshold, left, right, depths, sizes = [], [], [], [], [], []
+        stack = [(np.arange(len(points)), 0, None, None)]
+        while stack:
+            rows, depth, parent, side = stack.pop()
+            node = len(feature)
+            if parent is not None:
+                (left if side == "left" else right)[parent] = node
+            # Leaves send every row back to themselves, so all rows descend max_depth steps
+            feature.append(0)
+            threshold.append(np.inf)
+            left.append(node)
+            right.append(node)
+            depths.append(depth)
+            sizes.append(len(rows))
+            if depth >= max_depth or len(rows) <= 1:
+                continue
+            subset = points[rows]
+            low, high = subset.min(axis=0), subset.max(axis=0)
+            splittable = np.flatnonzero(high > low)
+            if not len(splittable):
+                continue
+            f = splittable[self.rng.integers(len(splittable))]
+            t = self.rng.uniform(low[f], high[f])
+            feature[node], threshold[node] = f, t
+            goes_left = subset[:, f] < t
+            stack.append((rows[~goes_left], depth + 1, node, "right"))
+            stack.append((rows[goes_left], depth + 1, node, "left"))
+        # Children are interleaved, so a node's next node is children[2 * node + goes_right]
+        children = np.stack([np.array(left), np.array(right)], axis=1).ravel().astype(np.int32)
+        return np.array(feature, dtype=np.int32), np.array(threshold, dtype="float32"), children, np.array(depths) + _average_path(sizes), max_depth
+
+    def fit(self, points):
+        n = min(self.tree_rows, len(points))
+        self.sample_rows = n
+        self.forest = [self._grow(points[self.rng.choice(len(points), n, replace=False)]) for _ in range(self.trees)]
+        return self
+
+    def score(self, points, trees=None, block_rows=16_384):
+        """
+        Scores rows.
+
+        Args:
+            points (numpy.ndarray): Scaled rows
+            trees (int, optional): Score with only the first trees, for a quicker estimate
+            block_rows (int): Rows descending the trees together; small blocks stay in the CPU cache
+
+        Returns:
+            numpy.ndarray: Anomaly score between 0 and 1 per row; above about 0.6 is anomalous
+        """
+        scores = np.empty(len(points))
+        forest = self.forest[:trees] if trees else self.forest
+        normalizer = float(_average_path(self.sample_rows)) * len(forest)
+        for start in range(0, len(points), block_rows):
+            # Feature-major float32 values, so each step gathers from one compact row per feature
+            block = np.ascontiguousarray(points[start:start + block_rows].T, dtype="float32")
+            n = block.shape[1]
+            offsets = np.arange(n, dtype=np.int32)
+            flat = block.ravel()
+            path_sum = np.zeros(n)
+            for feature, threshold, children, path, max_depth in forest:
+                node = np.zeros(n, dtype=np.int32)
+                for _ in range(max_depth):
+                    goes_right = flat.take(feature.take(node) * n + offsets) >= threshold.take(node)
+                    node = children.take(2 * node + goes_right)
+                path_sum += path.take(node)
+            scores[start:start + n] = 2 ** (-path_sum / normalizer)
+        return scores
+
+
+class Segmentation:
+    """
+    Segments and anomalies of a dataset.
+
+    Attributes:
+        features (list): Columns the analysis used
+        labels (numpy.ndarray): Segment of each row, numbered from 1
+        scores (numpy.ndarray): Isolation forest anomaly score of each row
+        robust (RobustZ): Medians and scales the robust z-scores are computed with
+        robust_z (numpy.ndarray): Most extreme robust z-score of each row, with its sign
+        extreme_features (numpy.ndarray): Position in features of the column of that z-score
+        silhouette (float): Silhouette coefficient of the chosen segmentation
+    """
+
+    def __init__(self, df, features, labels, scores, robust, robust_z, extreme_features, silhouette):
+        self.df = df
+        self.features = features
+        self.labels = labels
+        self.scores = scores
+        self.robust = robust
+        self.robust_z = robust_z
+        self.extreme_features = extreme_features
+        self.silhouette = silhouette
+
+    @property
+    def k(self):
+        return int(self.labels.max())
+
+    def clusters(self):
+        """
+        Summarizes the segments.
+
+        Returns:
+            pandas.DataFrame: Per segment its rows, share of the dataset, the mean of every
+                feature and the feature that sets it apart most from the overall median
+        """
+        frame = self.df[self.features].copy()
+        frame["segment"] = self.labels
+        means = frame.groupby("segment")[self.features].mean()
+        sizes = frame.groupby("segment").size()
+        spread = (frame[self.features].quantile(0.75) - frame[self.features].quantile(0.25)).replace(0, np.nan)
+        distance = ((means - frame[self.features].median()) / spread).abs()
+        table = pd.DataFrame({"rows": sizes, "share_pct": 100 * sizes / len(frame)})
+        table["distinguished_by"] = distance.idxmax(axis=1).where(distance.notna().any(axis=1))
+        return pd.concat([table, means], axis=1)
+
+    def anomalies(self, k=10):
+        """
+        Lists the most anomalous rows.
+
+        Args:
+            k (int): Number of rows
+
+        Returns:
+            pandas.DataFrame: Row number, anomaly score, the feature with the most extreme robust
+                z-score and that z-score, and the feature values, most anomalous first
+        """
+        top = np.argsort(-self.scores)[:k]
+        table = pd.DataFrame({
+            "row": self.df.index[top],
+            "score": self.scores[top],
+            "most_extreme": np.asarray(self.features, dtype=object)[self.extreme_features[top]],
+            "robust_z": self.robust_z[top],
+        })
+        return pd.concat([table, self.df[self.features].iloc[top].reset_index(drop=True)], axis=1)
+
+    def extreme_counts(self, threshold=ROBUST_Z_THRESHOLD):
+        """
+        Counts extreme values per feature by robust z-score.
+
+        Args:
+            threshold (float): Absolute robust z-score above which a value is extreme
+
+        Returns:
+            pandas.Series: Number of extreme values per feature
+        """
+        frame = self.df[self.features]
+        counts = np.zeros(len(self.features), dtype=np.int64)
+        for start in range(0, len(frame), CHUNK_ROWS):
+            counts += (np.abs(self.robust.transform(frame.iloc[start:start + CHUNK_ROWS])) > threshold).sum(axis=0)
+        return pd.Series(counts, index=self.features)
+
+
+class RobustZ:
+    """
+    Robust z-scores: the distance from the median in units of 1.4826 x MAD.
+
+    The median and MAD are computed one column at a time when the object is created, so
+    chunks of rows can then be scored without materializing the scores of the whole frame.
+
+    Args:
+        frame (pandas.DataFrame): Numeric columns
+
+    Example:
+        >>> robust = RobustZ(df[features])
+        >>> z = robust.transform(df[features].iloc[:CHUNK_ROWS])
+    """
+
+    def __init__(self, frame):
+        median = np.zeros(frame.shape[1])
+        scale = np.ones(frame.shape[1])
+        for i, column in enumerate(frame.columns):
+            values = frame[column].to_numpy(dtype="float64", na_value=np.nan)
+            values = values[~np.isnan(values)]
+            if len(values) == 0:
+                continue
+            median[i] = np.median(values)
+            deviation = np.abs(values - median[i])
+            mad = 1.4826 * np.median(deviation)
+            # Columns where most values are equal have no MAD, the mean absolute deviation stands in
+            fallback = 1.2533 * deviation.mean()
+            scale[i] = mad if mad > 0 else fallback if fallback > 0 else 1.0
+        self.median = median
+        self.scale = scale
+
+    def transform(self, frame):
+        """
+        Scores rows of the columns the object was created with.
+
+        Args:
+            frame (pandas.DataFrame): Rows to score, e.g. one chunk
+
+        Returns:
+            numpy.ndarray: Robust z-score of each value; 0 for missing values and constant columns
+        """
+        values = frame.to_numpy(dtype="float64", na_value=np.nan)
+        return np.nan_to_num((values - self.median) / self.scale)
+
+
+def _screened_scores(forest, points):
+    # Every row gets a quick estimate; the rows that may be anomalies are rescored with every tree
+    scores = forest.score(points, trees=SCREEN_TREES)
+    candidates = np.argsort(-scores)[:max(1000, int(SCREEN_SHARE * len(points)))]
+    scores[candidates] = forest.score(points[candidates])
+    return scores
+
+
+@traced("segmentation.analyze")
+def analyze(df, features=None, k=None, seed=0):
+    """
+    Finds segments with mini-batch k-means and scores anomalies with an isolation forest and
+    robust z-scores.
+
+    Args:
+        df (pandas.DataFrame): Dataset
+        features (list, optional): Numeric columns to use, chosen with feature_columns if not given
+        k (int, optional): Number of segments; chosen by silhouette score over K_RANGE if not given
+        seed (int): Random seed, so results are stable across runs
+
+    Returns:
+        Segmentation or None: The result, or None if fewer than two numeric columns or
+            fewer than 50 rows are available
+
+    Notes:
+        - Models are fitted on a sample of FIT_SAMPLE_ROWS rows; every row is then assigned
+          and scored in chunks of CHUNK_ROWS, keeping only its most extreme robust z-score
+        - Rows are scored with SCREEN_TREES trees first and the top SCREEN_SHARE rescored with
+          the whole forest; a row's score is the higher of its isolation score and
+          1 - 2^(-max|robust z| / ROBUST_Z_THRESHOLD), which is 0.5 at the threshold
+        - Columns are scaled by median and IQR, so outliers do not dominate the clustering
+
+    Example:
+        >>> result = analyze(pd.read_csv("customers.csv"))
+        >>> result.clusters()
+        >>> result.anomalies(5)
+    """
+    features = features or feature_columns(df)
+    if len(features) < 2 or len(df) < 50:
+        return None
+    frame = df[features]
+    rng = np.random.default_rng(seed)
+    sample_index = rng.choice(len(frame), min(FIT_SAMPLE_ROWS, len(frame)), replace=False)
+    sample = frame.iloc[sample_index]
+    scaler = RobustScaler(sample)
+    points = scaler.transform(sample)
+    # Scaled values are clipped so single extreme rows cannot claim a cluster of their own
+    points = np.clip(points, -10, 10)
+
+    check = points[rng.choice(len(points), min(SILHOUETTE_ROWS, len(points)), replace=False)]
+    if k is None:
+        best = None
+        for candidate in K_RANGE:
+            model = MiniBatchKMeans(candidate, seed).fit(points)
+            score = silhouette(check, model.predict(check))
+            if best is None or score > best[0]:
+                best = (score, model)
+        quality, model = best
+    else:
+        model = MiniBatchKMeans(k, seed).fit(points)
+        quality = silhouette(check, model.predict(check))
+    # The forest sees unclipped values, so it can tell how far out extreme rows lie
+    forest = IsolationForest(seed=seed).fit(scaler.transform(sample))
+
+    labels = np.empty(len(frame), dtype=np.int64)
+    scores = np.empty(len(frame))
+    robust = RobustZ(frame)
+    robust_z = np.empty(len(frame))
+    extreme_features = np.empty(len(frame), dtype=np.int64)
+    for start in range(0, len(frame), CHUNK_ROWS):
+        rows = frame.iloc[start:start + CHUNK_ROWS]
+        chunk = scaler.transform(rows)
+        end = start + len(chunk)
+        labels[start:end] = model.predict(np.clip(chunk, -10, 10))
+        scores[start:end] = _screened_scores(forest, chunk)
+        # Only the most extreme robust z-score of each row is kept
+        z = robust.transform(rows)
+        extreme_features[start:end] = np.abs(z).argmax(axis=1)
+        robust_z[start:end] = z[np.arange(len(z)), extreme_features[start:end]]
+    # Isolation trees only split within the range of their sample, so rows far beyond it
+    # score like the sample's extremes; extreme robust z-scores raise their score
+    scores = np.maximum(scores, 1 - 2 ** (-np.abs(robust_z) / ROBUST_Z_THRESHOLD))
+    # Segments are numbered from 1, largest first
+    order = np.argsort(-np.bincount(labels, minlength=model.k))
+    labels = np.argsort(order)[labels] + 1
+    return Segmentation(df, features, labels, scores, robust, robust_z, extreme_features, quality)
+
+
+def segment_chart_png(result, dpi=100):
+    """
+    Draws the segments and the top anomalies on the two features that separate segments most.
+
+    Args:
+        result (Segmentation): Output of analyze
+        dpi (int): Resolution of the image
+
+    Returns:
+        bytes: PNG image
+    """
+    import io
+    import matplotlib.pyplot as plt
+    means = result.clusters()[result.features]
+    spread = (result.df[result.features].quantile(0.75) - result.df[result.features].quantile(0.25)).replace(0, 1)
+    x_column, y_column = (means / spread).std().sort_values(ascending=False).index[:2]
+    shown = np.random.default_rng(0).choice(len(result.df), min(5000, len(result.df)), replace=False)
+    fig, ax = plt.subplots(figsize=(8, 5))
+    try:
+        points = result.df.iloc[shown]
+        scatter = ax.scatter(points[x_column], points[y_column], c=result.labels[shown], cmap="tab10", s=8, alpha=0.6)
+        top = np.argsort(-result.scores)[:20]
+        ax.scatter(result.df[x_column].iloc[top], result.df[y_column].iloc[top], marker="x", color="black", s=40, label="Top anomalies")
+        ax.legend(*scatter.legend_elements(), title="Segment", loc="upper left", fontsize=8)
+        ax.add_artist(ax.get_legend())
+        ax.legend(loc="upper right", fontsize=8)
+        ax.set_xlabel(x_column)
+        ax.set_ylabel(y_column)
+        ax.set_title(f"{result.k} segments (silhouette {result.silhouette:.2f})")
+        fig.tight_layout()
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format="png", dpi=dpi, bbox_inches="tight")
+        return buffer.getvalue()
+    finally:
+        plt.close(fig)
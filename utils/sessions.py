@@ -0,0 +1,344 @@
+import os
+import pickle
+import shutil
+import sys
+import threading
+import time
+import weakref
+import numpy as np
+import pandas as pd
+from utils.tracing import span
+
+# Directory idle sessions' objects are written to until the session comes back; only this
+# process's user may read it, as the files are unpickled on restore
+SESSION_DIR = os.getenv("DATTAVISM_SESSION_DIR", os.path.join(os.getenv("DATTAVISM_DATA_DIR", "data"), "sessions"))
+
+# Seconds without a rerun after which a session's heavy objects are moved to SESSION_DIR
+IDLE_SECONDS = float(os.getenv("DATTAVISM_SESSION_IDLE_SECONDS", 15 * 60))
+
+# Memory one session may hold; larger uploads must use large file mode
+MAX_SESSION_BYTES = int(os.getenv("DATTAVISM_SESSION_MAX_BYTES", 1024 ** 3))
+
+# Session state keys moved to disk when a session is idle
+SPILLABLE_KEYS = (
+    "df", "report", "context", "plot", "messages", "qa_index", "dataset_version",
+    "comparison_frames", "comparison", "comparison_join",
+)
+
+# Keys dropped first when a session is over its cap; pages rebuild them when the keys listed
+# with them are missing too
+REBUILDABLE_KEYS = {"qa_index": ("qa_index_source",), "comparison_join": ()}
+
+# Chat messages kept per session; older ones are dropped, the model only sees recent turns anyway
+MAX_MESSAGES = 100
+
+# Depth to which containers are walked when measuring the memory of a session state value
+MAX_SIZE_DEPTH = 4
+
+_sessions = {}
+_lock = threading.RLock()
+
+
+def object_bytes(value, _depth=0):
+    """
+    Estimates the memory held by a session state value.
+
+    Args:
+        value (object): DataFrame, array, text, container or object
+
+    Returns:
+        int: Bytes, counting DataFrames deeply and walking containers and object attributes
+            up to MAX_SIZE_DEPTH levels
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(np.sum(value.memory_usage(index=True, deep=True)))
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    size = sys.getsizeof(value)
+    if isinstance(value, (str, bytes)) or _depth >= MAX_SIZE_DEPTH:
+        return size
+    if isinstance(value, dict):
+        items = [*value.keys(), *value.values()]
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        items = value
+    elif hasattr(value, "__dict__"):
+        items = [vars(value)]
+    else:
+        items = ()
+    return size + sum(object_bytes(item, _depth + 1) for item in items)
+
+
+class SessionRecord:
+    """
+    Memory accounting of one browser session.
+
+    Args:
+        session_id (str): Streamlit session id
+        state (streamlit.runtime.state.SessionState): The session's state, referenced weakly
+    """
+
+    def __init__(self, session_id, state):
+        self.session_id = session_id
+        self.state = weakref.ref(state, lambda _: _forget(session_id))
+        self.last_active = time.time()
+        self.sizes = {}
+        self.spilled = {}
+        self.files = set()
+        self.lock = threading.Lock()
+
+    @property
+    def directory(self):
+        return os.path.join(SESSION_DIR, self.session_id)
+
+    def measure(self):
+        """Returns the bytes of each key of the session state, reusing sizes of unchanged values."""
+        state = self.state()
+        if state is None:
+            return {}
+        sizes = {}
+        for key, value in state.filtered_state.items():
+            known = self.sizes.get(key)
+            if known is None or known[0] is not value:
+                known = self.sizes[key] = (value, object_bytes(value))
+            sizes[key] = known[1]
+        for key in set(self.sizes) - set(sizes):
+            del self.sizes[key]
+        return sizes
+
+    def memory_bytes(self):
+        """Returns the memory held by the session, excluding what was moved to disk."""
+        return sum(self.measure().values())
+
+    def spill(self):
+        """
+        Moves the heavy objects of the session to disk.
+
+        Returns:
+            int: Bytes of the objects written
+        """
+        state = self.state()
+        if state is None:
+            return 0
+        _private_dir(SESSION_DIR)
+        _private_dir(self.directory)
+        sizes = self.measure()
+        written = 0
+        for key in SPILLABLE_KEYS:
+            if key not in sizes:
+                continue
+            path = os.path.join(self.directory, f"{key}.pkl")
+            try:
+                with open(path, "wb") as f:
+                    pickle.dump(state[key], f, protocol=pickle.HIGHEST_PROTOCOL)
+            except Exception:
+                # Objects that cannot be pickled stay in memory
+                continue
+            self.spilled[key] = path
+            written += sizes[key]
+            del state[key]
+            self.sizes.pop(key, None)
+        return written
+
+    def restore(self):
+        """
+        Loads the objects moved to disk back into the session state.
+
+        Returns:
+            list: Keys restored
+        """
+        state = self.state()
+        restored = []
+        for key, path in list(self.spilled.items()):
+            try:
+                with open(path, "rb") as f:
+                    if state is not None and key not in state:
+                        state[key] = pickle.load(f)
+                        restored.append(key)
+            except OSError:
+                pass
+            del self.spilled[key]
+        shutil.rmtree(self.directory, ignore_errors=True)
+        return restored
+
+
+def _private_dir(path):
+    # Created, or restricted if it already exists, so other users cannot plant pickles in it
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    os.chmod(path, 0o700)
+
+
+def _forget(session_id):
+    # The session has ended: drop its record and whatever it left on disk
+    with _lock:
+        record = _sessions.pop(session_id, None)
+    shutil.rmtree(os.path.join(SESSION_DIR, session_id), ignore_errors=True)
+    for path in record.files if record else ():
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def own_file(path):
+    """
+    Deletes a file when the current session ends, e.g. the Parquet copy of an upload.
+
+    Args:
+        path (str): File written for the current session
+
+    Returns:
+        bool: Whether the file was registered; False outside a Streamlit session
+    """
+    session_id, _ = _current_state()
+    with _lock:
+        record = _sessions.get(session_id)
+        if record is None:
+            return False
+        record.files.add(path)
+    return True
+
+
+def _current_state():
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        return None, None
+    # The SafeSessionState wrapper is recreated for every script run, the state it wraps
+    # lives as long as the session
+    return ctx.session_id, getattr(ctx.session_state, "_state", ctx.session_state)
+
+
+def _enforce_cap(record, sizes):
+    # Rebuildable objects go first; what remains over the cap is reported
+    state = record.state()
+    for key, companions in REBUILDABLE_KEYS.items():
+        if sum(sizes.values()) <= MAX_SESSION_BYTES:
+            break
+        if key in sizes:
+            for dropped in (key, *companions):
+                if dropped in state:
+                    del state[dropped]
+                sizes.pop(dropped, None)
+    return sum(sizes.values())
+
+
+def touch():
+    """
+    Records activity of the current session and keeps session memory in bounds.
+
+    Call it at the top of every page, before session state is read.
+
+    Returns:
+        int or None: Bytes held by the current session, or None outside a Streamlit session
+
+    Notes:
+        - Objects of this session that were moved to disk while it was idle are loaded back
+        - The chat history is cut to the latest MAX_MESSAGES messages
+        - A session over MAX_SESSION_BYTES first loses the objects in REBUILDABLE_KEYS
+        - Other sessions idle for more than IDLE_SECONDS have their SPILLABLE_KEYS moved to
+          SESSION_DIR; ended sessions' files are deleted
+        - Recorded as a session.touch span with the session's bytes, the number of sessions and
+          the keys restored and sessions evicted
+
+    Example:
+        >>> st.set_page_config(page_title="Report", layout="wide")
+        >>> sessions.touch()
+    """
+    session_id, state = _current_state()
+    if state is None:
+        return None
+    with span("session.touch") as s:
+        with _lock:
+            record = _sessions.get(session_id)
+            if record is None or record.state() is not state:
+                files = record.files if record is not None else set()
+                record = _sessions[session_id] = SessionRecord(session_id, state)
+                record.files = files
+            record.last_active = time.time()
+            idle = [r for r in _sessions.values() if r is not record and time.time() - r.last_active > IDLE_SECONDS]
+        with record.lock:
+            s.set("session.restored_keys", ",".join(record.restore()) if record.spilled else "")
+        if len(state["messages"] if "messages" in state else ()) > MAX_MESSAGES:
+            state["messages"] = state["messages"][-MAX_MESSAGES:]
+        used = _enforce_cap(record, record.measure())
+        evicted = spilled_bytes = 0
+        for other in idle:
+            with other.lock:
+                # The session may have come back since the list was made
+                if time.time() - other.last_active <= IDLE_SECONDS:
+                    continue
+                written = other.spill()
+            if written:
+                evicted += 1
+                spilled_bytes += written
+        s.set("session.bytes", used)
+        s.set("session.cap_bytes", MAX_SESSION_BYTES)
+        s.set("session.over_cap", used > MAX_SESSION_BYTES)
+        s.set("session.sessions", len(_sessions))
+        s.set("session.evicted_sessions", evicted)
+        s.set("session.spilled_bytes", spilled_bytes)
+    return used
+
+
+def keep_alive():
+    """
+    Records activity of the current session without the housekeeping of touch.
+
+    Call it at the top of fragments: their reruns skip the page's touch(), so a user who
+    only works in one fragment would otherwise count as idle and be moved to disk.
+
+    Returns:
+        list: Keys loaded back from disk, empty outside a Streamlit session
+    """
+    session_id, state = _current_state()
+    if state is None:
+        return []
+    with _lock:
+        record = _sessions.get(session_id)
+    if record is None or record.state() is not state:
+        touch()
+        return []
+    # Set before taking the lock, so a spill waiting for it sees the session as active
+    record.last_active = time.time()
+    with record.lock:
+        return record.restore() if record.spilled else []
+
+
+def check_fits(value, what="The dataset"):
+    """
+    Checks that an object fits in one session before it is stored.
+
+    Args:
+        value (object): Object about to be stored in session state
+        what (str): Description used in the error message
+
+    Raises:
+        MemoryError: If the object alone exceeds MAX_SESSION_BYTES
+    """
+    size = object_bytes(value)
+    if size > MAX_SESSION_BYTES:
+        raise MemoryError(
+            f"{what} takes {size / 2**20:,.0f} MB in memory, more than the {MAX_SESSION_BYTES / 2**20:,.0f} MB "
+            f"allowed per session. Turn on large file mode to analyse it from disk."
+        )
+
+
+def usage():
+    """
+    Summarizes the memory of every session in this process.
+
+    Returns:
+        pandas.DataFrame: One row per session with its memory in MB, seconds since its last
+            rerun and the number of objects moved to disk, most memory first
+    """
+    with _lock:
+        records = list(_sessions.values())
+    now = time.time()
+    table = pd.DataFrame([{
+        "session": record.session_id[:8],
+        "memory_mb": record.memory_bytes() / 2**20,
+        "idle_seconds": round(now - record.last_active),
+        "spilled_objects": len(record.spilled),
+    } for record in records], columns=["session", "memory_mb", "idle_seconds", "spilled_objects"])
+    return table.sort_values("memory_mb", ascending=False).reset_index(drop=True)
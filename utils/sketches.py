@@ -0,0 +1,458 @@
+import numpy as np
+import pandas as pd
+
+
+def value_hashes(series):
+    """
+    Hashes the non-null values of a column.
+
+    Args:
+        series (pandas.Series): Column to hash
+
+    Returns:
+        numpy.ndarray: One uint64 hash per non-null value; equal values always get equal hashes
+    """
+    series = series.dropna()
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        # An integer column becomes float when an append brings missing values; 5 and 5.0 must collide
+        series = series.astype("float64")
+    return pd.util.hash_pandas_object(series, index=False).to_numpy()
+
+
+class Moments:
+    """
+    Count, sum, mean, variance, minimum and maximum of a numeric column, mergeable across
+    batches of rows with Chan's parallel update, so statistics of an appended dataset
+    are updated from the new rows alone.
+
+    Example:
+        >>> moments = Moments.from_series(old["sales"]).merge(Moments.from_series(new["sales"]))
+        >>> moments.mean, moments.std
+    """
+
+    def __init__(self, count=0, mean=0.0, m2=0.0, minimum=np.nan, maximum=np.nan, missing=0):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.minimum = minimum
+        self.maximum = maximum
+        self.missing = missing
+
+    @classmethod
+    def from_series(cls, series):
+        values = pd.to_numeric(series, errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+        present = values[~np.isnan(values)]
+        if present.size == 0:
+            return cls(missing=int(values.size))
+        mean = float(present.mean())
+        return cls(
+            count=int(present.size),
+            mean=mean,
+            m2=float(((present - mean) ** 2).sum()),
+            minimum=float(present.min()),
+            maximum=float(present.max()),
+            missing=int(values.size - present.size),
+        )
+
+    def merge(self, other):
+        """
+        Combines the moments of two disjoint batches of rows.
+
+        Args:
+            other (Moments): Moments of the other batch
+
+        Returns:
+            Moments: Moments of both batches together
+        """
+        count = self.count + other.count
+        missing = self.missing + other.missing
+        if not self.count or not other.count:
+            source = self if self.count else other
+            return Moments(source.count, source.mean, source.m2, source.minimum, source.maximum, missing)
+        delta = other.mean - self.mean
+        return Moments(
+            count=count,
+            mean=self.mean + delta * other.count / count,
+            m2=self.m2 + other.m2 + delta ** 2 * self.count * other.count / count,
+            minimum=min(self.minimum, other.minimum),
+            maximum=max(self.maximum, other.maximum),
+            missing=missing,
+        )
+
+    @property
+    def sum(self):
+        return self.mean * self.count
+
+    @property
+    def std(self):
+        """Sample standard deviation, as computed by pandas."""
+        return float(np.sqrt(self.m2 / (self.count - 1))) if self.count > 1 else np.nan
+
+
+class HyperLogLog:
+    """
+    Distinct count estimate in fixed memory (2**precision one-byte registers).
+
+    Two sketches built with the same precision merge by taking the register-wise
+    maximum, which equals the sketch of the combined rows. The relative standard
+    error is about 1.04 / sqrt(2**precision), 0.8% at the default precision.
+
+    Args:
+        precision (int): Number of index bits, between 4 and 18
+
+    Example:
+        >>> sketch = HyperLogLog()
+        >>> sketch.add_series(df["customer_id"])
+        >>> sketch.count()
+    """
+
+    def __init__(self, precision=14):
+        if not 4 <= precision <= 18:
+            raise ValueError("precision must be between 4 and 18")
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def add_hashes(self, hashes):
+        """
+        Adds values given as 64-bit hashes.
+
+        Args:
+            hashes (numpy.ndarray): uint64 hashes, e.g. from value_hashes
+        """
+        if hashes.size == 0:
+            return
+        p = self.precision
+        hashes = hashes.astype(np.uint64, copy=False)
+        index = (hashes >> np.uint64(64 - p)).astype(np.int64)
+        rest = hashes << np.uint64(p)
+        # The float64 exponent gives the position of the highest set bit, so the leading zeros;
+        # rounding can only shift it when the top 53 bits are all ones
+        zeros = 64 - np.frexp(rest.astype(np.float64))[1]
+        rank = np.minimum(zeros + 1, 64 - p + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def add_series(self, series):
+        """Adds the non-null values of a column."""
+        self.add_hashes(value_hashes(series))
+
+    def merge(self, other):
+        """
+        Combines two sketches.
+
+        Args:
+            other (HyperLogLog): Sketch with the same precision
+
+        Returns:
+            HyperLogLog: Sketch of the values of both
+        """
+        if other.precision != self.precision:
+            raise ValueError("Only sketches with the same precision can be merged")
+        merged = HyperLogLog(self.precision)
+        merged.registers = np.maximum(self.registers, other.registers)
+        return merged
+
+    def count(self):
+        """
+        Estimates the number of distinct values added.
+
+        Returns:
+            int: Estimated distinct count
+        """
+        m = self.registers.size
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.power(2.0, -self.registers.astype(np.float64)))
+        empty = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and empty:
+            # Linear counting is more accurate while many registers are still empty
+            estimate = m * np.log(m / empty)
+        return int(round(estimate))
+
+
+class TopK:
+    """
+    Frequent values of a column in a mergeable summary of bounded size.
+
+    Every kept value has a count that is a lower bound of its true frequency and an
+    error that bounds how much it may be undercounted. Values dropped from the summary
+    had at most `floor` occurrences.
+
+    Args:
+        capacity (int): Number of values kept; larger values make the top few exact more often
+
+    Example:
+        >>> top = TopK.from_series(old["region"]).merge(TopK.from_series(new["region"]))
+        >>> top.most_common(5)
+    """
+
+    def __init__(self, capacity=64):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self.floor = 0
+
+    @classmethod
+    def from_series(cls, series, capacity=64):
+        counts = series.value_counts()
+        return cls.from_counts(counts.index, counts.to_numpy(), capacity)
+
+    @classmethod
+    def from_counts(cls, values, counts, capacity=64):
+        """
+        Builds a summary from exact counts of a batch of rows.
+
+        Args:
+            values (array-like): Distinct values
+            counts (numpy.ndarray): Number of rows of each value
+            capacity (int): Number of values kept
+
+        Returns:
+            TopK: Summary of the batch
+        """
+        summary = cls(capacity)
+        order = np.argsort(-np.asarray(counts), kind="stable")
+        kept = order[:capacity]
+        summary.counts = {values[i]: int(counts[i]) for i in kept}
+        summary.errors = dict.fromkeys(summary.counts, 0)
+        summary.floor = int(counts[order[capacity]]) if len(order) > capacity else 0
+        return summary
+
+    def merge(self, other):
+        """
+        Combines the summaries of two disjoint batches of rows.
+
+        Args:
+            other (TopK): Summary of the other batch
+
+        Returns:
+            TopK: Summary of both batches, keeping the larger capacity
+        """
+        merged = TopK(max(self.capacity, other.capacity))
+        for value in set(self.counts) | set(other.counts):
+            merged.counts[value] = self.counts.get(value, 0) + other.counts.get(value, 0)
+            # A value missing from one summary may have had up to that summary's floor occurrences there
+            merged.errors[value] = (
+                (self.errors.get(value, 0) if value in self.counts else self.floor)
+                + (other.errors.get(value, 0) if value in other.counts else other.floor)
+            )
+        ranked = sorted(merged.counts, key=merged.counts.get, reverse=True)
+        dropped = ranked[merged.capacity:]
+        merged.floor = max([self.floor + other.floor] + [merged.counts[v] + merged.errors[v] for v in dropped])
+        for value in dropped:
+            del merged.counts[value], merged.errors[value]
+        return merged
+
+    def most_common(self, n=5):
+        """
+        Returns the most frequent values.
+
+        Args:
+            n (int): Number of values
+
+        Returns:
+            list: (value, count, error) tuples, most frequent first
+        """
+        ranked = sorted(self.counts.items(), key=lambda item: item[1], reverse=True)[:n]
+        return [(value, count, self.errors[value]) for value, count in ranked]
+
+
+class TDigest:
+    """
+    Quantile estimate of a numeric column in bounded memory (a merging t-digest).
+
+    Values are summarized as at most about `compression` weighted centroids, small
+    near the tails and larger around the median, so extreme quantiles stay accurate.
+    Digests of separate batches merge into the digest of all values.
+
+    Args:
+        compression (float): Controls the number of centroids and so the accuracy
+
+    Example:
+        >>> digest = TDigest()
+        >>> digest.add_array(df["price"].to_numpy())
+        >>> digest.quantile([0.25, 0.5, 0.75])
+    """
+
+    def __init__(self, compression=200):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.minimum = np.nan
+        self.maximum = np.nan
+
+    @property
+    def count(self):
+        return float(self.weights.sum())
+
+    def _compress(self, means, weights):
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order], weights[order]
+        total = weights.sum()
+        midpoints = (np.cumsum(weights) - weights / 2) / total
+        # k1 scale function: a centroid may span at most one unit of k
+        k = self.compression / (2 * np.pi) * np.arcsin(2 * midpoints - 1)
+        clusters = np.floor(k - k[0]).astype(np.int64)
+        starts = np.concatenate([[0], np.flatnonzero(np.diff(clusters)) + 1])
+        merged_weights = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / merged_weights
+        self.weights = merged_weights
+
+    def add_array(self, values):
+        """
+        Adds values.
+
+        Args:
+            values (numpy.ndarray): Numbers; NaN values are ignored
+        """
+        values = np.asarray(values, dtype="float64")
+        values = values[~np.isnan(values)]
+        n = values.size
+        if n == 0:
+            return
+        # Centroids of this batch on its own, cut where the scale function crosses an integer,
+        # then merged with the existing centroids, so only the batch itself is ever sorted
+        values = np.sort(values)
+        steps = np.arange(np.ceil(-self.compression / 4), np.floor(self.compression / 4) + 1)
+        ranks = np.unique(np.round((np.sin(2 * np.pi * steps / self.compression) + 1) / 2 * n).astype(np.int64))
+        starts = np.concatenate([[0], ranks[(ranks > 0) & (ranks < n)]])
+        weights = np.diff(np.concatenate([starts, [n]])).astype("float64")
+        means = np.add.reduceat(values, starts) / weights
+        self.minimum = np.nanmin([self.minimum, values[0]])
+        self.maximum = np.nanmax([self.maximum, values[-1]])
+        self._compress(np.concatenate([self.means, means]), np.concatenate([self.weights, weights]))
+
+    def merge(self, other):
+        """
+        Combines two digests.
+
+        Args:
+            other (TDigest): Digest of another batch
+
+        Returns:
+            TDigest: Digest of the values of both
+        """
+        merged = TDigest(max(self.compression, other.compression))
+        merged.minimum = np.nanmin([self.minimum, other.minimum])
+        merged.maximum = np.nanmax([self.maximum, other.maximum])
+        if self.weights.size or other.weights.size:
+            merged._compress(np.concatenate([self.means, other.means]), np.concatenate([self.weights, other.weights]))
+        return merged
+
+    def _positions(self):
+        total = self.weights.sum()
+        positions = (np.cumsum(self.weights) - self.weights / 2) / total
+        return np.concatenate([[0.0], positions, [1.0]]), np.concatenate([[self.minimum], self.means, [self.maximum]])
+
+    def quantile(self, q):
+        """
+        Estimates quantiles.
+
+        Args:
+            q (float or list): Quantile(s) between 0 and 1
+
+        Returns:
+            float or numpy.ndarray: Estimated values, NaN if no values were added
+        """
+        if not self.weights.size:
+            return np.full(np.shape(q), np.nan) if np.ndim(q) else np.nan
+        positions, values = self._positions()
+        return np.interp(q, positions, values)
+
+    def rank_error(self, q):
+        """
+        Bounds the rank error of quantile estimates.
+
+        Args:
+            q (float or list): Quantile(s) between 0 and 1
+
+        Returns:
+            float or numpy.ndarray: Half the weight of the centroid each estimate falls in, as a
+                fraction of all values; the true rank of the estimate is within this distance of q
+        """
+        if not self.weights.size:
+            return np.full(np.shape(q), np.nan) if np.ndim(q) else np.nan
+        edges = np.cumsum(self.weights) / self.weights.sum()
+        index = np.minimum(np.searchsorted(edges, q), self.weights.size - 1)
+        return self.weights[index] / (2 * self.weights.sum())
+
+
+class CountMinSketch:
+    """
+    Frequency estimate of any value in fixed memory (depth x width counters).
+
+    Estimates never undercount. With probability 1 - exp(-depth) they overcount by at
+    most e / width times the number of values added.
+
+    Args:
+        width (int): Counters per row
+        depth (int): Number of rows, each with its own hash function
+
+    Example:
+        >>> sketch = CountMinSketch()
+        >>> sketch.add_hashes(value_hashes(df["customer_id"]))
+        >>> sketch.estimate_hashes(value_hashes(pd.Series(["C-1001"])))
+    """
+
+    # Odd multipliers of the multiply-shift hash functions, one per row
+    _MULTIPLIERS = np.array([
+        0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0xD6E8FEB86659FD93,
+        0xFF51AFD7ED558CCD, 0xC4CEB9FE1A85EC53, 0x94D049BB133111EB, 0xBF58476D1CE4E5B9,
+    ], dtype=np.uint64)
+
+    def __init__(self, width=2048, depth=4):
+        if not 1 <= depth <= len(self._MULTIPLIERS):
+            raise ValueError(f"depth must be between 1 and {len(self._MULTIPLIERS)}")
+        self.width = width
+        self.depth = depth
+        self.counts = np.zeros((depth, width), dtype=np.int64)
+        self.total = 0
+
+    def _indexes(self, hashes, row):
+        return ((hashes.astype(np.uint64, copy=False) * self._MULTIPLIERS[row]) >> np.uint64(32)) % np.uint64(self.width)
+
+    def add_hashes(self, hashes, counts=None):
+        """
+        Adds values given as 64-bit hashes.
+
+        Args:
+            hashes (numpy.ndarray): uint64 hashes, e.g. from value_hashes
+            counts (numpy.ndarray, optional): Occurrences of each hashed value, when the hashes
+                are of distinct values; every hash counts once by default
+        """
+        for row in range(self.depth):
+            added = np.bincount(self._indexes(hashes, row).astype(np.int64), weights=counts, minlength=self.width)
+            self.counts[row] += added.astype(np.int64)
+        self.total += int(hashes.size if counts is None else np.sum(counts))
+
+    def estimate_hashes(self, hashes):
+        """
+        Estimates how often values were added.
+
+        Args:
+            hashes (numpy.ndarray): uint64 hashes of the values
+
+        Returns:
+            numpy.ndarray: Estimated count per value
+        """
+        return np.min([self.counts[row][self._indexes(hashes, row).astype(np.int64)] for row in range(self.depth)], axis=0)
+
+    def merge(self, other):
+        """
+        Combines two sketches.
+
+        Args:
+            other (CountMinSketch): Sketch with the same width and depth
+
+        Returns:
+            CountMinSketch: Sketch of the values of both
+        """
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError("Only sketches with the same width and depth can be merged")
+        merged = CountMinSketch(self.width, self.depth)
+        merged.counts = self.counts + other.counts
+        merged.total = self.total + other.total
+        return merged
+
+    @property
+    def error_bound(self):
+        """Largest overcount of an estimate, with probability 1 - exp(-depth)."""
+        return np.e / self.width * self.total
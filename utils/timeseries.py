@@ -0,0 +1,433 @@
+import re
+import numpy as np
+import pandas as pd
+from pandas.tseries.api import guess_datetime_format
+from utils.tracing import traced
+
+# Rows inspected when looking for datetime columns stored as text
+DETECT_SAMPLE_ROWS = 1000
+
+# Share of sampled values that must parse for a text column to count as datetime
+MIN_PARSED_SHARE = 0.9
+
+# Text that looks like a date, e.g. 2024-03-01, 2024/3/1 or 01/03/2024
+DATE_LIKE = re.compile(r"^\s*(\d{4}[-/.]\d{1,2}([-/.]\d{1,2})?|\d{1,2}[-/.]\d{1,2}[-/.]\d{2,4})([ T]\d{1,2}:\d{2}.*)?\s*$")
+
+# Candidate resampling frequencies from finest to coarsest, with their approximate length
+FREQUENCIES = [
+    ("s", pd.Timedelta(seconds=1)),
+    ("min", pd.Timedelta(minutes=1)),
+    ("15min", pd.Timedelta(minutes=15)),
+    ("h", pd.Timedelta(hours=1)),
+    ("D", pd.Timedelta(days=1)),
+    ("W", pd.Timedelta(weeks=1)),
+    ("MS", pd.Timedelta(days=30.44)),
+    ("QS", pd.Timedelta(days=91.31)),
+    ("YS", pd.Timedelta(days=365.25)),
+]
+
+# Seasonal period looked for at each frequency: a day of hours, a week of days, a year of months...
+SEASONAL_PERIODS = {"h": 24, "D": 7, "W": 52, "MS": 12, "QS": 4}
+
+# Readable names of the frequencies, for tables and captions
+FREQUENCY_NAMES = {"s": "second", "min": "minute", "15min": "15 minutes", "h": "hour", "D": "day",
+                   "W": "week", "MS": "month", "QS": "quarter", "YS": "year"}
+
+# Seasonal strength from which the peak of the season is reported
+MIN_SEASONAL_STRENGTH = 0.5
+
+# Most points a resampled series has
+MAX_POINTS = 500
+
+# Share of the median spacing of the timestamps a frequency must reach; below 1 because
+# months and quarters vary in length, so a 31-day gap still resamples to months
+SPACING_TOLERANCE = 0.9
+
+# Numeric columns analysed over time
+MAX_SERIES = 5
+
+# Change points reported per column
+MAX_CHANGE_POINTS = 3
+
+# Standard errors by which segment means must differ to count as a change point
+CHANGE_THRESHOLD = 5.0
+
+# Smallest level shift reported, in standard deviations of the series
+MIN_SHIFT_STD = 0.5
+
+# Names of identifier columns, whose trend over time means nothing
+IDENTIFIER = re.compile(r"(^|[_\s])id$|^id[_\s]", re.IGNORECASE)
+
+
+def datetime_columns(df, sample_rows=DETECT_SAMPLE_ROWS):
+    """
+    Finds the columns of a dataset holding dates or timestamps.
+
+    Args:
+        df (pandas.DataFrame): Dataset to inspect
+        sample_rows (int): Rows of each text column that are test-parsed
+
+    Returns:
+        list: Datetime columns, native datetime columns first
+
+    Notes:
+        - Text columns are checked on a sample against a date pattern before being parsed
+    """
+    native = [c for c in df.columns if pd.api.types.is_datetime64_any_dtype(df[c])]
+    parsed = []
+    for column in df.columns:
+        series = df[column]
+        if column in native or not (pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series)):
+            continue
+        sample = series.dropna().head(sample_rows).astype(str)
+        if sample.empty or sample.str.match(DATE_LIKE).mean() < MIN_PARSED_SHARE:
+            continue
+        if pd.to_datetime(sample, errors="coerce", format="mixed").notna().mean() >= MIN_PARSED_SHARE:
+            parsed.append(column)
+    return native + parsed
+
+
+def parse_datetime(series):
+    """
+    Converts a column to timestamps, inferring the format from its first value so the
+    whole column is parsed with one vectorized format.
+
+    Args:
+        series (pandas.Series): Datetime or text column
+
+    Returns:
+        pandas.Series: datetime64 values, NaT where a value does not parse
+    """
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    first = series.dropna()
+    fmt = guess_datetime_format(str(first.iloc[0])) if not first.empty else None
+    try:
+        return pd.to_datetime(series, errors="coerce", format=fmt or "mixed")
+    except ValueError:
+        return pd.to_datetime(series, errors="coerce", format="mixed")
+
+
+def choose_frequency(start, end, max_points=MAX_POINTS, spacing=None):
+    """
+    Picks the finest frequency that covers a time span in at most max_points periods.
+
+    Args:
+        start (pandas.Timestamp): First timestamp
+        end (pandas.Timestamp): Last timestamp
+        max_points (int): Maximum number of periods
+        spacing (pandas.Timedelta, optional): Median gap between distinct timestamps; the
+            frequency is never finer, so monthly data is not upsampled into empty weeks
+
+    Returns:
+        str: pandas frequency alias, e.g. 'D' or 'MS'
+    """
+    step = (end - start) / max_points
+    if spacing is not None:
+        step = max(step, spacing * SPACING_TOLERANCE)
+    for alias, length in FREQUENCIES:
+        if length >= step:
+            return alias
+    return FREQUENCIES[-1][0]
+
+
+def resample(df, time_column, value_columns, how="mean", frequency=None, max_points=MAX_POINTS):
+    """
+    Sorts rows by time and aggregates them into evenly spaced periods.
+
+    Args:
+        df (pandas.DataFrame): Dataset
+        time_column (str): Datetime column
+        value_columns (list): Numeric columns to aggregate
+        how (str): Aggregation, e.g. mean, sum or count
+        frequency (str, optional): pandas frequency; chosen with choose_frequency if not given
+        max_points (int): Maximum number of periods when the frequency is chosen
+
+    Returns:
+        tuple: (pandas.DataFrame indexed by period start, frequency alias)
+    """
+    times = parse_datetime(df[time_column])
+    valid = times.notna().to_numpy()
+    times = times[valid]
+    if times.empty:
+        return pd.DataFrame(columns=value_columns), frequency
+    if frequency is None:
+        distinct = np.unique(times.to_numpy())
+        spacing = pd.Timedelta(np.median(np.diff(distinct))) if len(distinct) > 1 else None
+        frequency = choose_frequency(times.min(), times.max(), max_points, spacing=spacing)
+    values = df.loc[valid, value_columns].apply(pd.to_numeric, errors="coerce")
+    values.index = pd.DatetimeIndex(times)
+    return values.resample(frequency).agg(how), frequency
+
+
+def rolling_statistics(series, window):
+    """
+    Computes a trailing rolling mean and standard deviation.
+
+    Args:
+        series (pandas.Series): Evenly spaced series
+        window (int): Periods per window
+
+    Returns:
+        pandas.DataFrame: Columns mean and std
+    """
+    rolling = series.rolling(window, min_periods=max(1, window // 2))
+    return pd.DataFrame({"mean": rolling.mean(), "std": rolling.std()})
+
+
+def decompose(series, period):
+    """
+    Splits a series into trend, seasonal and residual parts (classical additive decomposition,
+    with the seasonal pattern taken as the median over cycles).
+
+    Args:
+        series (pandas.Series): Evenly spaced series without missing values
+        period (int): Seasonal period in steps, e.g. 12 for months
+
+    Returns:
+        dict: trend, seasonal and residual series, and trend_strength and seasonal_strength
+            between 0 (none) and 1 (the part explains the whole variation), or None if the
+            series is shorter than two periods
+    """
+    values = series.to_numpy(dtype="float64")
+    if period < 2 or len(values) < 2 * period:
+        return None
+    # A centred moving average over one period; even periods use a 2 x period average
+    trend = series.rolling(period, center=True).mean()
+    if period % 2 == 0:
+        trend = trend.rolling(2).mean().shift(-1)
+    detrended = values - trend.to_numpy()
+    positions = np.arange(len(values)) % period
+    # One row per cycle; the median per position ignores cycles distorted by a level shift
+    cycles = np.full(-(-len(values) // period) * period, np.nan)
+    cycles[:len(values)] = detrended
+    pattern = np.nanmedian(cycles.reshape(-1, period), axis=0)
+    pattern = np.nan_to_num(pattern - np.nanmean(pattern))
+    seasonal = pattern[positions]
+    residual = detrended - seasonal
+    strength = lambda part: float(max(0.0, 1 - np.nanvar(residual) / np.nanvar(part))) if np.nanvar(part) > 0 else 0.0
+    return {
+        "trend": trend,
+        "seasonal": pd.Series(seasonal, index=series.index),
+        "residual": pd.Series(residual, index=series.index),
+        "trend_strength": strength(trend.to_numpy() + residual),
+        "seasonal_strength": strength(seasonal + residual),
+    }
+
+
+def change_points(series, max_points=MAX_CHANGE_POINTS, threshold=CHANGE_THRESHOLD, min_shift=MIN_SHIFT_STD, window=None):
+    """
+    Finds shifts in the level of a series.
+
+    Args:
+        series (pandas.Series): Evenly spaced series without missing values
+        max_points (int): Maximum number of change points
+        threshold (float): Standard errors by which the means on both sides must differ
+        min_shift (float): Standard deviations of the series by which the means must differ,
+            so long series do not report negligible but significant shifts
+        window (int, optional): Periods compared on each side, by default 1/20 of the series
+
+    Returns:
+        list: Index labels where a new level starts, in time order
+
+    Notes:
+        - The means of the window before and after every period are compared at once from
+          cumulative sums; a steady trend only moves them slightly, a level shift fully
+        - The noise level is estimated from the median absolute difference between
+          neighbouring values, so trends and the shifts themselves hardly inflate it
+        - The largest shifts are kept, at least one window apart
+    """
+    values = series.to_numpy(dtype="float64")
+    n = len(values)
+    window = window or max(3, n // 20)
+    if n < 2 * window:
+        return []
+    sigma = np.median(np.abs(np.diff(values))) / (0.6745 * np.sqrt(2))
+    if not sigma > 0:
+        sigma = np.std(values)
+    if not sigma > 0:
+        return []
+    cumulative = np.concatenate([[0.0], np.cumsum(values)])
+    splits = np.arange(window, n - window + 1)
+    shift = np.abs((cumulative[splits + window] - cumulative[splits]) - (cumulative[splits] - cumulative[splits - window])) / window
+    significant = (shift >= min_shift * np.std(values)) & (shift / (sigma * np.sqrt(2 / window)) > threshold)
+    found = []
+    for i in np.argsort(-shift):
+        if not significant[i] or len(found) == max_points:
+            break
+        if all(abs(splits[i] - other) >= window for other in found):
+            found.append(int(splits[i]))
+    return [series.index[i] for i in sorted(found)]
+
+
+class TimeSeriesAnalysis:
+    """
+    Trends, seasonality and change points of the numeric columns of a dataset over time.
+
+    Attributes:
+        time_column (str): Datetime column the rows are ordered by
+        frequency (str): Resampling frequency alias
+        series (pandas.DataFrame): Period means of the analysed columns
+        results (dict): Per column the decomposition summary and change points
+    """
+
+    def __init__(self, time_column, frequency, series, results):
+        self.time_column = time_column
+        self.frequency = frequency
+        self.series = series
+        self.results = results
+
+    def trends(self):
+        """
+        Tabulates the trend and seasonality of each analysed column.
+
+        Returns:
+            pandas.DataFrame: Per column the resampling period, the first and last period mean, the change between them
+                in percent, the trend slope per period, the trend and seasonal strength, and the
+                seasonal period and its peak position
+        """
+        period = FREQUENCY_NAMES[self.frequency]
+        rows = {
+            column: {"period": period, **{k: v for k, v in result.items() if k != "change_points"}}
+            for column, result in self.results.items()
+        }
+        return pd.DataFrame.from_dict(rows, orient="index")
+
+    def change_point_table(self):
+        """
+        Tabulates the detected level shifts.
+
+        Returns:
+            pandas.DataFrame: Rows of column, period where the new level starts, and the mean
+                before and after it
+        """
+        rows = []
+        for column, result in self.results.items():
+            series = self.series[column].dropna()
+            points = result["change_points"]
+            bounds = [series.index[0]] + points + [series.index[-1] + pd.Timedelta(1, "ns")]
+            for i, point in enumerate(points):
+                before = series[(series.index >= bounds[i]) & (series.index < point)].mean()
+                after = series[(series.index >= point) & (series.index < bounds[i + 2])].mean()
+                rows.append({"column": column, "from": _period_label(point, self.frequency),
+                             "mean_before": before, "mean_after": after})
+        return pd.DataFrame(rows, columns=["column", "from", "mean_before", "mean_after"])
+
+
+def _period_label(timestamp, frequency):
+    formats = {"MS": "%Y-%m", "QS": "%Y-%m", "YS": "%Y", "D": "%Y-%m-%d", "W": "%Y-%m-%d"}
+    return timestamp.strftime(formats.get(frequency, "%Y-%m-%d %H:%M"))
+
+
+def _analyze_series(series, frequency):
+    values = series.interpolate(limit_direction="both")
+    result = {
+        "first": float(values.iloc[0]),
+        "last": float(values.iloc[-1]),
+        "change_pct": 100 * (values.iloc[-1] - values.iloc[0]) / abs(values.iloc[0]) if values.iloc[0] else np.nan,
+        "slope_per_period": float(np.polyfit(np.arange(len(values)), values.to_numpy(), 1)[0]),
+        "trend_strength": np.nan,
+        "seasonal_period": None,
+        "seasonal_strength": np.nan,
+        "seasonal_peak": None,
+    }
+    period = SEASONAL_PERIODS.get(frequency)
+    parts = decompose(values, period) if period else None
+    if parts is not None:
+        peak = int(np.argmax(parts["seasonal"].to_numpy()[:period]))
+        result.update(
+            trend_strength=parts["trend_strength"],
+            seasonal_period=f"{period} {FREQUENCY_NAMES[frequency]}s",
+            seasonal_strength=parts["seasonal_strength"],
+            seasonal_peak=_season_label(values.index[peak], frequency) if parts["seasonal_strength"] >= MIN_SEASONAL_STRENGTH else None,
+        )
+    # Level shifts are looked for once the seasonal swing is removed, so peaks are not mistaken for shifts
+    result["change_points"] = change_points(values - parts["seasonal"] if parts is not None else values)
+    return result
+
+
+def _season_label(timestamp, frequency):
+    if frequency == "h":
+        return f"{timestamp.hour:02d}:00"
+    if frequency == "D":
+        return timestamp.day_name()
+    if frequency == "W":
+        return f"week {timestamp.isocalendar().week}"
+    if frequency == "MS":
+        return timestamp.month_name()
+    return f"Q{timestamp.quarter}"
+
+
+@traced("timeseries.analyze")
+def analyze(df, time_column=None, value_columns=None, max_points=MAX_POINTS):
+    """
+    Analyses how the numeric columns of a dataset evolve over time.
+
+    Args:
+        df (pandas.DataFrame): Dataset
+        time_column (str, optional): Datetime column, the first one found if not given
+        value_columns (list, optional): Columns to analyse, by default up to MAX_SERIES numeric
+            columns that are not identifiers
+        max_points (int): Maximum number of periods after resampling
+
+    Returns:
+        TimeSeriesAnalysis or None: The analysis, or None if the dataset has no datetime column,
+            no numeric column or fewer than 3 periods
+
+    Example:
+        >>> analysis = analyze(pd.read_csv("sales_data.csv"))
+        >>> analysis.trends()
+        >>> analysis.change_point_table()
+    """
+    if time_column is None:
+        found = datetime_columns(df)
+        if not found:
+            return None
+        time_column = found[0]
+    if value_columns is None:
+        value_columns = [
+            c for c in df.columns
+            if c != time_column and pd.api.types.is_numeric_dtype(df[c]) and not pd.api.types.is_bool_dtype(df[c])
+            and not IDENTIFIER.search(str(c))
+        ][:MAX_SERIES]
+    if not value_columns:
+        return None
+    series, frequency = resample(df, time_column, value_columns, max_points=max_points)
+    results = {}
+    for column in value_columns:
+        values = series[column]
+        if values.notna().sum() >= 3:
+            results[column] = _analyze_series(values, frequency)
+    if not results:
+        return None
+    return TimeSeriesAnalysis(time_column, frequency, series, results)
+
+
+def line_frame(df, x_column, y_column, max_points=MAX_POINTS):
+    """
+    Prepares a line chart over time: period means with a rolling mean, in time order.
+
+    Args:
+        df (pandas.DataFrame): Dataset
+        x_column (str): Datetime column
+        y_column (str): Numeric column
+        max_points (int): Maximum number of periods
+
+    Returns:
+        pandas.DataFrame or None: Columns x_column, y_column and "<y_column> (rolling mean)",
+            or None if x_column does not hold dates or y_column is not numeric
+    """
+    if x_column not in df.columns or y_column not in df.columns or x_column == y_column:
+        return None
+    if not pd.api.types.is_numeric_dtype(df[y_column]):
+        return None
+    if not pd.api.types.is_datetime64_any_dtype(df[x_column]) and x_column not in datetime_columns(df[[x_column]]):
+        return None
+    series, frequency = resample(df, x_column, [y_column], max_points=max_points)
+    if series.empty:
+        return None
+    values = series[y_column]
+    window = SEASONAL_PERIODS.get(frequency, 5)
+    frame = pd.DataFrame({x_column: series.index, y_column: values.to_numpy()})
+    frame[f"{y_column} (rolling mean)"] = rolling_statistics(values, window)["mean"].to_numpy()
+    return frame
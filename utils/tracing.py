@@ -0,0 +1,255 @@
+import contextvars
+import functools
+import json
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# JSONL file spans are appended to; set DATTAVISM_TRACE_FILE to an empty string to disable it
+TRACE_FILE = os.getenv("DATTAVISM_TRACE_FILE", os.path.join("traces", "trace.jsonl"))
+
+# Size at which the trace file is rotated to <file>.1
+MAX_TRACE_FILE_BYTES = 50 * 1024 * 1024
+
+# Number of recent traces kept in memory for the perf panel
+MAX_RECENT_TRACES = 200
+
+_current_span = contextvars.ContextVar("dattavism_current_span", default=None)
+_lock = threading.Lock()
+_recent_traces = OrderedDict()
+
+
+def current_rss():
+    """
+    Returns the resident memory of this process.
+
+    Returns:
+        int or None: Resident set size in bytes, or None if it cannot be read on this platform
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        return None
+
+
+class Span:
+    """
+    A timed unit of work with attributes, in the shape of an OpenTelemetry span.
+
+    Args:
+        name (str): Name of the operation, e.g. 'gemini.generate_report'
+        trace_id (str): Identifier shared by every span of one page rerun
+        parent_id (str, optional): Identifier of the enclosing span
+        attributes (dict, optional): Initial attributes
+    """
+
+    def __init__(self, name, trace_id, parent_id=None, attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.status = "OK"
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self._start_perf = time.perf_counter()
+        self._start_rss = current_rss()
+
+    def set(self, key, value):
+        """Sets an attribute such as a token count or a byte size."""
+        self.attributes[key] = value
+
+    @property
+    def duration_ms(self):
+        return (self.end_ns - self.start_ns) / 1e6 if self.end_ns else None
+
+    def finish(self, error=None):
+        duration = time.perf_counter() - self._start_perf
+        self.end_ns = self.start_ns + int(duration * 1e9)
+        end_rss = current_rss()
+        if end_rss is not None and self._start_rss is not None:
+            self.attributes["memory.rss_bytes"] = end_rss
+            self.attributes["memory.rss_delta_bytes"] = end_rss - self._start_rss
+        if error is not None:
+            self.status = "ERROR"
+            self.attributes["error.type"] = type(error).__name__
+            self.attributes["error.message"] = str(error)[:500]
+
+    def to_dict(self):
+        """Returns the span in the OpenTelemetry JSON field layout."""
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "attributes": self.attributes,
+            "status": {"code": self.status},
+        }
+
+
+def _export(span):
+    record = span.to_dict()
+    with _lock:
+        spans = _recent_traces.setdefault(span.trace_id, [])
+        spans.append(record)
+        _recent_traces.move_to_end(span.trace_id)
+        while len(_recent_traces) > MAX_RECENT_TRACES:
+            _recent_traces.popitem(last=False)
+        if not TRACE_FILE:
+            return
+        try:
+            directory = os.path.dirname(TRACE_FILE)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            if os.path.exists(TRACE_FILE) and os.path.getsize(TRACE_FILE) > MAX_TRACE_FILE_BYTES:
+                os.replace(TRACE_FILE, TRACE_FILE + ".1")
+            with open(TRACE_FILE, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, default=str) + "\n")
+        except OSError as e:
+            print(f"Could not write trace: {e}")
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Times a block of code as a span nested under the current span.
+
+    Args:
+        name (str): Name of the operation
+        **attributes: Initial span attributes
+
+    Yields:
+        Span: The running span, so attributes can be added inside the block
+
+    Example:
+        >>> with span("upload.read_csv", file_bytes=uploaded_file.size) as s:
+        ...     df = pd.read_csv(uploaded_file)
+        ...     s.set("rows", len(df))
+    """
+    parent = _current_span.get()
+    trace_id = parent.trace_id if parent else secrets.token_hex(16)
+    current = Span(name, trace_id, parent.span_id if parent else None, attributes)
+    token = _current_span.set(current)
+    error = None
+    try:
+        yield current
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        _current_span.reset(token)
+        current.finish(error)
+        _export(current)
+
+
+def traced(name=None):
+    """
+    Decorator that runs every call of a function inside a span.
+
+    Args:
+        name (str, optional): Span name, defaults to module.function
+
+    Example:
+        >>> @traced("gemini.generate_report")
+        ... def generate_report(data):
+        ...     ...
+    """
+    def decorator(func):
+        span_name = name or f"{func.__module__.split('.')[-1]}.{func.__name__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def current_span():
+    """
+    Returns the span the caller is running in.
+
+    Returns:
+        Span or None: The innermost running span
+    """
+    return _current_span.get()
+
+
+def _close_interrupted(stale):
+    # The previous rerun on this thread stopped before end_trace, e.g. at st.switch_page,
+    # st.rerun or an uncaught error; it is exported as ending where its last span ended
+    with _lock:
+        ends = [record["endTimeUnixNano"] for record in _recent_traces.get(stale.trace_id, [])]
+    stale.finish()
+    if ends:
+        stale.end_ns = max(ends)
+    stale.set("trace.interrupted", True)
+    _export(stale)
+    _current_span.set(None)
+
+
+def start_trace(name, **attributes):
+    """
+    Opens the root span of a page rerun. Must be closed with end_trace.
+
+    Page scripts are not functions, so the root span is opened at the top of the
+    script and closed at the bottom instead of using a with block.
+
+    Args:
+        name (str): Name of the page, e.g. 'page.report'
+        **attributes: Initial span attributes
+
+    Returns:
+        tuple: Opaque handle to pass to end_trace
+
+    Notes:
+        A rerun that stops before end_trace, as st.switch_page and st.rerun do, leaves its
+        root span current on the script thread. It is closed here, marked with
+        trace.interrupted, so the new rerun starts its own trace.
+    """
+    stale = _current_span.get()
+    if stale is not None:
+        _close_interrupted(stale)
+    context = span(name, **attributes)
+    root = context.__enter__()
+    return context, root
+
+
+def end_trace(handle):
+    """
+    Closes a root span opened with start_trace.
+
+    Args:
+        handle (tuple): Value returned by start_trace
+
+    Returns:
+        str: Trace id of the finished rerun
+    """
+    context, root = handle
+    context.__exit__(None, None, None)
+    return root.trace_id
+
+
+def get_trace(trace_id):
+    """
+    Returns the spans recorded for a trace, in the order they finished.
+
+    Args:
+        trace_id (str): Trace id returned by end_trace
+
+    Returns:
+        list: Span dictionaries in the OpenTelemetry JSON field layout
+    """
+    with _lock:
+        return list(_recent_traces.get(trace_id, []))
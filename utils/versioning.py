@@ -0,0 +1,362 @@
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+import pandas as pd
+from utils.fingerprint import dataset_hash, row_hashes, text_hash
+from utils.sketches import HyperLogLog, Moments, TopK
+from utils.tracing import traced
+
+# Directory dataset versions are stored in
+VERSIONS_DIR = os.getenv("DATTAVISM_VERSIONS_DIR", os.path.join("data", "versions"))
+
+# Versions kept per dataset name; older profiles and analyses are deleted
+MAX_VERSIONS = 12
+
+_default_store = None
+
+
+def _digest(hashes):
+    return hashlib.sha256(hashes.tobytes()).hexdigest()
+
+
+class DatasetProfile:
+    """
+    Mergeable statistics of one dataset version: row count, schema, moments of the
+    numeric columns, distinct count sketches of every column and frequent values of
+    the categorical columns.
+
+    Profiles of a dataset and of rows appended to it merge into the profile of the
+    combined dataset, so an append only needs the new rows to be profiled.
+
+    Example:
+        >>> profile = DatasetProfile.from_frame(df)
+        >>> profile = profile.merge(DatasetProfile.from_frame(appended_rows), rows_digest=...)
+        >>> profile.summary()
+    """
+
+    def __init__(self, rows, dtypes, moments, distinct, top, rows_digest):
+        self.rows = rows
+        self.dtypes = dtypes
+        self.moments = moments
+        self.distinct = distinct
+        self.top = top
+        self.rows_digest = rows_digest
+
+    @classmethod
+    @traced("versioning.profile")
+    def from_frame(cls, df, hashes=None):
+        """
+        Profiles a dataset.
+
+        Args:
+            df (pandas.DataFrame): Dataset or batch of rows
+            hashes (numpy.ndarray, optional): Output of fingerprint.row_hashes(df), if already computed
+
+        Returns:
+            DatasetProfile: Profile of the rows
+        """
+        moments, distinct, top = {}, {}, {}
+        for column in df.columns:
+            series = df[column]
+            sketch = HyperLogLog()
+            sketch.add_series(series)
+            distinct[column] = sketch
+            if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+                moments[column] = Moments.from_series(series)
+            else:
+                top[column] = TopK.from_series(series)
+        return cls(
+            rows=len(df),
+            dtypes={str(c): str(t) for c, t in df.dtypes.items()},
+            moments=moments,
+            distinct=distinct,
+            top=top,
+            rows_digest=_digest(row_hashes(df) if hashes is None else hashes),
+        )
+
+    def merge(self, other, rows_digest):
+        """
+        Combines this profile with the profile of rows appended to the dataset.
+
+        Args:
+            other (DatasetProfile): Profile of the appended rows
+            rows_digest (str): Digest of the row hashes of the combined dataset
+
+        Returns:
+            DatasetProfile: Profile of the combined dataset, with the schema of the appended rows
+        """
+        merged = lambda mine, theirs: {
+            c: mine[c].merge(theirs[c]) if c in mine else theirs[c] for c in theirs
+        }
+        return DatasetProfile(
+            rows=self.rows + other.rows,
+            dtypes=other.dtypes,
+            moments=merged(self.moments, other.moments),
+            distinct=merged(self.distinct, other.distinct),
+            top=merged(self.top, other.top),
+            rows_digest=rows_digest,
+        )
+
+    def summary(self):
+        """
+        Tabulates the profile.
+
+        Returns:
+            pandas.DataFrame: One row per column with its type, non-null count, missing count,
+                estimated distinct count and, for numeric columns, mean, std, min and max
+        """
+        rows = []
+        for column, dtype in self.dtypes.items():
+            moments = self.moments.get(column)
+            row = {"column": column, "dtype": dtype, "distinct": self.distinct[column].count()}
+            if moments is not None:
+                row.update(count=moments.count, missing=moments.missing, mean=moments.mean,
+                           std=moments.std, min=moments.minimum, max=moments.maximum)
+            else:
+                kept = self.top[column]
+                row.update(top_value=kept.most_common(1)[0][0] if kept.counts else None)
+            rows.append(row)
+        return pd.DataFrame(rows).set_index("column")
+
+
+def is_schema_compatible(previous, df):
+    """
+    Checks whether a dataset has the columns of a previous version, in the same order, with
+    types that previous values convert to (e.g. integers that became floats after an append
+    with missing values).
+
+    Args:
+        previous (DatasetProfile): Profile of the previous version
+        df (pandas.DataFrame): New dataset
+
+    Returns:
+        bool: True if the new dataset can be an append to the previous version
+    """
+    if list(previous.dtypes) != [str(c) for c in df.columns]:
+        return False
+    for column, dtype in previous.dtypes.items():
+        new_dtype = str(df[column].dtype)
+        numeric = lambda t: t.startswith(("int", "uint", "float", "Int", "UInt", "Float"))
+        if new_dtype != dtype and not (numeric(dtype) and numeric(new_dtype)) and new_dtype != "object":
+            return False
+    return True
+
+
+def appended_rows(previous, df, hashes):
+    """
+    Checks whether a dataset is a previous version with rows added at the end.
+
+    Args:
+        previous (DatasetProfile): Profile of the previous version
+        df (pandas.DataFrame): New dataset
+        hashes (numpy.ndarray): Output of fingerprint.row_hashes(df)
+
+    Returns:
+        int or None: Number of rows of the previous version, or None if df is not an append
+    """
+    n = previous.rows
+    if len(df) <= n or not is_schema_compatible(previous, df):
+        return None
+    if _digest(hashes[:n]) == previous.rows_digest:
+        return n
+    # Appending can widen a column type, so compare the old rows in their original types
+    try:
+        prefix = df.iloc[:n].astype(previous.dtypes)
+    except (TypeError, ValueError):
+        return None
+    return n if _digest(row_hashes(prefix)) == previous.rows_digest else None
+
+
+def profile_changes(previous, current, k=10):
+    """
+    Compares two profiles of a dataset.
+
+    Args:
+        previous (DatasetProfile): Profile of the earlier version
+        current (DatasetProfile): Profile of the new version
+        k (int): Number of columns returned, largest relative change of the mean first
+
+    Returns:
+        pandas.DataFrame: Per column the mean, distinct count and most frequent value
+            before and after, and the relative change of the mean in percent
+    """
+    rows = []
+    for column in current.dtypes:
+        row = {"column": column}
+        if column in current.moments:
+            before = previous.moments.get(column)
+            after = current.moments[column]
+            row.update(mean_before=before.mean if before else None, mean_after=after.mean)
+            if before and before.mean:
+                row["mean_change_pct"] = 100 * (after.mean - before.mean) / abs(before.mean)
+        row["distinct_before"] = previous.distinct[column].count() if column in previous.distinct else None
+        row["distinct_after"] = current.distinct[column].count()
+        if column in current.top:
+            top_before = previous.top.get(column)
+            row["top_before"] = top_before.most_common(1)[0][0] if top_before and top_before.counts else None
+            row["top_after"] = current.top[column].most_common(1)[0][0] if current.top[column].counts else None
+        rows.append(row)
+    table = pd.DataFrame(rows).set_index("column")
+    if "mean_change_pct" in table:
+        table = table.reindex(table["mean_change_pct"].abs().sort_values(ascending=False, na_position="last").index)
+    return table.head(k)
+
+
+class VersionStore:
+    """
+    Remembers the versions of each dataset name with their profiles and analyses, so a
+    re-upload that only appends rows is detected and analysed incrementally.
+
+    Versions are stored in one directory per dataset name:
+        index.json          Versions, newest last
+        <hash>.profile      Pickled DatasetProfile
+        <hash>.json         Report, context and charts generated for the version
+
+    Args:
+        directory (str): Root directory of the store
+
+    Example:
+        >>> store = VersionStore()
+        >>> version = store.register("sales", df)
+        >>> version["kind"], version["delta_rows"]
+        ('append', 100000)
+    """
+
+    def __init__(self, directory=VERSIONS_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+
+    def _lineage_dir(self, name):
+        return os.path.join(self.directory, text_hash(name)[:16])
+
+    def _read_index(self, name):
+        path = os.path.join(self._lineage_dir(name), "index.json")
+        if not os.path.exists(path):
+            return []
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)["versions"]
+
+    def _write_json(self, path, value):
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(value, f, default=str)
+        os.replace(path + ".tmp", path)
+
+    def versions(self, name):
+        """
+        Lists the stored versions of a dataset.
+
+        Args:
+            name (str): Dataset name, e.g. the uploaded file name
+
+        Returns:
+            list: Version dictionaries with data_hash, rows, created and parent, oldest first
+        """
+        with self._lock:
+            return self._read_index(name)
+
+    def load_profile(self, name, data_hash):
+        path = os.path.join(self._lineage_dir(name), f"{data_hash}.profile")
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    @traced("versioning.register")
+    def register(self, name, df):
+        """
+        Records a dataset version and works out how it relates to the previous one.
+
+        Args:
+            name (str): Dataset name, e.g. the uploaded file name
+            df (pandas.DataFrame): The dataset
+
+        Returns:
+            dict: name, kind ('new', 'same' or 'append'), data_hash, previous_hash, delta_rows
+                (number of appended rows), profile and previous_profile
+        """
+        hashes = row_hashes(df)
+        data_hash = dataset_hash(df, hashes)
+        latest = (self.versions(name) or [None])[-1]
+        previous = self.load_profile(name, latest["data_hash"]) if latest else None
+        result = {
+            "name": name,
+            "kind": "new",
+            "data_hash": data_hash,
+            "previous_hash": latest["data_hash"] if latest else None,
+            "delta_rows": 0,
+            "previous_profile": previous,
+        }
+        if previous is not None and latest["data_hash"] == data_hash:
+            result.update(kind="same", profile=previous, previous_hash=None, previous_profile=None)
+            return result
+        start = appended_rows(previous, df, hashes) if previous is not None else None
+        if start is not None:
+            delta = DatasetProfile.from_frame(df.iloc[start:], hashes[start:])
+            result.update(kind="append", delta_rows=len(df) - start, profile=previous.merge(delta, _digest(hashes)))
+        else:
+            result["profile"] = DatasetProfile.from_frame(df, hashes)
+        self._save_version(name, data_hash, result["profile"], result["previous_hash"])
+        return result
+
+    def _save_version(self, name, data_hash, profile, parent):
+        directory = self._lineage_dir(name)
+        with self._lock:
+            os.makedirs(directory, exist_ok=True)
+            with open(os.path.join(directory, f"{data_hash}.profile.tmp"), "wb") as f:
+                pickle.dump(profile, f)
+            os.replace(os.path.join(directory, f"{data_hash}.profile.tmp"), os.path.join(directory, f"{data_hash}.profile"))
+            versions = [v for v in self._read_index(name) if v["data_hash"] != data_hash]
+            versions.append({"data_hash": data_hash, "rows": profile.rows, "created": time.time(), "parent": parent})
+            for old in versions[:-MAX_VERSIONS]:
+                for suffix in (".profile", ".json"):
+                    path = os.path.join(directory, old["data_hash"] + suffix)
+                    if os.path.exists(path):
+                        os.remove(path)
+            self._write_json(os.path.join(directory, "index.json"), {"name": name, "versions": versions[-MAX_VERSIONS:]})
+
+    def save_analysis(self, name, data_hash, **analysis):
+        """
+        Stores what was generated for a version, such as report, context and plot.
+
+        Args:
+            name (str): Dataset name
+            data_hash (str): Hash of the version
+            **analysis: JSON-serializable values
+        """
+        directory = self._lineage_dir(name)
+        with self._lock:
+            os.makedirs(directory, exist_ok=True)
+            self._write_json(os.path.join(directory, f"{data_hash}.json"), analysis)
+
+    def load_analysis(self, name, data_hash):
+        """
+        Returns what was generated for a version.
+
+        Args:
+            name (str): Dataset name
+            data_hash (str): Hash of the version
+
+        Returns:
+            dict or None: The values passed to save_analysis, or None if there are none
+        """
+        path = os.path.join(self._lineage_dir(name), f"{data_hash}.json")
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+
+def get_store():
+    """
+    Returns the store shared by every session of the app.
+
+    Returns:
+        VersionStore: Store in VERSIONS_DIR
+    """
+    global _default_store
+    if _default_store is None:
+        _default_store = VersionStore()
+    return _default_store
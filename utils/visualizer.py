@@ -1,15 +1,13 @@
 import json
 import re
-import google.generativeai as genai 
 import pandas as pd 
-import os
-# Configure Gemini AI with API key from environment variables
-genai.configure(
-    api_key=os.getenv("GEMINI_API")
-)
-
-# Initialize model with visualization-specific instructions
-model = genai.GenerativeModel("gemini-2.0-flash", system_instruction="You are a data analysis assistant. You will help users visualize their datasets.")
+from utils.chart_recommender import recommend_charts
+from utils import reshape
+from utils.llm import generate, token_budget
+from utils.prompt_budget import column_types, sample_table
+from utils.tracing import traced
+# System instruction of the Gemini model used for visualization suggestions
+SYSTEM_INSTRUCTION = "You are a data analysis assistant. You will help users visualize their datasets."
 
 def detect_format(df):
     """
@@ -22,9 +20,8 @@ def detect_format(df):
         str or None: Returns 'Wide' if the DataFrame is in wide format, None otherwise
         
     Notes:
-        - Checks for unique values in columns
-        - Identifies potential ID columns
-        - Looks for year-like columns (starting with 19xx or 20xx)
+        - Looks for at least three year-like columns (19xx or 20xx) or numbered columns
+        - reshape.detect_wide_layout returns which columns are ids and which hold values
         
     Example:
         >>> data = pd.read_csv('sales_by_year.csv')
@@ -32,23 +29,18 @@ def detect_format(df):
         >>> print(format_type)
         'Wide'
     """
-    num_unique_cols = df.nunique()
-    likely_id_cols = num_unique_cols[num_unique_cols > 1].index.tolist()
-
-    wide_likelihood = any(
-        col.strip().isdigit() or str(col).lower().startswith(("20", "19"))
-        for col in df.columns
-    )
-    if wide_likelihood:
+    if reshape.detect_wide_layout(df) is not None:
         return "Wide"
 
 
-def generate_visualizations(data):
+@traced("visualizer.generate_visualizations")
+def generate_visualizations(data, refine=False):
     """
     Generates visualization recommendations based on dataset characteristics.
     
     Args:
         data (pandas.DataFrame): Dataset to analyze for visualization opportunities
+        refine (bool): If True, Gemini re-ranks and explains the local recommendations
         
     Returns:
         list: List of dictionaries containing visualization recommendations:
@@ -74,68 +66,143 @@ def generate_visualizations(data):
                 "chart_type": "bar",
                 "x_column": "category",
                 "y_column": "sales",
-                "reason": "Shows sales distribution across categories"
+                "reason": "Compares sales across the 4 category categories.",
+                "score": 0.83
             },
             ...
         ]
     
+    Notes:
+        - Recommendations come from the rule-based recommender and need no model call
+        - Wide datasets get charts of their long format marked with "reshape": "long";
+          renderers build the data these charts need with reshape.chart_frame
+        - The model is only consulted when refine is True, or when no rule matches
+        - Falls back to the local recommendations if the model is slow, offline or returns invalid JSON
+    """
+    content = pd.DataFrame(data)
+    layout = reshape.detect_wide_layout(content)
+    if layout is not None:
+        recommendations = reshape.wide_recommendations(content, layout)
+    else:
+        recommendations = recommend_charts(content)
+    if recommendations and not refine:
+        return recommendations
+    try:
+        if recommendations:
+            return refine_visualizations(content, recommendations)
+        return suggest_visualizations(content)
+    except Exception as e:
+        print("Visualization model error:", e)
+        return recommendations
+
+
+def parse_chart_json(text):
+    """
+    Extracts a list of chart specifications from a model response.
+
+    Args:
+        text (str): Raw model response containing a JSON array
+
+    Returns:
+        list: Parsed chart specifications, or an empty list if none could be parsed
+    """
+    try:
+        json_block = re.search(r"\[\s*{.*}\s*\]", text.strip(), re.DOTALL)
+        if json_block:
+            return json.loads(json_block.group())
+        else:
+            return []
+    except json.JSONDecodeError as e:
+        print("JSON Error:", e)
+        return []
+
+
+@traced("visualizer.refine_visualizations")
+def refine_visualizations(data, recommendations):
+    """
+    Asks Gemini to re-rank and explain locally recommended charts.
+
+    Args:
+        data (pandas.DataFrame): Dataset the recommendations were made for
+        recommendations (list): Output of chart_recommender.recommend_charts
+
+    Returns:
+        list: The recommendations in the order chosen by the model, with its reasons.
+            Suggestions referring to unknown charts or columns are discarded, and the
+            local recommendations are returned unchanged if nothing valid remains.
+    """
+    content = pd.DataFrame(data)
+    budget = token_budget("charts.refine")
+    prompt = f"""
+    You are a data analyst. A rule-based recommender proposed these charts for a dataset
+    with column types {column_types(content, budget // 4)} and sample rows:
+
+    {sample_table(content, budget // 4, max_rows=5)}
+
+    Candidate charts:
+    {json.dumps(recommendations, indent=2, default=str)}
+
+    Re-rank the candidate charts from most to least useful and rewrite each "reason" so it
+    explains what insight the chart would reveal for this particular dataset. Do not invent new
+    charts or columns; drop a candidate only if it is meaningless for this data.
+
+    Respond in **pure JSON** with the same keys as the candidates.
+    """
+    candidates = {(c["chart_type"], c["x_column"], c["y_column"]): c for c in recommendations}
+    known = lambda text: any(
+        (chart.get("chart_type"), chart.get("x_column"), chart.get("y_column")) in candidates
+        for chart in parse_chart_json(text)
+    )
+    model_response = generate(SYSTEM_INSTRUCTION, prompt, task="charts.refine", validate=known)
+    refined = []
+    for chart in parse_chart_json(model_response.text):
+        key = (chart.get("chart_type"), chart.get("x_column"), chart.get("y_column"))
+        if key in candidates:
+            local = candidates.pop(key)
+            refined.append({**local, "reason": chart.get("reason") or local["reason"]})
+    return refined or recommendations
+
+
+@traced("visualizer.suggest_visualizations")
+def suggest_visualizations(data):
+    """
+    Asks Gemini to suggest charts from scratch when no local rule matches the dataset.
+
+    Args:
+        data (pandas.DataFrame): Dataset to analyze for visualization opportunities
+
+    Returns:
+        list: Chart specifications in the same format as generate_visualizations
+
     Notes:
         - Handles both wide and long format data
-        - Automatically reshapes wide format data using pd.melt()
+        - Wide data is described by its id and value columns and a melted sample of rows;
+          suggestions on the long-format columns are marked with "reshape": "long"
         - Returns empty list if JSON parsing fails
-        - Uses Gemini AI for intelligent chart recommendations
+        - The prompt is compressed to token_budget("charts.suggest"); a response naming unknown
+          columns is retried with a larger model
     """
     content = pd.DataFrame(data)
-    if detect_format(content) == "Wide":
-        content = pd.melt(content)
-        prompt = f"""
-        You are a data analyst. Based on the following dataframe (summarized):
-
-        {content}
-
-        Suggest 2-3 useful visualizations to explore this data.
-        For each suggestion, include:
-        - chart_type (e.g., bar, pie, line, scatter)
-        - x_column
-        - y_column (if applicable)
-        - Explain briefly what insight each visualization would reveal
-        - Recommend Charts Based on Patterns:
-            - Bar charts for categorical comparisons
-            - Line charts for time-based trends
-            - Scatter plots for correlations
-            - Pie/donut charts for proportions
-            - Histograms for distribution
-            - Map visualizations for geographical data
-        
-
-        Respond in **pure JSON** like:
-        [
-        {{
-            "chart_type": "bar",
-            "x_column": "category",
-            "y_column": "sales",
-            "reason": "Shows sales per category."
-        }},
-        ...
-        ]
-        """
-        model_response = model.generate_content(
-            contents=prompt 
+    budget = token_budget("charts.suggest")
+    layout = reshape.detect_wide_layout(content)
+    if layout is not None:
+        summary = (
+            f"Wide-format data with id columns {layout.id_columns} and {len(layout.value_columns)} value columns "
+            f"({layout.value_columns[0]} to {layout.value_columns[-1]}). Refer to the long format, "
+            f"with columns {layout.id_columns + [layout.variable_name, layout.value_name]}, sampled here:\n\n"
+            f"{sample_table(reshape.long_sample(content, layout), budget // 2)}"
         )
-        try:
-            json_block = re.search(r"\[\s*{.*}\s*\]", model_response.text.strip(), re.DOTALL)
-            if json_block:
-                return json.loads(json_block.group())
-            else:
-                return []
-        except json.JSONDecodeError as e:
-            print("JSON Error:", e)
-            return []
+        columns = set(content.columns) | {layout.variable_name, layout.value_name}
     else:
-        prompt = f"""
+        summary = (
+            f"{content.shape[0]:,} rows x {content.shape[1]} columns with column types "
+            f"{column_types(content, budget // 4)} and sample rows:\n\n{sample_table(content, budget // 2)}"
+        )
+        columns = set(content.columns)
+    prompt = f"""
     You are a data analyst. Based on the following dataframe (summarized):
 
-    {content}
+    {summary}
 
     Suggest 2-3 useful visualizations to explore this data.
     For each suggestion, include:
@@ -166,18 +233,16 @@ def generate_visualizations(data):
     ]
 
     """
-    model_response = model.generate_content(
-        contents=prompt 
+    # A suggestion is usable if every chart refers to existing columns
+    valid = lambda text: parse_chart_json(text) and all(
+        chart.get("x_column") in columns and chart.get("y_column", chart.get("x_column")) in columns | {None}
+        for chart in parse_chart_json(text)
     )
-    try:
-        json_block = re.search(r"\[\s*{.*}\s*\]", model_response.text.strip(), re.DOTALL)
-        if json_block:
-            return json.loads(json_block.group())
-        else:
-            return []
-    except json.JSONDecodeError as e:
-        print("JSON Error:", e)
-        return []
-
-        
-    
+    model_response = generate(SYSTEM_INSTRUCTION, prompt, task="charts.suggest", validate=valid)
+    charts = parse_chart_json(model_response.text)
+    if layout is not None:
+        long_columns = {layout.variable_name, layout.value_name}
+        for chart in charts:
+            if {chart.get("x_column"), chart.get("y_column")} & long_columns:
+                chart["reshape"] = "long"
+    return charts